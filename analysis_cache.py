@@ -0,0 +1,152 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(message):
+    """Lowercase, drop punctuation and collapse whitespace ("Any hazards?" == "any hazards")"""
+    return _WHITESPACE.sub(' ', _PUNCTUATION.sub('', (message or '').lower())).strip()
+
+
+def context_digest(messages, summary=''):
+    """Digest of the conversation before this turn ('' when there is none)
+
+    messages are (role, content) pairs; timestamps are left out so equal
+    conversations share a digest.
+    """
+    if not messages and not summary:
+        return ''
+    digest = hashlib.sha256(summary.encode('utf-8'))
+    for role, content in messages:
+        digest.update(f"\x1e{role}\x1f{content}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def make_key(file_hashes, file_type, message, system_prompt, context=''):
+    """Cache key from file content, file type, normalized message, prompt version
+    and the context_digest() of the conversation so far"""
+    prompt_version = hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()[:16]
+    parts = [','.join(file_hashes), file_type or '', normalize_prompt(message), prompt_version]
+    if context:
+        # A follow-up ("what about the left side?") depends on what came before it
+        parts.append(context)
+    material = '\x1f'.join(parts)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class AnalysisCache:
+    """Model response cache with TTL + LRU in memory and an optional SQLite tier
+
+    The disk tier is shared by all workers on the host and survives
+    restarts; memory hits avoid touching it at all.
+    """
+
+    def __init__(self, max_entries=1000, ttl=86400, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'expired': 0, 'evicted': 0}
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection().executescript("""
+                CREATE TABLE IF NOT EXISTS analysis_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_analysis_cache_created ON analysis_cache (created);
+            """)
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _expired(self, created, now):
+        return self.ttl > 0 and now - created > self.ttl
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[1], now):
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return entry[0]
+                del self._entries[key]
+                self._counters['expired'] += 1
+
+        if self.path:
+            row = self._connection().execute(
+                'SELECT response, created FROM analysis_cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None and not self._expired(row[1], now):
+                self._remember(key, row[0], row[1])
+                with self._lock:
+                    self._counters['disk_hits'] += 1
+                return row[0]
+
+        with self._lock:
+            self._counters['misses'] += 1
+        return None
+
+    def put(self, key, response):
+        if not self.enabled:
+            return
+        created = time.time()
+        self._remember(key, response, created)
+        if self.path:
+            conn = self._connection()
+            conn.execute(
+                'INSERT OR REPLACE INTO analysis_cache (key, response, created) VALUES (?, ?, ?)',
+                (key, response, created)
+            )
+            if self.ttl > 0:
+                conn.execute('DELETE FROM analysis_cache WHERE created < ?', (created - self.ttl,))
+        with self._lock:
+            self._counters['stores'] += 1
+
+    def _remember(self, key, response, created):
+        with self._lock:
+            self._entries[key] = (response, created)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evicted'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+            stats.update({
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'disk_tier': bool(self.path),
+                'hit_ratio': round((stats['hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0,
+            })
+            return stats
@@ -1,20 +1,40 @@
 import os
-import base64
 import time
 import json
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context, send_file, abort
 from flask_cors import CORS
 from dotenv import load_dotenv
+from session_store import FileRecord, FeedbackEntry, SessionConflictError
+from session_backends import create_session_store
+from model_client import ResilientModelClient, CircuitBreaker, ModelBusyError, ModelUnavailableError
+from fake_model import FakeGenerativeModel
+from upload_store import UploadStore, mime_type_for, file_type_for
+from image_processing import ImageNormalizer
+from audio_processing import AudioNormalizer
+from pdf_export import build_pdf, PdfExportJobs
+from conversation_context import ContextBuilder, estimate_tokens, part_tokens
+import upload_ingest
+import analysis_cache as analysis_cache_keys
+from analysis_cache import AnalysisCache
+from batch import BatchManager, results_csv
+from ticket_store import TicketStore, SEVERITIES
+from feedback_store import FeedbackStore, session_feedback_csv
+from near_duplicates import NearDuplicateIndex, dhash
+from tiling import TiledAnalyzer, NOTHING_FOUND
+from janitor import Janitor
+import metrics
+import tracing
+from profiling import RequestProfiler
+from quick_replies import AcknowledgmentResponder, DEFAULT_REPLIES, offer_answer
+import text_classifier
 from PIL import Image
 from io import BytesIO
 from gen_ai_hub.proxy.native.google_vertexai.clients import GenerativeModel
 from gen_ai_hub.proxy.core.proxy_clients import get_proxy_client
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.units import inch
-import html
+import hmac
+import re
+import zipfile
 
 # Load environment variables
 load_dotenv()
@@ -22,6 +42,23 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 CORS(app)
+metrics.instrument(app)
+
+# Every request gets an X-Request-ID and a Server-Timing header with its stage
+# spans. TRACE_EXPORT_PATH appends each trace as an OTLP/JSON line; requests
+# are profiled when armed through /admin/profile (needs ADMIN_TOKEN).
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+trace_exporter = None
+if os.getenv('TRACE_EXPORT_PATH'):
+    trace_exporter = tracing.TraceExporter(
+        os.getenv('TRACE_EXPORT_PATH'),
+        sample_rate=float(os.getenv('TRACE_SAMPLE_RATE', '1.0'))
+    )
+request_profiler = RequestProfiler(
+    os.getenv('PROFILE_FOLDER', os.path.join('data', 'profiles')),
+    sample_interval=float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5')) / 1000
+)
+tracing.instrument(app, trace_exporter, request_profiler)
 
 # Configure upload folder
 UPLOAD_FOLDER = 'uploads'
@@ -36,8 +73,13 @@ AICORE_CLIENT_SECRET = os.getenv('AICORE_CLIENT_SECRET')
 AICORE_BASE_URL = os.getenv('AICORE_BASE_URL')
 AICORE_RESOURCE_GROUP = os.getenv('AICORE_RESOURCE_GROUP')
 
+# 'fake' swaps in a local model with configurable latency/errors (FAKE_MODEL_*) for benchmarks
+MODEL_BACKEND = os.getenv('MODEL_BACKEND', 'gen-ai-hub')
+
 # Load model
 def load_model():
+    if MODEL_BACKEND == 'fake':
+        return FakeGenerativeModel.from_env()
     try:
         proxy_client = get_proxy_client("gen-ai-hub")
         return GenerativeModel(
@@ -49,10 +91,171 @@ def load_model():
         print(f"Model loading error: {e}")
         return None
 
-model = load_model()
+# Created on first use in each worker (after fork); concurrent calls are bounded
+# independently of the worker/thread count, transient errors retried and
+# repeated failures short-circuited
+model = ResilientModelClient(
+    load_model,
+    max_in_flight=int(os.getenv('MODEL_MAX_IN_FLIGHT', '64')),
+    acquire_timeout=float(os.getenv('MODEL_QUEUE_TIMEOUT', '30')),
+    retries=int(os.getenv('MODEL_RETRIES', '2')),
+    backoff_base=float(os.getenv('MODEL_RETRY_BACKOFF', '0.5')),
+    backoff_max=float(os.getenv('MODEL_RETRY_BACKOFF_MAX', '8')),
+    hedge_after=float(os.getenv('MODEL_HEDGE_AFTER', '0')),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv('MODEL_BREAKER_THRESHOLD', '5')),
+        reset_timeout=float(os.getenv('MODEL_BREAKER_RESET', '30'))
+    ),
+    on_call=metrics.observe_model_call,
+    on_error=metrics.count_model_error
+)
+
+# Session storage (memory, sqlite or redis - see SESSION_BACKEND)
+sessions = create_session_store()
+
+# Preprocessing applied to the copy the model receives (originals are kept)
+upload_transforms = {}
+if os.getenv('IMAGE_NORMALIZE', '1') == '1':
+    upload_transforms['image'] = ImageNormalizer(
+        max_edge=int(os.getenv('IMAGE_MAX_EDGE', '1568')),
+        image_format=os.getenv('IMAGE_FORMAT', 'JPEG'),
+        quality=int(os.getenv('IMAGE_QUALITY', '85'))
+    )
+if os.getenv('AUDIO_NORMALIZE', '1') == '1':
+    upload_transforms['audio'] = AudioNormalizer(
+        sample_rate=int(os.getenv('AUDIO_SAMPLE_RATE', '16000')),
+        trim_silence=os.getenv('AUDIO_TRIM_SILENCE', '1') == '1',
+        silence_db=float(os.getenv('AUDIO_SILENCE_DB', '-45')),
+        max_seconds=float(os.getenv('AUDIO_MAX_SECONDS', '0'))
+    )
+
+# Content-addressed upload store with a cache of encoded model payloads
+upload_store = UploadStore(
+    UPLOAD_FOLDER,
+    cache_bytes=int(float(os.getenv('UPLOAD_CACHE_MB', '128')) * 1024 * 1024),
+    transforms=upload_transforms,
+    workers=int(os.getenv('UPLOAD_PREPARE_WORKERS', '4'))
+)
+
+def load_session(session_id, create=False):
+    """The session record (None if missing and not create), its uploads marked as in use
+
+    Every request bound to a session loads it here, so the janitor never
+    collects (or evicts for the quota) files of a session that is in use.
+    """
+    session_data = sessions.get_or_create(session_id) if create else sessions.get(session_id)
+    if session_data:
+        for file_record in session_data.files:
+            upload_store.touch(file_record, session_data.session_id)
+    return session_data
+
+def release_uploads(session_data):
+    """Let go of an expired or evicted session's uploads (deleted once no other session uses them)
+
+    Refs touched after the session's last interaction belong to a copy of
+    it that is still in use in another worker (memory backend) and are kept.
+    """
+    for file_record in session_data.files:
+        upload_store.release(file_record, session_data.session_id, unless_used_after=session_data.last_interaction)
+
+sessions.on_evict = release_uploads
+
+# Files a session can hold at once; all of them go to the model in one request,
+# with the inline payload budget split evenly between them
+SESSION_MAX_FILES = int(os.getenv('SESSION_MAX_FILES', '4'))
+MODEL_INLINE_BUDGET = int(float(os.getenv('MODEL_INLINE_BUDGET_MB', '18')) * 1024 * 1024)
+
+UPLOAD_MAX_IMAGE = int(float(os.getenv('UPLOAD_MAX_IMAGE_MB', '25')) * 1024 * 1024)
+UPLOAD_MAX_AUDIO = int(float(os.getenv('UPLOAD_MAX_AUDIO_MB', '50')) * 1024 * 1024)
+UPLOAD_MAX_OTHER = int(float(os.getenv('UPLOAD_MAX_OTHER_MB', '10')) * 1024 * 1024)
+
+# One /upload request may carry a full session of files; each is still held to its
+# per-type limit while it streams in
+UPLOAD_MAX_TOTAL = (
+    int(float(os.getenv('UPLOAD_MAX_TOTAL_MB', '0')) * 1024 * 1024)
+    or SESSION_MAX_FILES * max(UPLOAD_MAX_IMAGE, UPLOAD_MAX_AUDIO, UPLOAD_MAX_OTHER) + 1024 * 1024
+)
+
+# Uploads stream to disk in chunks (hashed and sniffed on the fly) with per-type size limits
+upload_ingest.configure(
+    app,
+    UPLOAD_FOLDER,
+    image_limit=UPLOAD_MAX_IMAGE,
+    audio_limit=UPLOAD_MAX_AUDIO,
+    other_limit=UPLOAD_MAX_OTHER,
+    archive_limit=int(float(os.getenv('BATCH_MAX_ZIP_MB', '500')) * 1024 * 1024),
+    body_limits=[
+        ('/batch', int(float(os.getenv('BATCH_MAX_MB', '500')) * 1024 * 1024)),
+        ('/upload', UPLOAD_MAX_TOTAL)
+    ]
+)
+
+@app.errorhandler(413)
+def upload_too_large(error):
+    return jsonify({
+        'success': False,
+        'error': getattr(error, 'description', None) or 'File too large'
+    }), 413
+
+SESSION_CONFLICT_MESSAGE = 'This session was changed by another request. Please try again.'
+
+@app.errorhandler(SessionConflictError)
+def session_conflict(error):
+    return jsonify({
+        'success': False,
+        'error': SESSION_CONFLICT_MESSAGE
+    }), 409
+
+# Cache of full analyses keyed by file content + normalized prompt
+analysis_cache = AnalysisCache(
+    max_entries=int(os.getenv('ANALYSIS_CACHE_SIZE', '1000')),
+    ttl=int(os.getenv('ANALYSIS_CACHE_TTL', '86400')),
+    path=os.getenv('ANALYSIS_CACHE_PATH') or None
+)
+
+# Perceptual hashes of analysed images: a re-photographed scene within NEAR_DUPLICATE_THRESHOLD
+# bits (of 64) of one analysed in the last NEAR_DUPLICATE_MAX_AGE seconds gets that analysis
+# offered (NEAR_DUPLICATE_MODE=offer) or reused without a model call (auto); off disables it
+NEAR_DUPLICATE_MODE = os.getenv('NEAR_DUPLICATE_MODE', 'offer')
+near_duplicates = None
+if NEAR_DUPLICATE_MODE in ('offer', 'auto'):
+    near_duplicates = NearDuplicateIndex(
+        os.getenv('NEAR_DUPLICATE_DB_PATH', os.path.join('data', 'near_duplicates.db')),
+        threshold=int(os.getenv('NEAR_DUPLICATE_THRESHOLD', '6')),
+        max_age=int(os.getenv('NEAR_DUPLICATE_MAX_AGE', '86400'))
+    )
+
+# Acknowledgments ("ok", "thanks", "no") after an analysis are answered locally.
+# ACK_LOCAL_CLASSES picks which reply classes skip the model; ACK_REPLY_<CLASS> overrides the text.
+ack_responder = None
+if os.getenv('ACK_FAST_PATH', '1') == '1':
+    ack_responder = AcknowledgmentResponder(
+        replies={c: os.getenv(f'ACK_REPLY_{c.upper()}') for c in DEFAULT_REPLIES if os.getenv(f'ACK_REPLY_{c.upper()}')},
+        local_classes=[c.strip() for c in os.getenv('ACK_LOCAL_CLASSES', ','.join(DEFAULT_REPLIES)).split(',') if c.strip()]
+    )
+
+# Conversation history packed to a token budget, older turns in a rolling summary.
+# CONTEXT_REATTACH=auto re-sends the file only when the question needs it.
+context_builder = ContextBuilder(
+    history_tokens=int(os.getenv('CONTEXT_HISTORY_TOKENS', '1500')),
+    summary_tokens=int(os.getenv('CONTEXT_SUMMARY_TOKENS', '400')),
+    reattach=os.getenv('CONTEXT_REATTACH', 'auto')
+)
 
-# Session storage
-sessions = {}
+# Quality inspection tickets, shared by all workers
+tickets = TicketStore(os.getenv('TICKET_DB_PATH', os.path.join('data', 'tickets.db')))
+
+# Feedback from every session, with aggregates kept up to date on each submission
+feedback_store = FeedbackStore(os.getenv('FEEDBACK_DB_PATH', os.path.join('data', 'feedback.db')))
+
+FILE_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+TICKET_ID_PATTERN = re.compile(r'^[0-9A-HJKMNP-TV-Z]{26}$')
+
+def file_preview(file_record):
+    """Metadata and preview URL for an uploaded file (served by /files/<id>)"""
+    preview = file_record.to_dict()
+    preview['url'] = f"/files/{file_record.sha256}"
+    return preview
 
 def get_system_prompt(file_type):
     """Generate system prompt based on file type"""
@@ -133,207 +336,317 @@ def init_session():
     data = request.json
     session_id = data.get('session_id')
     
-    if session_id not in sessions:
-        sessions[session_id] = {
-            'messages': [],
-            'files': [],
-            'ticket_counter': 0,
-            'feedback': [],
-            'ticket_created': False,
-            'last_interaction': time.time(),
-            'feedback_submitted': False,
-            'ticket_button_clicked': False,
-            'last_analysis': None,
-            'awaiting_followup': False
-        }
+    session_data = load_session(session_id, create=True)
     
     return jsonify({
         'success': True,
-        'files': sessions[session_id]['files'],
-        'ticket_counter': sessions[session_id]['ticket_counter'],
-        'ticket_created': sessions[session_id]['ticket_created'],
-        'feedback_submitted': sessions[session_id]['feedback_submitted'],
-        'ticket_button_clicked': sessions[session_id].get('ticket_button_clicked', False)
+        'files': [file_preview(f) for f in session_data.files],
+        'ticket_counter': session_data.ticket_counter,
+        'ticket_created': session_data.ticket_created,
+        'feedback_submitted': session_data.feedback_submitted,
+        'ticket_button_clicked': session_data.ticket_button_clicked
     })
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
+    """Upload up to SESSION_MAX_FILES files
+
+    The upload replaces the session's files, or with append=1 is added to
+    them (the oldest are dropped beyond SESSION_MAX_FILES). The response
+    lists all of the session's files.
+    """
     session_id = request.form.get('session_id')
+    files = [f for f in request.files.getlist('files') if f and f.filename]
+    if len(files) > SESSION_MAX_FILES:
+        return jsonify({
+            'success': False,
+            'error': f"Up to {SESSION_MAX_FILES} files can be uploaded at once"
+        }), 400
     
-    if session_id not in sessions:
-        sessions[session_id] = {
-            'messages': [],
-            'files': [],
-            'ticket_counter': 0,
-            'feedback': [],
-            'ticket_created': False,
-            'last_interaction': time.time(),
-            'feedback_submitted': False,
-            'ticket_button_clicked': False,
-            'last_analysis': None,
-            'awaiting_followup': False
-        }
+    session_data = load_session(session_id, create=True)
     
-    # Clear existing files (only one file at a time)
-    for file_info in sessions[session_id]['files']:
-        filename = file_info['filename'] if isinstance(file_info, dict) else file_info
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        try:
-            if os.path.exists(filepath):
-                os.remove(filepath)
-        except Exception as e:
-            print(f"Error deleting file {filename}: {e}")
-    
-    sessions[session_id]['files'] = []
+    previous = session_data.files
+    kept = previous if request.form.get('append') == '1' else []
     
     # IMPORTANT: Reset ticket button state when new file is uploaded
-    sessions[session_id]['ticket_button_clicked'] = False
-    sessions[session_id]['ticket_created'] = False
-    sessions[session_id]['last_analysis'] = None
-    sessions[session_id]['awaiting_followup'] = False
+    session_data.ticket_button_clicked = False
+    session_data.ticket_created = False
+    session_data.last_analysis = None
+    session_data.awaiting_followup = False
+    session_data.near_duplicate_offered = ''
     
-    uploaded_files = []
-    files = request.files.getlist('files')
-    
-    # Only process the first file (single file upload)
-    if files and files[0]:
-        file = files[0]
+    new_records = []
+    for file in files:
         filename = f"{int(time.time())}_{file.filename}"
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
-        
-        # Read file and encode as base64 for preview
-        with open(filepath, 'rb') as f:
-            file_data = f.read()
-            base64_data = base64.b64encode(file_data).decode('utf-8')
         
-        # Determine MIME type for images
-        if filename.lower().endswith('.png'):
-            mime_type = 'image/png'
-        elif filename.lower().endswith(('.jpg', '.jpeg')):
-            mime_type = 'image/jpeg'
-        elif filename.lower().endswith('.gif'):
-            mime_type = 'image/gif'
-        elif filename.lower().endswith('.bmp'):
-            mime_type = 'image/bmp'
-        elif filename.lower().endswith('.webp'):
-            mime_type = 'image/webp'
-        # Audio file MIME types
-        elif filename.lower().endswith('.wav'):
-            mime_type = 'audio/wav'
-        elif filename.lower().endswith('.mp3'):
-            mime_type = 'audio/mp3'
-        elif filename.lower().endswith('.aiff'):
-            mime_type = 'audio/aiff'
-        elif filename.lower().endswith('.aac'):
-            mime_type = 'audio/aac'
-        elif filename.lower().endswith('.ogg'):
-            mime_type = 'audio/ogg'
-        elif filename.lower().endswith('.flac'):
-            mime_type = 'audio/flac'
-        else:
-            mime_type = 'application/octet-stream'
-        
-        sessions[session_id]['files'].append({
-            'filename': filename,
-            'base64': base64_data,
-            'mime_type': mime_type
-        })
-        
-        uploaded_files.append({
-            'filename': filename,
-            'base64': base64_data,
-            'mime_type': mime_type
-        })
+        # Already hashed while streaming; moved into the store without a re-read
+        with metrics.stage('upload_save'):
+            sha256, size, sniffed_mime_type = upload_ingest.save_upload(upload_store, file, filename, session_id)
+        if any(r.sha256 == sha256 for r in kept + new_records):
+            continue
+        new_records.append(FileRecord(
+            filename=filename,
+            mime_type=sniffed_mime_type or mime_type_for(filename),
+            sha256=sha256,
+            size=size
+        ))
+    
+    session_data.files = (kept + new_records)[-SESSION_MAX_FILES:]
+    
+    # Release files no longer in the session (deleted once no other session uses them)
+    current = {r.sha256 for r in session_data.files}
+    for file_info in previous:
+        if file_info.sha256 in current:
+            continue
+        try:
+            upload_store.release(file_info, session_id)
+        except Exception as e:
+            print(f"Error deleting file {file_info.filename}: {e}")
+    
+    # Decode, normalize and encode the new files concurrently, reporting what preprocessing saved
+    with metrics.stage('preprocess'):
+        infos = upload_store.prepare_many(new_records)
+    prepared = {r.sha256: info for r, info in zip(new_records, infos)}
+    
+    # Perceptual hash of the model variant (already downscaled and upright)
+    if near_duplicates:
+        with metrics.stage('perceptual_hash'):
+            for file_record in new_records:
+                if file_type_for(file_record.filename) == 'image':
+                    try:
+                        file_record.phash = f"{dhash(upload_store.prepare(file_record)[0]):016x}"
+                    except Exception as e:
+                        print(f"Perceptual hash error for {file_record.filename}: {e}")
+    
+    previews = []
+    for file_record in session_data.files:
+        preview = file_preview(file_record)
+        info = prepared.get(file_record.sha256)
+        if info:
+            preview['model_bytes'] = info['model_bytes']
+            preview['bytes_saved'] = info['bytes_saved']
+        previews.append(preview)
     
     # Update last interaction time
-    sessions[session_id]['last_interaction'] = time.time()
+    session_data.touch()
+    sessions.save(session_data)
     
     return jsonify({
         'success': True,
-        'files': uploaded_files,
-        'ticket_button_clicked': sessions[session_id]['ticket_button_clicked'],
-        'ticket_created': sessions[session_id]['ticket_created']
+        'files': previews,
+        'max_files': SESSION_MAX_FILES,
+        'ticket_button_clicked': session_data.ticket_button_clicked,
+        'ticket_created': session_data.ticket_created
     })
 
-@app.route('/chat', methods=['POST'])
-def chat():
-    data = request.json
+@app.route('/files/<file_id>', methods=['DELETE'])
+def remove_file(file_id):
+    """Remove one file from the session's set"""
+    data = request.json or {}
     session_id = data.get('session_id')
-    message = data.get('message')
-    is_voice_input = data.get('is_voice_input', False)
     
-    if session_id not in sessions:
-        sessions[session_id] = {
-            'messages': [],
-            'files': [],
-            'ticket_counter': 0,
-            'feedback': [],
-            'ticket_created': False,
-            'last_interaction': time.time(),
-            'feedback_submitted': False,
-            'ticket_button_clicked': False,
-            'last_analysis': None,
-            'awaiting_followup': False
-        }
+    session_data = load_session(session_id)
+    if not session_data:
+        abort(404)
     
-    # Update last interaction time
-    sessions[session_id]['last_interaction'] = time.time()
+    removed = [f for f in session_data.files if f.sha256 == file_id]
+    if not removed:
+        abort(404)
+    session_data.files = [f for f in session_data.files if f.sha256 != file_id]
+    for file_info in removed:
+        try:
+            upload_store.release(file_info, session_id)
+        except Exception as e:
+            print(f"Error deleting file {file_info.filename}: {e}")
     
+    session_data.ticket_button_clicked = False
+    session_data.ticket_created = False
+    session_data.last_analysis = None
+    session_data.awaiting_followup = False
+    session_data.near_duplicate_offered = ''
+    session_data.touch()
+    sessions.save(session_data)
+    
+    return jsonify({
+        'success': True,
+        'files': [file_preview(f) for f in session_data.files]
+    })
+
+# What the near-duplicate buttons record as the user's turn
+NEAR_DUPLICATE_CHOICES = {'reuse': 'Reuse previous analysis', 'fresh': 'Analyze fresh'}
+
+def near_duplicate_offer_pending(session_data):
+    """Whether the last reply offered a near-duplicate's analysis of the session's image"""
+    return (
+        bool(session_data.near_duplicate_offered) and not session_data.last_analysis and
+        len(session_data.files) == 1 and session_data.files[0].sha256 == session_data.near_duplicate_offered
+    )
+
+def is_acknowledgment_turn(session_data, message):
+    """Whether the message only acknowledges the last reply
+
+    A typed answer to a near-duplicate offer ("no", "ok") is a request for
+    an analysis, not an acknowledgment.
+    """
+    return not near_duplicate_offer_pending(session_data) and text_classifier.is_acknowledgment(message)
+
+def near_duplicate_image(session_data, message):
+    """The session's image when this turn could reuse a near-duplicate's analysis, else None
+
+    Only the first analysis of a single uploaded image qualifies; follow-up
+    questions are about this image and go to the model.
+    """
+    if not near_duplicates or session_data.last_analysis or len(session_data.files) != 1:
+        return None
+    file_record = session_data.files[0]
+    if not file_record.phash or is_acknowledgment_turn(session_data, message):
+        return None
+    return file_record
+
+def near_duplicate_reply(session_data, message, choice=None, reuse_id=None):
+    """Reply from a near-duplicate's analysis: (bot_response, near_duplicate, reused) or None
+
+    choice is the user's answer to an offer: 'reuse' or 'fresh'. Reuse takes
+    the offered analysis by reuse_id, or the closest match without one.
+    """
+    if choice == 'fresh':
+        # Analyze the image itself, not the reused analysis
+        session_data.last_analysis = None
+        return None
+    file_record = near_duplicate_image(session_data, message)
+    if file_record is None:
+        return None
+    if choice != 'reuse' and session_data.near_duplicate_offered == file_record.sha256:
+        return None
+    phash = int(file_record.phash, 16)
+    with tracing.span('near_duplicate_lookup'):
+        if choice == 'reuse' and reuse_id is not None:
+            match = near_duplicates.get(reuse_id, phash) if FILE_ID_PATTERN.match(reuse_id) else None
+        else:
+            match = near_duplicates.find(phash)
+    if match is None:
+        return None
+    near_duplicate = match.to_dict()
+    if choice == 'reuse' or NEAR_DUPLICATE_MODE == 'auto':
+        near_duplicate['mode'] = 'reused'
+        note = (f"*This image matches one analysed on {near_duplicate['analysed_at']} "
+                f"({match.similarity}% similar), so its analysis is reused below. "
+                f"Ask for a fresh analysis if anything has changed.*")
+        return f"{note}\n\n{match.analysis}", near_duplicate, True
+    near_duplicate['mode'] = 'offer'
+    session_data.near_duplicate_offered = file_record.sha256
+    return (f"This image looks nearly identical ({match.similarity}% similar) to one analysed on "
+            f"{near_duplicate['analysed_at']}. Would you like to reuse that analysis, or analyze this image fresh?"), \
+        near_duplicate, False
+
+def remember_analysis(file_record, bot_response):
+    """Index the first analysis of an image for near-duplicate lookups"""
     try:
-        # Add user message to session
-        sessions[session_id]['messages'].append({
-            'role': 'user',
-            'content': message,
-            'timestamp': datetime.now().isoformat()
-        })
-        
-        # Generate response
-        if model:
-            user_parts = []
-            
-            # Determine file type from uploaded files
-            file_type = None
-            has_image_file = False
-            
-            for file_info in sessions[session_id]['files']:
-                filename = file_info['filename'] if isinstance(file_info, dict) else file_info
-                if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')):
-                    file_type = 'image'
-                    has_image_file = True
-                    break
-                elif filename.lower().endswith(('.wav', '.mp3', '.aiff', '.aac', '.ogg', '.flac')):
-                    file_type = 'audio'
-                    break
-            
-            # Get system prompt based on file type
-            system_prompt = get_system_prompt(file_type)
-            
-            # Check if this is an acknowledgment or negative response that doesn't need analysis
-            acknowledgments = [
-                'ok', 'okay', 'okey', 'oke', 'k',
-                'nice', 'good', 'great', 'excellent', 'awesome', 'perfect', 'cool', 'fine',
-                'thanks', 'thank you', 'thankyou', 'thx', 'ty',
-                'alright', 'got it', 'understood', 'i see', 'i understand',
-                'no', 'nope', 'nah', 'not really', 'no thanks', 'im good', "i'm good",
-                'yes', 'yeah', 'yep', 'yup', 'sure', 'of course'
-            ]
-            
-            # Normalize the message for checking
-            normalized_message = message.lower().strip().replace("'", "").replace(",", "").replace(".", "")
-            
-            # Check if message is ONLY an acknowledgment (not a question or request)
-            is_acknowledgment = (
-                normalized_message in acknowledgments or
-                (len(normalized_message.split()) <= 3 and any(ack in normalized_message for ack in acknowledgments))
-            ) and not any(question_word in normalized_message for question_word in [
-                'what', 'why', 'how', 'when', 'where', 'who', 'which', 'can', 'could', 'would', 'should', 'is', 'are', 'does', 'do', 'analyze', 'explain', 'tell', 'show', 'describe'
-            ])
-            
-            # Build the context
-            if is_acknowledgment and sessions[session_id]['last_analysis']:
-                # For acknowledgments, give a brief response without re-analyzing
-                context_message = f"""{system_prompt}
+        near_duplicates.add(int(file_record.phash, 16), file_record.sha256, bot_response,
+                            file_record.filename.split('_', 1)[-1])
+    except Exception as e:
+        print(f"Near-duplicate index error: {e}")
+
+# Tiled analysis: high-resolution images analyzed as overlapping full-resolution tiles on a
+# bounded pool, merged into one report. TILED_ANALYSIS=auto tiles the first analysis of images
+# over TILE_MIN_EDGE px; on_request only when the chat request sets "tiled": true; off disables it
+TILED_ANALYSIS = os.getenv('TILED_ANALYSIS', 'on_request')
+TILE_MIN_EDGE = int(os.getenv('TILE_MIN_EDGE', '3000'))
+TILE_PROMPT = """You are inspecting one tile of a high-resolution quality inspection image.
+This is tile {label} of a {cols}x{rows} grid; it covers pixels {coordinates} of a {width}x{height} image.
+Neighbouring tiles overlap by {overlap} px and are inspected separately.
+
+The inspector asked: {message}
+
+Report only what is visible in this tile: defects, damage, wear, corrosion, cracks, leaks and safety hazards,
+each as one short bullet with its position in the tile (e.g. "upper left"). If nothing is wrong, reply
+exactly "{nothing_found}" Do not describe the whole scene."""
+
+def analyze_tile(part, tile, grid, message):
+    """Model findings for one tile"""
+    prompt = TILE_PROMPT.format(label=tile.label, coordinates=tile.coordinates, message=message,
+                                nothing_found=NOTHING_FOUND, **grid)
+    response = model.generate_content([
+        {"role": "user", "parts": [{"text": prompt}, part]}
+    ])
+    return response.text
+
+tiled_analyzer = TiledAnalyzer(
+    tile_size=int(os.getenv('TILE_SIZE', '1024')),
+    overlap=int(os.getenv('TILE_OVERLAP', '128')),
+    max_tiles=int(os.getenv('TILE_MAX_TILES', '48')),
+    uniform_stddev=float(os.getenv('TILE_UNIFORM_STDDEV', '6')),
+    workers=int(os.getenv('TILE_CONCURRENCY', '4'))
+)
+
+def tiled_image(session_data, message, requested):
+    """The session's image when this turn should be a tiled analysis, else None"""
+    if TILED_ANALYSIS not in ('auto', 'on_request') or len(session_data.files) != 1:
+        return None
+    file_record = session_data.files[0]
+    if file_type_for(file_record.filename) != 'image' or is_acknowledgment_turn(session_data, message):
+        return None
+    if requested:
+        return file_record
+    if TILED_ANALYSIS != 'auto' or session_data.last_analysis:
+        return None
+    try:
+        with Image.open(upload_store.path(file_record)) as image:
+            size = image.size
+    except Exception:
+        return None
+    return file_record if tiled_analyzer.wants(size, TILE_MIN_EDGE) else None
+
+def tiled_reply(file_record, message, bypass_cache):
+    """Merged tiled report for the image: (report, cached)"""
+    settings = f"{tiled_analyzer.tile_size}/{tiled_analyzer.overlap}/{tiled_analyzer.max_tiles}/{tiled_analyzer.uniform_stddev}"
+    cache_key = analysis_cache_keys.make_key([file_record.sha256], 'image:tiled', message, TILE_PROMPT + settings)
+    with metrics.stage('cache_lookup'):
+        report = analysis_cache.get(cache_key) if not bypass_cache else None
+    if report is not None:
+        return report, True
+    with tracing.span('tiled_analysis'):
+        report = tiled_analyzer.analyze(
+            upload_store.read(file_record),
+            lambda part, tile, grid: analyze_tile(part, tile, grid, message)
+        )
+    analysis_cache.put(cache_key, report)
+    return report, False
+
+def local_reply(session_data, message):
+    """Canned answer to an acknowledgment of an earlier analysis, or None to ask the model"""
+    if not ack_responder or not session_data.last_analysis or not is_acknowledgment_turn(session_data, message):
+        return None
+    return ack_responder.reply(message)
+
+def build_chat_parts(session_data, message):
+    """Build the model request parts for a chat turn
+
+    Returns (user_parts, is_acknowledgment, has_image_file).
+    """
+    user_parts = []
+    
+    # Determine file type from uploaded files
+    file_type = None
+    has_image_file = False
+    
+    for file_info in session_data.files:
+        file_type = file_type_for(file_info.filename)
+        if file_type:
+            break
+    has_image_file = any(file_type_for(f.filename) == 'image' for f in session_data.files)
+    
+    # Get system prompt based on file type
+    system_prompt = get_system_prompt(file_type)
+    
+    # Check if this is an acknowledgment or negative response that doesn't need analysis
+    with tracing.span('classify_message'):
+        is_acknowledgment = is_acknowledgment_turn(session_data, message)
+    
+    # Build the context
+    if is_acknowledgment and session_data.last_analysis:
+        # For acknowledgments, give a brief response without re-analyzing
+        context_message = f"""{system_prompt}
 
 The user previously received a detailed analysis. User just responded with: "{message}"
 
@@ -345,312 +658,613 @@ Respond VERY BRIEFLY with ONE of these options:
 - If they said "yes": "What specific aspect would you like me to elaborate on?"
 
 Do NOT repeat the analysis. Keep response to 1-2 sentences maximum."""
-                user_parts.append({"text": context_message})
-                
-                # Don't add files for acknowledgment responses to save processing
-            else:
-                # For actual questions, include system prompt and conversation context
-                context_message = system_prompt
-                
-                # Add recent conversation history for context (last 2 exchanges)
-                recent_messages = sessions[session_id]['messages'][-4:] if len(sessions[session_id]['messages']) > 4 else sessions[session_id]['messages']
-                if len(recent_messages) > 1:  # If there's conversation history
-                    context_message += "\n\nRECENT CONVERSATION CONTEXT:\n"
-                    for msg in recent_messages[:-1]:  # Exclude current message
-                        role = "User" if msg['role'] == 'user' else "Assistant"
-                        context_message += f"{role}: {msg['content'][:200]}...\n"
-                
-                context_message += f"\n\nCurrent user message: {message}"
-                user_parts.append({"text": context_message})
-                
-                # Add uploaded files (images or audio) in the correct format
-                for file_info in sessions[session_id]['files']:
-                    filename = file_info['filename'] if isinstance(file_info, dict) else file_info
-                    filepath = os.path.join(UPLOAD_FOLDER, filename)
-                    
-                    if os.path.exists(filepath):
-                        # Check if it's an image file
-                        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')):
-                            with open(filepath, 'rb') as image_file:
-                                image_data = image_file.read()
-                                encoded_image = base64.b64encode(image_data).decode('utf-8')
-                            
-                            # Determine image MIME type
-                            if filename.lower().endswith('.png'):
-                                mime_type = 'image/png'
-                            elif filename.lower().endswith(('.jpg', '.jpeg')):
-                                mime_type = 'image/jpeg'
-                            elif filename.lower().endswith('.gif'):
-                                mime_type = 'image/gif'
-                            elif filename.lower().endswith('.bmp'):
-                                mime_type = 'image/bmp'
-                            elif filename.lower().endswith('.webp'):
-                                mime_type = 'image/webp'
-                            
-                            # Add image
-                            user_parts.append({
-                                "inline_data": {
-                                    "mime_type": mime_type,
-                                    "data": encoded_image
-                                }
-                            })
-                        
-                        # Check if it's an audio file
-                        elif filename.lower().endswith(('.wav', '.mp3', '.aiff', '.aac', '.ogg', '.flac')):
-                            with open(filepath, 'rb') as audio_file:
-                                audio_data = audio_file.read()
-                                encoded_audio = base64.b64encode(audio_data).decode('utf-8')
-                            
-                            # Determine audio MIME type
-                            if filename.lower().endswith('.wav'):
-                                mime_type = 'audio/wav'
-                            elif filename.lower().endswith('.mp3'):
-                                mime_type = 'audio/mp3'
-                            elif filename.lower().endswith('.aiff'):
-                                mime_type = 'audio/aiff'
-                            elif filename.lower().endswith('.aac'):
-                                mime_type = 'audio/aac'
-                            elif filename.lower().endswith('.ogg'):
-                                mime_type = 'audio/ogg'
-                            elif filename.lower().endswith('.flac'):
-                                mime_type = 'audio/flac'
-                            
-                            # Add audio
-                            user_parts.append({
-                                "inline_data": {
-                                    "mime_type": mime_type,
-                                    "data": encoded_audio
-                                }
-                            })
-            
-            # Generate content with properly formatted parts
-            response = model.generate_content([
-                {"role": "user", "parts": user_parts}
-            ])
-            
-            bot_response = response.text
-            
-            # Store this as last analysis if it's not an acknowledgment response
-            if not is_acknowledgment:
-                sessions[session_id]['last_analysis'] = bot_response
-                sessions[session_id]['awaiting_followup'] = True
+        user_parts.append({"text": context_message})
+        
+        # Don't add files for acknowledgment responses to save processing
+    else:
+        # For actual questions, include system prompt and conversation context
+        context_message = system_prompt
+        
+        # History packed to the token budget, older turns as a rolling summary
+        with tracing.span('context_plan'):
+            plan = context_builder.plan(session_data, message)
+        if plan.summary:
+            context_message += "\n\nEARLIER CONVERSATION (summary):\n" + plan.summary
+        if plan.history:
+            context_message += "\n\nRECENT CONVERSATION CONTEXT:\n"
+            for msg in plan.history:
+                role = "User" if msg.role == 'user' else "Assistant"
+                context_message += f"{role}: {msg.content}\n"
+        
+        # Follow-ups that don't need the file itself rely on the earlier analysis
+        if not plan.attach_file and session_data.last_analysis:
+            context_message += f"\n\nPREVIOUS ANALYSIS OF THE UPLOADED FILE:\n{session_data.last_analysis}"
+        
+        # Several files: name them in the order they are attached so answers can refer to them
+        file_parts = []
+        if plan.attach_file and session_data.files:
+            with tracing.span('attach_files', files=len(session_data.files)):
+                file_parts = upload_store.model_parts(
+                    session_data.files, MODEL_INLINE_BUDGET // len(session_data.files)
+                )
+            if len(session_data.files) > 1:
+                context_message += "\n\nATTACHED FILES (in order):\n"
+                for i, (file_info, part) in enumerate(zip(session_data.files, file_parts), 1):
+                    name = file_info.filename.split('_', 1)[-1]
+                    note = '' if part or file_type_for(file_info.filename) is None else ' (too large to attach)'
+                    context_message += f"{i}. {name}{note}\n"
+        
+        context_message += f"\n\nCurrent user message: {message}"
+        user_parts.append({"text": context_message})
+        
+        # Add uploaded files (images or audio) - encoded once and cached by content hash
+        file_tokens = 0
+        for part in file_parts:
+            if part:
+                user_parts.append(part)
+                file_tokens += part_tokens(part)
+        
+        context_builder.record_turn(session_data, plan, estimate_tokens(context_message), file_tokens)
+    
+    metrics.observe_prompt(user_parts)
+    return user_parts, is_acknowledgment, has_image_file
+
+def finish_chat_turn(session_data, bot_response, is_acknowledgment, has_image_file, source='model'):
+    """Record the response in the session; returns show_ticket_button
+
+    source is what answered: 'model', 'cache', 'local' (canned reply) or
+    'near_duplicate_offer' (a question, neither an analysis nor an acknowledgment).
+    """
+    is_offer = source == 'near_duplicate_offer'
+    metrics.count_chat_turn('offer' if is_offer else 'acknowledgment' if is_acknowledgment else 'analysis', source)
+    
+    # Store this as last analysis if it's not an acknowledgment response
+    if is_offer:
+        session_data.awaiting_followup = False
+    elif not is_acknowledgment:
+        session_data.last_analysis = bot_response
+        session_data.awaiting_followup = True
+    else:
+        session_data.awaiting_followup = False
+    
+    # Show ticket button if: has image file AND not already clicked AND response contains hazard keywords
+    with tracing.span('keyword_scan'):
+        show_ticket_button = (
+            has_image_file and 
+            (not session_data.ticket_button_clicked) and 
+            bool(text_classifier.hazard_terms(bot_response)) and
+            not is_acknowledgment
+        )
+    
+    # Add bot message to session
+    sessions.append_message(session_data, 'assistant', bot_response)
+    sessions.save(session_data)
+    
+    return show_ticket_button
+
+def analysis_cache_key(session_data, message, is_acknowledgment):
+    """Analysis cache key for this turn, or None when the turn is not cacheable
+
+    The key covers the conversation before this turn, so only identical
+    conversations share follow-up answers.
+    """
+    if is_acknowledgment or not session_data.files:
+        return None
+    history = [(m.role, m.content) for m in session_data.messages]
+    if history and history[-1] == ('user', message):
+        # The current message has already been recorded
+        history.pop()
+    file_type = file_type_for(session_data.files[0].filename)
+    return analysis_cache_keys.make_key(
+        [f.sha256 for f in session_data.files],
+        file_type,
+        message,
+        get_system_prompt(file_type),
+        analysis_cache_keys.context_digest(history, session_data.context_summary)
+    )
+
+def chat_result(session_data, bot_response, show_ticket_button, is_voice_input, cached=False, near_duplicate=None):
+    """JSON body shared by /chat and the final /chat/stream event"""
+    return {
+        'success': True,
+        'response': bot_response,
+        'cached': cached,
+        'near_duplicate': near_duplicate,
+        'is_voice_input': is_voice_input,
+        'show_ticket_button': show_ticket_button,
+        'ticket_created': session_data.ticket_created,
+        'feedback_submitted': session_data.feedback_submitted,
+        'ticket_button_clicked': session_data.ticket_button_clicked,
+        'video': None,
+        'video_name': None,
+        'session_ended': False
+    }
+
+def sse_event(event, payload):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@app.route('/files/<file_id>', methods=['GET'])
+def serve_file(file_id):
+    """Stream an uploaded original with ETag, conditional GET and Range support"""
+    if not FILE_ID_PATTERN.match(file_id):
+        abort(404)
+    
+    filepath = upload_store.find(file_id)
+    if not filepath:
+        abort(404)
+    
+    # Content-addressed: the hash is a strong validator and the bytes never change
+    response = send_file(
+        os.path.abspath(filepath),
+        mimetype=upload_store.sniffed_mime_type(filepath),
+        conditional=True,
+        etag=file_id,
+        max_age=None
+    )
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+def chat_turn(session_data, data, stream=False):
+    """Answer one chat turn: yields the response text in chunks, returns the chat_result() body
+
+    Shared by /chat and /chat/stream. Local replies, near-duplicate replies,
+    tiled reports and cache hits arrive as a single chunk; with stream=True
+    the model's output is yielded as it arrives.
+    """
+    message = data.get('message')
+    is_voice_input = data.get('is_voice_input', False)
+    bypass_cache = data.get('bypass_cache', False)
+    # Answer to a near-duplicate offer: a button resends the original question with the choice,
+    # a typed reply is a plain yes (reuse) or anything else (analyze fresh)
+    near_duplicate_choice = data.get('near_duplicate')
+    if near_duplicate_choice not in NEAR_DUPLICATE_CHOICES:
+        near_duplicate_choice = offer_answer(message) if near_duplicate_offer_pending(session_data) else None
+        
+        # Add user message to session
+        sessions.append_message(session_data, 'user', message)
+    else:
+        sessions.append_message(session_data, 'user', NEAR_DUPLICATE_CHOICES[near_duplicate_choice])
+    
+    # Plain acknowledgments get their canned reply without a model call
+    bot_response = local_reply(session_data, message)
+    if bot_response is not None:
+        finish_chat_turn(session_data, bot_response, True, False, 'local')
+        yield bot_response
+        return chat_result(session_data, bot_response, False, is_voice_input)
+    
+    # A re-photographed scene: offer or reuse the earlier analysis
+    reply = None if bypass_cache else near_duplicate_reply(
+        session_data, message, near_duplicate_choice, data.get('near_duplicate_id')
+    )
+    if reply:
+        bot_response, near_duplicate, reused = reply
+        show_ticket_button = finish_chat_turn(
+            session_data, bot_response, False, reused, 'near_duplicate' if reused else 'near_duplicate_offer'
+        )
+        yield bot_response
+        return chat_result(session_data, bot_response, show_ticket_button, is_voice_input,
+                           near_duplicate=near_duplicate)
+    image_record = near_duplicate_image(session_data, message)
+    
+    # High-resolution image: overlapping full-resolution tiles, analyzed concurrently
+    tiled_record = tiled_image(session_data, message, data.get('tiled', False))
+    if tiled_record:
+        bot_response, cached = tiled_reply(tiled_record, message, bypass_cache)
+        if image_record:
+            remember_analysis(image_record, bot_response)
+        show_ticket_button = finish_chat_turn(
+            session_data, bot_response, False, True, 'cache' if cached else 'tiled'
+        )
+        yield bot_response
+        return chat_result(session_data, bot_response, show_ticket_button, is_voice_input, cached)
+    
+    # Generate response
+    with metrics.stage('build_prompt'):
+        user_parts, is_acknowledgment, has_image_file = build_chat_parts(session_data, message)
+    
+    # Same file + same question: reuse the earlier analysis
+    cache_key = analysis_cache_key(session_data, message, is_acknowledgment)
+    with metrics.stage('cache_lookup'):
+        bot_response = analysis_cache.get(cache_key) if cache_key and not bypass_cache else None
+    cached = bot_response is not None
+    
+    if cached:
+        yield bot_response
+    else:
+        chunks = []
+        with tracing.span('model', stream=stream):
+            if stream:
+                for chunk in model.generate_content([{"role": "user", "parts": user_parts}], stream=True):
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        # Chunks without text (e.g. the final finish-reason chunk)
+                        continue
+                    if text:
+                        chunks.append(text)
+                        yield text
             else:
-                sessions[session_id]['awaiting_followup'] = False
-            
-            # Check if response contains hazard/risk/broken keywords
-            hazard_keywords = [
-                'hazard', 'hazards', 'risk', 'risks', 'danger', 'dangerous',
-                'broken', 'damaged', 'crack', 'cracked', 'defect', 'defective',
-                'unsafe', 'malfunction', 'failure', 'fault', 'faulty',
-                'concern', 'issue', 'problem', 'warning', 'alert'
-            ]
-            
-            # Show ticket button if: has image file AND not already clicked AND response contains hazard keywords
-            show_ticket_button = (
-                has_image_file and 
-                (not sessions[session_id]['ticket_button_clicked']) and 
-                any(keyword in bot_response.lower() for keyword in hazard_keywords) and
-                not is_acknowledgment
-            )
-            
-            # Add bot message to session
-            sessions[session_id]['messages'].append({
-                'role': 'assistant',
-                'content': bot_response,
-                'timestamp': datetime.now().isoformat()
-            })
-            
-            return jsonify({
-                'success': True,
-                'response': bot_response,
-                'is_voice_input': is_voice_input,
-                'show_ticket_button': show_ticket_button,
-                'ticket_created': sessions[session_id]['ticket_created'],
-                'feedback_submitted': sessions[session_id]['feedback_submitted'],
-                'ticket_button_clicked': sessions[session_id]['ticket_button_clicked'],
-                'video': None,
-                'video_name': None,
-                'session_ended': False
-            })
-        else:
-            return jsonify({
-                'error': 'Model not available',
-                'response': 'I apologize, but the AI model is currently unavailable.'
-            })
+                chunks.append(model.generate_content([{"role": "user", "parts": user_parts}]).text)
+        
+        bot_response = ''.join(chunks)
+        if not stream:
+            yield bot_response
+        if cache_key:
+            analysis_cache.put(cache_key, bot_response)
+    
+    if image_record:
+        remember_analysis(image_record, bot_response)
+    
+    show_ticket_button = finish_chat_turn(
+        session_data, bot_response, is_acknowledgment, has_image_file, 'cache' if cached else 'model'
+    )
+    
+    return chat_result(session_data, bot_response, show_ticket_button, is_voice_input, cached)
+
+def chat_error(error):
+    """(JSON body, HTTP status) for a failed chat turn"""
+    if isinstance(error, ModelBusyError):
+        return {
+            'error': str(error),
+            'response': 'The assistant is busy right now. Please try again in a moment.'
+        }, 503
+    if isinstance(error, ModelUnavailableError):
+        return {
+            'error': str(error),
+            'response': 'I apologize, but the AI model is currently unavailable.'
+        }, 503
+    if isinstance(error, SessionConflictError):
+        return {
+            'error': str(error),
+            'response': SESSION_CONFLICT_MESSAGE
+        }, 409
+    print(f"Chat error: {error}")
+    return {
+        'error': str(error),
+        'response': 'An error occurred while processing your request.'
+    }, 200
+
+@app.route('/chat', methods=['POST'])
+def chat():
+    data = request.json
+    session_data = load_session(data.get('session_id'), create=True)
     
+    # Update last interaction time
+    session_data.touch()
+    
+    try:
+        turn = chat_turn(session_data, data)
+        while True:
+            try:
+                next(turn)
+            except StopIteration as done:
+                return jsonify(done.value)
     except Exception as e:
-        print(f"Chat error: {e}")
-        return jsonify({
-            'error': str(e),
-            'response': 'An error occurred while processing your request.'
-        })
+        body, status = chat_error(e)
+        return jsonify(body), status
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Streaming variant of /chat: relays model output as Server-Sent Events
+
+    Emits 'token' events with text chunks as they arrive, then one 'done'
+    event carrying the same JSON body /chat returns (or an 'error' event).
+    """
+    data = request.json
+    session_data = load_session(data.get('session_id'), create=True)
+    session_data.touch()
+    
+    def generate():
+        turn = chat_turn(session_data, data, stream=True)
+        try:
+            while True:
+                try:
+                    text = next(turn)
+                except StopIteration as done:
+                    yield sse_event('done', done.value)
+                    return
+                yield sse_event('token', {'text': text})
+        except Exception as e:
+            body, _ = chat_error(e)
+            yield sse_event('error', body)
+        finally:
+            # A client that disconnects mid-answer also ends the model stream
+            turn.close()
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 @app.route('/api/create-ticket', methods=['POST'])
 def create_ticket():
     data = request.json
     session_id = data.get('session_id')
     
-    if session_id not in sessions:
-        sessions[session_id] = {
-            'messages': [],
-            'files': [],
-            'ticket_counter': 0,
-            'feedback': [],
-            'ticket_created': False,
-            'last_interaction': time.time(),
-            'feedback_submitted': False,
-            'ticket_button_clicked': False,
-            'last_analysis': None,
-            'awaiting_followup': False
-        }
+    session_data = load_session(session_id, create=True)
     
     # Mark ticket as created and button as clicked for this session
-    sessions[session_id]['ticket_created'] = True
-    sessions[session_id]['ticket_button_clicked'] = True
+    session_data.ticket_created = True
+    session_data.ticket_button_clicked = True
     
     # Increment ticket counter
-    sessions[session_id]['ticket_counter'] += 1
-    ticket_number = f"Q{sessions[session_id]['ticket_counter']:03d}"
+    session_data.ticket_counter += 1
     
-    # Create ticket data
-    ticket_data = {
-        'ticket_number': ticket_number,
-        'timestamp': datetime.now().isoformat(),
-        'session_id': session_id,
-        'type': 'quality_inspection'
-    }
+    # Persist the ticket, linked to the analysis and file that triggered it
+    file_record = session_data.files[0] if session_data.files else None
+    ticket = tickets.create(
+        session_id,
+        file_sha256=file_record.sha256 if file_record else None,
+        file_name=file_record.filename if file_record else None,
+        hazard_terms=text_classifier.hazard_terms(session_data.last_analysis or ''),
+        analysis=session_data.last_analysis
+    )
+    ticket_number = ticket.ticket_id
     
     # Update last interaction time
-    sessions[session_id]['last_interaction'] = time.time()
+    session_data.touch()
+    sessions.save(session_data)
+    metrics.TICKETS_CREATED.labels(ticket.severity).inc()
     
     return jsonify({
         'success': True,
         'ticket_number': ticket_number,
+        'severity': ticket.severity,
         'message': f'Quality Inspection Ticket {ticket_number} created successfully!',
         'ticket_created': True,
         'ticket_button_clicked': True
     })
 
+def parse_time(value):
+    """Epoch seconds or an ISO 8601 date/time from a query parameter"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def ticket_filters():
+    """Query filters shared by the ticket list and export
+
+    Listing across sessions needs the admin token; a session can always list its own.
+    """
+    session_id = request.args.get('session_id')
+    if not session_id:
+        require_admin()
+    severity = request.args.get('severity')
+    if severity and severity not in SEVERITIES:
+        abort(400)
+    file_id = request.args.get('file_id')
+    if file_id and not FILE_ID_PATTERN.match(file_id):
+        abort(400)
+    try:
+        since = parse_time(request.args.get('since'))
+        until = parse_time(request.args.get('until'))
+    except ValueError:
+        abort(400)
+    return {'session_id': session_id, 'severity': severity, 'since': since, 'until': until, 'file_sha256': file_id}
+
+@app.route('/api/tickets', methods=['GET'])
+def list_tickets():
+    """Tickets newest first; pass next_cursor back as cursor for the next page"""
+    filters = ticket_filters()
+    cursor = request.args.get('cursor')
+    if cursor and not TICKET_ID_PATTERN.match(cursor):
+        abort(400)
+    page, next_cursor = tickets.query(cursor=cursor, limit=request.args.get('limit', 50, type=int), **filters)
+    return jsonify({
+        'success': True,
+        'tickets': [ticket.to_dict() for ticket in page],
+        'next_cursor': next_cursor
+    })
+
+@app.route('/api/tickets/export', methods=['GET'])
+def export_tickets():
+    """All matching tickets, oldest first, streamed as NDJSON (default) or CSV"""
+    filters = ticket_filters()
+    if request.args.get('format') == 'csv':
+        return Response(
+            tickets.export_csv(**filters),
+            mimetype='text/csv',
+            headers={'Content-Disposition': 'attachment; filename=tickets.csv'}
+        )
+    return Response(
+        tickets.export_ndjson(**filters),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename=tickets.ndjson'}
+    )
+
+@app.route('/api/tickets/<ticket_id>', methods=['GET'])
+def get_ticket(ticket_id):
+    if not TICKET_ID_PATTERN.match(ticket_id):
+        abort(404)
+    ticket = tickets.get(ticket_id)
+    if ticket is None:
+        abort(404)
+    return jsonify({'success': True, 'ticket': ticket.to_dict()})
+
+@app.route('/api/feedback/export', methods=['GET'])
+def export_all_feedback():
+    """Feedback from all sessions (or one with session_id), oldest first, as NDJSON (default) or CSV
+
+    Exporting across sessions needs the admin token.
+    """
+    session_id = request.args.get('session_id')
+    if not session_id:
+        require_admin()
+    try:
+        filters = {
+            'session_id': session_id,
+            'since': parse_time(request.args.get('since')),
+            'until': parse_time(request.args.get('until'))
+        }
+    except ValueError:
+        abort(400)
+    if request.args.get('format') == 'csv':
+        return Response(
+            feedback_store.export_csv(**filters),
+            mimetype='text/csv',
+            headers={'Content-Disposition': 'attachment; filename=feedback.csv'}
+        )
+    return Response(
+        feedback_store.export_ndjson(**filters),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename=feedback.ndjson'}
+    )
+
+@app.route('/stats/feedback', methods=['GET'])
+def feedback_stats():
+    """Rating histogram, averages per file type and per day over the last ?days=7"""
+    return jsonify({
+        **feedback_store.summary(request.args.get('days', 7, type=int)),
+        'store': feedback_store.stats()
+    })
+
+@app.route('/stats/near-duplicates', methods=['GET'])
+def near_duplicate_stats():
+    """Near-duplicate index size and lookup counters"""
+    if not near_duplicates:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, 'mode': NEAR_DUPLICATE_MODE, **near_duplicates.stats()})
+
+@app.route('/stats/tiling', methods=['GET'])
+def tiling_stats():
+    """Tiled analysis counters: images, tiles analysed, skipped as uniform and failed"""
+    return jsonify({'mode': TILED_ANALYSIS, **tiled_analyzer.stats()})
+
+@app.route('/stats/tickets', methods=['GET'])
+def ticket_stats():
+    """Ticket count and store size for monitoring"""
+    return jsonify(tickets.stats())
+
 @app.route('/export/json', methods=['POST'])
 def export_json():
     data = request.json
     session_id = data.get('session_id')
     
-    if session_id in sessions:
+    session_data = load_session(session_id)
+    
+    if session_data:
         return jsonify({
             'session_id': session_id,
-            'messages': sessions[session_id]['messages'],
-            'files': [f['filename'] if isinstance(f, dict) else f for f in sessions[session_id]['files']],
-            'ticket_counter': sessions[session_id]['ticket_counter']
+            'messages': [msg.to_dict() for msg in session_data.messages],
+            'files': [f.filename for f in session_data.files],
+            'ticket_counter': session_data.ticket_counter
         })
     else:
         return jsonify({'error': 'Session not found'})
 
+# Conversations longer than this are exported by a background job
+PDF_BACKGROUND_MESSAGES = int(os.getenv('PDF_BACKGROUND_MESSAGES', '200'))
+
+pdf_jobs = PdfExportJobs(
+    os.getenv('PDF_EXPORT_FOLDER', os.path.join('data', 'exports')),
+    max_workers=int(os.getenv('PDF_EXPORT_WORKERS', '2')),
+    ttl=int(os.getenv('PDF_EXPORT_TTL', '3600')),
+    stale_after=int(os.getenv('PDF_EXPORT_STALE_AFTER', '120'))
+)
+
+def export_image(session_data):
+    """Original bytes and name of the session's image, for the PDF thumbnail"""
+    for file_record in session_data.files:
+        if file_type_for(file_record.filename) == 'image':
+            try:
+                return upload_store.read(file_record), file_record.filename
+            except FileNotFoundError:
+                return None, None
+    return None, None
+
 @app.route('/export/pdf', methods=['POST'])
 def export_pdf():
+    """Stream the chat as a PDF, or start a background export for long chats"""
     data = request.json
     session_id = data.get('session_id')
+    include_image = data.get('include_image', True)
+    
+    session_data = load_session(session_id)
     
-    if session_id not in sessions or not sessions[session_id]['messages']:
+    if not session_data or not session_data.messages:
         return jsonify({'error': 'No chat history found'}), 404
     
-    try:
-        # Create PDF filename
-        pdf_filename = f'chat_export_{session_id}_{int(time.time())}.pdf'
-        pdf_path = os.path.join(STATIC_FOLDER, pdf_filename)
-        
-        # Create PDF document
-        doc = SimpleDocTemplate(pdf_path, pagesize=letter)
-        styles = getSampleStyleSheet()
-        
-        # Custom styles
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=16,
-            textColor='#2c3e50',
-            spaceAfter=30
-        )
-        
-        user_style = ParagraphStyle(
-            'UserMessage',
-            parent=styles['Normal'],
-            fontSize=11,
-            textColor='#2980b9',
-            leftIndent=20,
-            spaceAfter=10,
-            fontName='Helvetica-Bold'
-        )
-        
-        bot_style = ParagraphStyle(
-            'BotMessage',
-            parent=styles['Normal'],
-            fontSize=10,
-            textColor='#34495e',
-            leftIndent=20,
-            spaceAfter=15
-        )
-        
-        # Build PDF content
-        story = []
-        
-        # Title
-        story.append(Paragraph("Image/Audio Assistant - Chat Export", title_style))
-        story.append(Spacer(1, 0.2 * inch))
-        
-        # Add messages
-        for msg in sessions[session_id]['messages']:
-            if msg['role'] == 'user':
-                story.append(Paragraph(f"<b>You:</b> {html.escape(msg['content'])}", user_style))
-            else:
-                # Clean bot response for PDF
-                content = msg['content'].replace('**', '')
-                story.append(Paragraph(f"<b>Assistant:</b> {html.escape(content)}", bot_style))
-        
-        # Build PDF
-        doc.build(story)
-        
-        # Read PDF file
-        with open(pdf_path, 'rb') as f:
-            pdf_data = base64.b64encode(f.read()).decode('utf-8')
-        
-        # Clean up
-        os.remove(pdf_path)
-        
+    pdf_filename = f'chat_export_{session_id}_{int(time.time())}.pdf'
+    messages = [(msg.role, msg.content) for msg in session_data.messages]
+    with tracing.span('export_image'):
+        image, image_name = export_image(session_data) if include_image else (None, None)
+    
+    if len(messages) > PDF_BACKGROUND_MESSAGES:
+        job_id = pdf_jobs.submit(pdf_filename, messages, image, image_name)
         return jsonify({
             'success': True,
-            'pdf_data': pdf_data,
-            'filename': pdf_filename
-        })
+            'job_id': job_id,
+            'status_url': f"/export/pdf/{job_id}",
+            'download_url': f"/export/pdf/{job_id}/download"
+        }), 202
     
+    try:
+        with metrics.stage('pdf_build'):
+            pdf_data = build_pdf(messages, image, image_name)
     except Exception as e:
         print(f"PDF export error: {e}")
         return jsonify({'error': str(e)}), 500
+    
+    return send_file(
+        BytesIO(pdf_data),
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=pdf_filename
+    )
+
+def get_pdf_job_or_404(job_id):
+    if not re.match(r'^[0-9a-f]{16}$', job_id):
+        abort(404)
+    status = pdf_jobs.get(job_id)
+    if status is None:
+        abort(404)
+    return status
+
+@app.route('/export/pdf/<job_id>', methods=['GET'])
+def export_pdf_status(job_id):
+    """Progress of a background PDF export"""
+    return jsonify(get_pdf_job_or_404(job_id))
+
+@app.route('/export/pdf/<job_id>/download', methods=['GET'])
+def export_pdf_download(job_id):
+    status = get_pdf_job_or_404(job_id)
+    if status['status'] != 'done':
+        return jsonify({'error': 'Export is not finished', **status}), 409
+    return send_file(
+        os.path.abspath(pdf_jobs.pdf_path(job_id)),
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=status['filename']
+    )
 
 @app.route('/clear', methods=['POST'])
 def clear_chat():
     data = request.json
     session_id = data.get('session_id')
     
-    if session_id in sessions:
-        # Delete uploaded files
-        for file_info in sessions[session_id]['files']:
-            filename = file_info['filename'] if isinstance(file_info, dict) else file_info
-            filepath = os.path.join(UPLOAD_FOLDER, filename)
+    session_data = sessions.get(session_id)
+    
+    if session_data:
+        # Release uploaded files (deleted once no other session uses them)
+        for file_info in session_data.files:
             try:
-                if os.path.exists(filepath):
-                    os.remove(filepath)
+                upload_store.release(file_info, session_id)
             except Exception as e:
-                print(f"Error deleting file {filename}: {e}")
+                print(f"Error deleting file {file_info.filename}: {e}")
         
         # Clear session data but keep ticket counter
-        sessions[session_id]['messages'] = []
-        sessions[session_id]['files'] = []
-        sessions[session_id]['ticket_created'] = False
-        sessions[session_id]['ticket_button_clicked'] = False
-        sessions[session_id]['last_interaction'] = time.time()
-        sessions[session_id]['last_analysis'] = None
-        sessions[session_id]['awaiting_followup'] = False
+        session_data.files = []
+        session_data.ticket_created = False
+        session_data.ticket_button_clicked = False
+        session_data.touch()
+        session_data.last_analysis = None
+        session_data.awaiting_followup = False
+        session_data.near_duplicate_offered = ''
+        sessions.clear_messages(session_data)
         
         return jsonify({'success': True})
 
@@ -661,29 +1275,28 @@ def submit_feedback():
     rating = data.get('rating')
     comment = data.get('comment', '')
     
-    if session_id not in sessions:
-        sessions[session_id] = {
-            'messages': [],
-            'files': [],
-            'ticket_counter': 0,
-            'feedback': [],
-            'ticket_created': False,
-            'last_interaction': time.time(),
-            'feedback_submitted': False,
-            'ticket_button_clicked': False,
-            'last_analysis': None,
-            'awaiting_followup': False
-        }
+    session_data = load_session(session_id, create=True)
     
-    feedback_entry = {
-        'rating': rating,
-        'comment': comment,
-        'timestamp': datetime.now().isoformat()
-    }
+    feedback_entry = FeedbackEntry(
+        rating=rating,
+        comment=comment,
+        timestamp=datetime.now().isoformat()
+    )
     
-    sessions[session_id]['feedback'].append(feedback_entry)
-    sessions[session_id]['feedback_submitted'] = True
-    sessions[session_id]['last_interaction'] = time.time()
+    session_data.feedback.append(feedback_entry)
+    session_data.feedback_submitted = True
+    session_data.touch()
+    sessions.save(session_data)
+    # Attributed to the file the session was discussing when the rating was given
+    current_file = session_data.files[-1] if session_data.files else None
+    feedback_store.add(
+        session_id,
+        rating=rating,
+        comment=comment,
+        file_type=current_file.mime_type if current_file else None,
+        file_name=current_file.filename if current_file else None
+    )
+    metrics.count_feedback(rating)
     
     return jsonify({
         'success': True,
@@ -695,9 +1308,11 @@ def check_idle():
     data = request.json
     session_id = data.get('session_id')
     
-    if session_id in sessions:
+    session_data = sessions.get(session_id)
+    
+    if session_data:
         current_time = time.time()
-        last_interaction = sessions[session_id]['last_interaction']
+        last_interaction = session_data.last_interaction
         idle_time = current_time - last_interaction
         
         # Check if 10 seconds have passed
@@ -717,19 +1332,335 @@ def check_idle():
             'idle_time': 0
         })
 
+# Batch inspection: many images analyzed on a bounded pool, off the request threads
+BATCH_PROMPT = "Analyze this image."
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', '500'))
+
+def analyze_batch_file(file_record):
+    """Run the standard image analysis for one batch file"""
+    system_prompt = get_system_prompt('image')
+    cache_key = analysis_cache_keys.make_key([file_record.sha256], 'image', BATCH_PROMPT, system_prompt)
+    bot_response = analysis_cache.get(cache_key)
+    cached = bot_response is not None
+    if not cached:
+        user_parts = [
+            {"text": system_prompt + f"\n\nCurrent user message: {BATCH_PROMPT}"},
+            upload_store.model_part(file_record)
+        ]
+        response = model.generate_content([
+            {"role": "user", "parts": user_parts}
+        ])
+        bot_response = response.text
+        analysis_cache.put(cache_key, bot_response)
+    return {
+        'response': bot_response,
+        'hazard_terms': text_classifier.hazard_terms(bot_response),
+        'cached': cached
+    }
+
+def release_batch_files(batch, file_records):
+    """Drop the batch's references once every job has finished"""
+    for file_record in {f.sha256: f for f in file_records}.values():
+        upload_store.release(file_record, f"batch:{batch.batch_id}")
+
+batch_manager = BatchManager(
+    os.getenv('BATCH_STATE_FOLDER', os.path.join('data', 'batches')),
+    analyze_batch_file,
+    max_workers=int(os.getenv('BATCH_CONCURRENCY', '4')),
+    on_finished=release_batch_files,
+    persist_interval=float(os.getenv('BATCH_PERSIST_INTERVAL', '1')),
+    stale_after=float(os.getenv('BATCH_STALE_SECONDS', '900'))
+)
+
+def touch_batch_files():
+    """Keep the upload refs of running batches from expiring"""
+    for batch_id, file_records in batch_manager.pending_files():
+        for file_record in {f.sha256: f for f in file_records}.values():
+            upload_store.touch(file_record, f"batch:{batch_id}")
+
+def refresh_gauges():
+    """Update this worker's session and upload-folder gauges"""
+    stats = sessions.stats()
+    if stats['backend'] == 'memory':
+        # Each worker holds its own sessions; the gauge sums the workers
+        metrics.SESSIONS_ACTIVE.set(stats['sessions'])
+    else:
+        # Shared store: counted once, by the worker that collects uploads
+        metrics.SESSIONS_ACTIVE.set(stats.get('sessions', stats.get('keys', 0)) if janitor.leader else 0)
+    if janitor.leader:
+        metrics.UPLOAD_FOLDER_BYTES.set(upload_store.stats()['disk_bytes'])
+
+def janitor_tick():
+    touch_batch_files()
+    refresh_gauges()
+
+# Idle sessions are swept (releasing their uploads) and uploads collected in the
+# background. Upload refs outlive the session idle TTL by one interval;
+# UPLOAD_QUOTA_MB caps the folder, evicting the least recently used files that
+# no session has used within that time.
+JANITOR_INTERVAL = int(os.getenv('JANITOR_INTERVAL', '300'))
+janitor = Janitor(
+    sessions,
+    upload_store,
+    interval=JANITOR_INTERVAL,
+    ref_ttl=int(os.getenv('SESSION_IDLE_TTL', '3600')) + JANITOR_INTERVAL,
+    quota_bytes=int(float(os.getenv('UPLOAD_QUOTA_MB', '2048')) * 1024 * 1024),
+    on_tick=janitor_tick
+)
+
+@app.before_request
+def start_janitor():
+    janitor.ensure_started()
+
+def batch_urls(batch_id):
+    return {
+        'status_url': f"/batch/{batch_id}",
+        'events_url': f"/batch/{batch_id}/events",
+        'results_json_url': f"/batch/{batch_id}/results.json",
+        'results_csv_url': f"/batch/{batch_id}/results.csv"
+    }
+
+def store_batch_image(stream, filename, ref_id):
+    """Store one batch image; returns a FileRecord
+
+    Raises ValueError when the image is over the upload image limit.
+    """
+    sha256, size, sniffed_mime_type = upload_store.put(stream, filename, ref_id, max_size=UPLOAD_MAX_IMAGE)
+    return FileRecord(filename=filename, mime_type=sniffed_mime_type or mime_type_for(filename), sha256=sha256,
+                      size=size)
+
+@app.route('/batch', methods=['POST'])
+def create_batch():
+    """Queue many images (multipart 'files', or a .zip) for analysis"""
+    uploads = request.files.getlist('files')
+    if not uploads:
+        return jsonify({'success': False, 'error': 'No files uploaded'}), 400
+    
+    # The id is fixed before the batch exists so files are stored only once
+    batch_id = os.urandom(8).hex()
+    ref_id = f"batch:{batch_id}"
+    files = []
+    skipped = []
+    
+    def check_room():
+        # Checked before each image is read, so nothing past the cap is extracted
+        if len(files) >= BATCH_MAX_FILES:
+            raise ValueError(f"A batch is limited to {BATCH_MAX_FILES} images")
+    
+    try:
+        for upload in uploads:
+            filename = os.path.basename(upload.filename or '')
+            stream = upload.stream
+            if zipfile.is_zipfile(stream):
+                stream.seek(0)
+                with zipfile.ZipFile(stream) as archive:
+                    for member in archive.infolist():
+                        member_name = os.path.basename(member.filename)
+                        if member.is_dir() or not member_name or member_name.startswith('.'):
+                            continue
+                        if file_type_for(member_name) != 'image':
+                            skipped.append(member.filename)
+                            continue
+                        check_room()
+                        # The declared size is checked before decompressing; put() also stops
+                        # at the limit in case the header understates it
+                        if member.file_size > UPLOAD_MAX_IMAGE:
+                            raise ValueError(
+                                f"{member.filename} exceeds the {UPLOAD_MAX_IMAGE // (1024 * 1024)} MB image limit"
+                            )
+                        with archive.open(member) as member_stream:
+                            files.append((member.filename, store_batch_image(member_stream, member_name, ref_id)))
+            elif file_type_for(filename) != 'image':
+                skipped.append(filename)
+            else:
+                check_room()
+                stream.seek(0)
+                files.append((filename, store_batch_image(stream, filename, ref_id)))
+    except (ValueError, zipfile.BadZipFile) as e:
+        for _, file_record in files:
+            upload_store.release(file_record, ref_id)
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    if not files:
+        return jsonify({'success': False, 'error': 'No supported images found', 'skipped': skipped}), 400
+    
+    batch = batch_manager.submit(files, batch_id)
+    
+    return jsonify({
+        'success': True,
+        'batch_id': batch.batch_id,
+        'total': len(files),
+        'skipped': skipped,
+        **batch_urls(batch.batch_id)
+    }), 202
+
+def get_batch_or_404(batch_id):
+    if not re.match(r'^[0-9a-f]{16}$', batch_id):
+        abort(404)
+    batch = batch_manager.get(batch_id)
+    if batch is None:
+        abort(404)
+    return batch
+
+@app.route('/batch/<batch_id>', methods=['GET'])
+def batch_status(batch_id):
+    """Progress counters and per-job status (responses are in the results)"""
+    batch = get_batch_or_404(batch_id)
+    status = batch.to_dict(include_responses=False)
+    status.update(batch_urls(batch_id))
+    return jsonify(status)
+
+@app.route('/batch/<batch_id>/events', methods=['GET'])
+def batch_events(batch_id):
+    """Server-Sent Events with batch progress until the batch completes"""
+    get_batch_or_404(batch_id)
+    interval = float(os.getenv('BATCH_EVENT_INTERVAL', '1'))
+    
+    def generate():
+        last_update = None
+        while True:
+            batch = batch_manager.get(batch_id)
+            if batch is None:
+                yield sse_event('error', {'batch_id': batch_id, 'error': 'Batch no longer exists'})
+                return
+            if batch_manager.orphaned(batch):
+                yield sse_event('error', {
+                    **batch.progress(),
+                    'error': 'The worker running this batch has stopped; it will not complete'
+                })
+                return
+            progress = batch.progress()
+            if progress['updated'] != last_update:
+                last_update = progress['updated']
+                yield sse_event('progress', progress)
+            if progress['status'] == 'complete':
+                yield sse_event('done', progress)
+                return
+            time.sleep(interval)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/batch/<batch_id>/results.json', methods=['GET'])
+def batch_results_json(batch_id):
+    """All job results, including responses and hazard flags"""
+    batch = get_batch_or_404(batch_id)
+    response = jsonify(batch.to_dict())
+    response.headers['Content-Disposition'] = f'attachment; filename=batch_{batch_id}.json'
+    return response
+
+@app.route('/batch/<batch_id>/results.csv', methods=['GET'])
+def batch_results_csv(batch_id):
+    """All job results as CSV, streamed row by row"""
+    batch = get_batch_or_404(batch_id)
+    return Response(
+        results_csv(batch),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename=batch_{batch_id}.csv'}
+    )
+
+@app.route('/stats/batch', methods=['GET'])
+def batch_stats():
+    """Batch pool size and queue depth for monitoring"""
+    return jsonify(batch_manager.stats())
+
+@app.route('/stats/sessions', methods=['GET'])
+def session_stats():
+    """Session store size and eviction counters for monitoring"""
+    return jsonify(sessions.stats())
+
+@app.route('/stats/model', methods=['GET'])
+def model_stats():
+    """Model call latency, error, retry and circuit breaker counters for monitoring"""
+    return jsonify(model.stats())
+
+@app.route('/stats/acknowledgments', methods=['GET'])
+def acknowledgment_stats():
+    """Acknowledgments answered locally vs. passed to the model"""
+    if not ack_responder:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **ack_responder.stats()})
+
+@app.route('/stats/context', methods=['GET'])
+def context_stats():
+    """Prompt size and file re-attach counters for monitoring"""
+    return jsonify(context_builder.stats())
+
+@app.route('/stats/uploads', methods=['GET'])
+def upload_stats():
+    """Upload store and payload cache counters for monitoring"""
+    return jsonify(upload_store.stats())
+
+@app.route('/stats/janitor', methods=['GET'])
+def janitor_stats():
+    """Session sweeps and the last upload collection report"""
+    return jsonify(janitor.stats())
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """All workers' metrics in Prometheus text format"""
+    refresh_gauges()
+    body, content_type = metrics.render()
+    return Response(body, mimetype=content_type)
+
+@app.route('/stats/tracing', methods=['GET'])
+def tracing_stats():
+    """Trace export counters"""
+    if not trace_exporter:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **trace_exporter.stats()})
+
+def require_admin():
+    """404 unless ADMIN_TOKEN is set, 403 unless the request carries it"""
+    if not ADMIN_TOKEN:
+        abort(404)
+    token = request.headers.get('X-Admin-Token', '')
+    if not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        abort(403)
+
+@app.route('/admin/profile', methods=['GET'])
+def profile_status():
+    """Armed profiler state and the most recent profiles"""
+    require_admin()
+    return jsonify(request_profiler.status())
+
+@app.route('/admin/profile', methods=['POST'])
+def arm_profiler():
+    """Profile the next N requests (optionally only paths with a prefix)
+
+    mode is 'cprofile' (pstats output) or 'sample' (folded stacks); count 0 disarms.
+    """
+    require_admin()
+    data = request.json or {}
+    try:
+        state = request_profiler.arm(
+            int(data.get('count', 10)),
+            data.get('mode', 'cprofile'),
+            data.get('path_prefix', '')
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'armed': state})
+
+@app.route('/stats/analysis-cache', methods=['GET'])
+def analysis_cache_stats():
+    """Analysis cache hit/miss counters for monitoring"""
+    return jsonify(analysis_cache.stats())
+
 @app.route('/export/feedback', methods=['POST'])
 def export_feedback():
     data = request.json
     session_id = data.get('session_id')
     
-    if session_id in sessions and sessions[session_id]['feedback']:
-        csv_data = "Timestamp,Rating,Comment\n"
-        for fb in sessions[session_id]['feedback']:
-            csv_data += f"{fb['timestamp']},{fb['rating']},\"{fb['comment']}\"\n"
-        
+    session_data = load_session(session_id)
+    
+    if session_data and session_data.feedback:
         return jsonify({
             'success': True,
-            'csv_data': csv_data,
+            'csv_data': session_feedback_csv(session_data.feedback),
             'filename': f'feedback_{session_id}.csv'
         })
     else:
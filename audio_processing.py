@@ -0,0 +1,159 @@
+import io
+import wave
+
+import numpy as np
+
+try:
+    import aifc
+except ImportError:
+    # Removed from the standard library in Python 3.13
+    aifc = None
+
+# Formats the standard library can decode; everything else is sent as uploaded
+DECODABLE_MIME_TYPES = {'audio/wav', 'audio/x-wav', 'audio/wave', 'audio/aiff', 'audio/x-aiff'}
+
+# Frame length for the silence detector and audio kept around detected speech
+SILENCE_FRAME_SECONDS = 0.02
+SILENCE_PADDING_SECONDS = 0.1
+
+
+class AudioNormalizer:
+    """Prepares audio for the model: mono, resampled, trimmed, 16-bit WAV
+
+    Decoding uses wave/aifc and NumPy only, so compressed formats (MP3,
+    AAC, OGG, FLAC) are passed through unchanged. Audio is never
+    upsampled, and if the result would not be smaller and nothing was
+    trimmed the original is kept.
+    """
+
+    mime_type = 'audio/wav'
+
+    def __init__(self, sample_rate=16000, trim_silence=True, silence_db=-45.0, max_seconds=0):
+        self.sample_rate = sample_rate
+        self.trim_silence = trim_silence
+        self.silence_db = silence_db
+        self.max_seconds = max_seconds
+
+    @property
+    def variant_key(self):
+        """Identifies the settings, so cached variants are redone when they change"""
+        trim = f"t{int(-self.silence_db)}" if self.trim_silence else 'n'
+        return f"aud{self.sample_rate}{trim}m{self.max_seconds}"
+
+    def supports(self, mime_type):
+        if mime_type in ('audio/aiff', 'audio/x-aiff') and aifc is None:
+            return False
+        return mime_type in DECODABLE_MIME_TYPES
+
+    def __call__(self, data, mime_type):
+        """Returns (data, mime_type, info)"""
+        samples, rate, channels = decode(data)
+        original_seconds = len(samples) / rate
+
+        samples = samples.mean(axis=1) if channels > 1 else samples[:, 0]
+        target_rate = min(rate, self.sample_rate)
+        if target_rate != rate:
+            samples = resample(samples, rate, target_rate)
+
+        trimmed = 0
+        if self.trim_silence:
+            before = len(samples)
+            samples = trim_silence(samples, target_rate, self.silence_db)
+            trimmed = before - len(samples)
+        if self.max_seconds and len(samples) > self.max_seconds * target_rate:
+            trimmed += len(samples) - int(self.max_seconds * target_rate)
+            samples = samples[:int(self.max_seconds * target_rate)]
+
+        processed = encode_wav(samples, target_rate)
+        if len(processed) >= len(data) and not trimmed:
+            processed, final_mime = data, mime_type
+        else:
+            final_mime = self.mime_type
+
+        info = {
+            'original_bytes': len(data),
+            'model_bytes': len(processed),
+            'bytes_saved': len(data) - len(processed),
+            'original_seconds': round(original_seconds, 2),
+            'model_seconds': round(len(samples) / target_rate, 2),
+            'original_format': f"{channels}ch {rate}Hz",
+            'model_format': f"1ch {target_rate}Hz",
+        }
+        return processed, final_mime, info
+
+
+def decode(data):
+    """PCM WAV/AIFF bytes -> (float32 samples of shape (frames, channels), rate, channels)"""
+    if data[:4] == b'RIFF':
+        reader, byteorder = wave.open(io.BytesIO(data), 'rb'), '<'
+    elif data[:4] == b'FORM' and aifc is not None:
+        reader = aifc.open(io.BytesIO(data), 'rb')
+        # 'sowt' is little-endian PCM; plain AIFF is big-endian
+        byteorder = '<' if reader.getcomptype() == b'sowt' else '>'
+    else:
+        raise ValueError('Unsupported audio container')
+    with reader:
+        channels = reader.getnchannels()
+        width = reader.getsampwidth()
+        rate = reader.getframerate()
+        frames = reader.readframes(reader.getnframes())
+
+    if width == 1:
+        # 8-bit WAV is unsigned, 8-bit AIFF is signed
+        dtype = np.uint8 if byteorder == '<' else np.int8
+        samples = np.frombuffer(frames, dtype=dtype).astype(np.float32)
+        if dtype is np.uint8:
+            samples -= 128
+        samples /= 128
+    elif width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        if byteorder == '>':
+            raw = raw[:, ::-1]
+        # Place the 24-bit sample in the top bytes of an int32 to keep the sign
+        padded = np.zeros((len(raw), 4), dtype=np.uint8)
+        padded[:, 1:] = raw
+        samples = padded.view('<i4')[:, 0].astype(np.float32) / 2 ** 31
+    elif width in (2, 4):
+        samples = np.frombuffer(frames, dtype=f"{byteorder}i{width}").astype(np.float32) / 2 ** (8 * width - 1)
+    else:
+        raise ValueError(f'Unsupported sample width: {width}')
+    return samples.reshape(-1, channels), rate, channels
+
+
+def resample(samples, rate, target_rate):
+    """Band-limited resampling by truncating the spectrum (no aliasing on downsampling)"""
+    out_length = int(round(len(samples) * target_rate / rate))
+    if out_length == 0:
+        return samples[:0]
+    spectrum = np.fft.rfft(samples)
+    spectrum = spectrum[:out_length // 2 + 1]
+    return (np.fft.irfft(spectrum, out_length) * (out_length / len(samples))).astype(np.float32)
+
+
+def trim_silence(samples, rate, silence_db):
+    """Drop leading and trailing frames quieter than silence_db below the peak"""
+    frame = max(1, int(rate * SILENCE_FRAME_SECONDS))
+    usable = len(samples) // frame * frame
+    if usable == 0:
+        return samples
+    rms = np.sqrt(np.mean(samples[:usable].reshape(-1, frame) ** 2, axis=1))
+    peak = rms.max()
+    if peak == 0:
+        return samples
+    loud = np.nonzero(rms >= peak * 10 ** (silence_db / 20))[0]
+    padding = int(rate * SILENCE_PADDING_SECONDS)
+    start = max(0, loud[0] * frame - padding)
+    end = min(len(samples), (loud[-1] + 1) * frame + padding)
+    return samples[start:end]
+
+
+def encode_wav(samples, rate):
+    """Mono float samples -> 16-bit PCM WAV bytes"""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2')
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(rate)
+        writer.writeframes(pcm.tobytes())
+    return out.getvalue()
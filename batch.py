@@ -0,0 +1,256 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import List, Optional
+
+QUEUED, RUNNING, DONE, ERROR = 'queued', 'running', 'done', 'error'
+
+CSV_COLUMNS = ['index', 'filename', 'sha256', 'status', 'hazard_detected', 'hazard_terms',
+               'duration_ms', 'cached', 'error', 'response']
+
+
+@dataclass(slots=True)
+class BatchJob:
+    index: int
+    filename: str
+    sha256: str
+    status: str = QUEUED
+    hazard_detected: bool = False
+    hazard_terms: List[str] = field(default_factory=list)
+    response: Optional[str] = None
+    error: Optional[str] = None
+    cached: bool = False
+    duration_ms: Optional[int] = None
+
+
+@dataclass(slots=True)
+class Batch:
+    batch_id: str
+    created: float
+    jobs: List[BatchJob]
+    owner_pid: int = 0
+    updated: float = 0.0
+
+    def progress(self):
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, ERROR: 0}
+        for job in self.jobs:
+            counts[job.status] += 1
+        finished = counts[DONE] + counts[ERROR]
+        return {
+            'batch_id': self.batch_id,
+            'status': 'complete' if finished == len(self.jobs) else 'running',
+            'total': len(self.jobs),
+            'completed': finished,
+            'counts': counts,
+            'hazards_found': sum(1 for job in self.jobs if job.hazard_detected),
+            'created': self.created,
+            'updated': self.updated,
+        }
+
+    def to_dict(self, include_responses=True):
+        data = self.progress()
+        jobs = []
+        for job in self.jobs:
+            job_data = asdict(job)
+            if not include_responses:
+                job_data.pop('response')
+            jobs.append(job_data)
+        data['jobs'] = jobs
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            batch_id=data['batch_id'],
+            created=data['created'],
+            jobs=[BatchJob(**job) for job in data['jobs']],
+            owner_pid=data.get('owner_pid', 0),
+            updated=data.get('updated', 0.0),
+        )
+
+
+class BatchManager:
+    """Runs batch inspection jobs on a bounded thread pool
+
+    Throughput is set by max_workers (per gunicorn worker), independent of
+    the HTTP threads: the request that submits a batch returns immediately.
+    State is snapshotted to disk after every job so any worker can answer
+    status and result requests. Snapshots are written at most every
+    persist_interval seconds while jobs finish, and always when the batch
+    completes, so large batches are not rewritten once per job.
+    """
+
+    def __init__(self, state_folder, analyze, max_workers=4, on_finished=None, persist_interval=1.0,
+                 stale_after=900.0):
+        # analyze(record) -> {'response', 'hazard_terms', 'cached'}
+        # on_finished(batch, records) runs once, after the last job
+        self.state_folder = state_folder
+        self.analyze = analyze
+        self.max_workers = max_workers
+        self.on_finished = on_finished
+        self.persist_interval = persist_interval
+        self.stale_after = stale_after
+        self._batches = {}
+        self._persisted = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._persist_lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        os.makedirs(state_folder, exist_ok=True)
+
+    def _pool(self):
+        # Created lazily so each forked worker gets its own threads
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='batch')
+                self._executor_pid = os.getpid()
+                self._batches = {}
+                self._pending = {}
+                self._persisted = {}
+            return self._executor
+
+    def submit(self, files, batch_id=None):
+        """Queue (filename, file_record) pairs; returns the new Batch"""
+        pool = self._pool()
+        batch = Batch(
+            batch_id=batch_id or os.urandom(8).hex(),
+            created=time.time(),
+            jobs=[BatchJob(index=i, filename=name, sha256=record.sha256) for i, (name, record) in enumerate(files)],
+            owner_pid=os.getpid(),
+            updated=time.time(),
+        )
+        with self._lock:
+            self._batches[batch.batch_id] = batch
+            self._pending[batch.batch_id] = [len(files), [record for _, record in files]]
+        self._persist(batch)
+        for job, (_, record) in zip(batch.jobs, files):
+            pool.submit(self._run, batch, job, record)
+        return batch
+
+    def _run(self, batch, job, record):
+        job.status = RUNNING
+        started = time.perf_counter()
+        try:
+            result = self.analyze(record)
+            job.response = result['response']
+            job.hazard_terms = result.get('hazard_terms', [])
+            job.hazard_detected = bool(job.hazard_terms)
+            job.cached = result.get('cached', False)
+            job.status = DONE
+        except Exception as e:
+            print(f"Batch job error ({job.filename}): {e}")
+            job.error = str(e)
+            job.status = ERROR
+        finally:
+            job.duration_ms = int((time.perf_counter() - started) * 1000)
+            batch.updated = time.time()
+            self._job_finished(batch)
+
+    def _job_finished(self, batch):
+        now = time.monotonic()
+        with self._lock:
+            pending = self._pending[batch.batch_id]
+            pending[0] -= 1
+            finished = pending[0] == 0
+            due = finished or now - self._persisted.get(batch.batch_id, 0.0) >= self.persist_interval
+            if due:
+                self._persisted[batch.batch_id] = now
+        if due:
+            self._persist(batch)
+        if not finished:
+            return
+        with self._lock:
+            del self._pending[batch.batch_id]
+            self._persisted.pop(batch.batch_id, None)
+            # Finished batches are answered from their (final) snapshot
+            self._batches.pop(batch.batch_id, None)
+        if self.on_finished:
+            self.on_finished(batch, pending[1])
+
+    def pending_files(self):
+        """(batch_id, file records) of every unfinished batch in this worker"""
+        with self._lock:
+            return [(batch_id, list(pending[1])) for batch_id, pending in self._pending.items()]
+
+    def _path(self, batch_id):
+        return os.path.join(self.state_folder, f"{batch_id}.json")
+
+    def _persist(self, batch):
+        # Serialized so an older snapshot can never replace a newer one
+        with self._persist_lock:
+            with self._lock:
+                data = batch.to_dict()
+            data['owner_pid'] = batch.owner_pid
+            fd, tmp_path = tempfile.mkstemp(dir=self.state_folder, prefix='.batch-')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self._path(batch.batch_id))
+
+    def get(self, batch_id):
+        """Live batch if it runs in this worker, otherwise the latest snapshot"""
+        with self._lock:
+            batch = self._batches.get(batch_id)
+        if batch is not None:
+            return batch
+        try:
+            with open(self._path(batch_id)) as f:
+                return Batch.from_dict(json.load(f))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def orphaned(self, batch):
+        """Whether an unfinished batch will never finish: the worker running it
+        has exited, or it has not progressed for stale_after seconds"""
+        if batch.progress()['status'] == 'complete':
+            return False
+        with self._lock:
+            if batch.batch_id in self._batches:
+                return False
+        if self.stale_after and time.time() - batch.updated > self.stale_after:
+            return True
+        if batch.owner_pid == os.getpid():
+            # Created by this worker but no longer running in it
+            return True
+        if not batch.owner_pid:
+            return False
+        try:
+            os.kill(batch.owner_pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+
+    def stats(self):
+        with self._lock:
+            running = [b for b in self._batches.values() if b.progress()['status'] == 'running']
+            return {
+                'max_workers': self.max_workers,
+                'batches_running': len(running),
+                'jobs_pending': sum(b.progress()['counts'][QUEUED] for b in running),
+            }
+
+
+def results_csv(batch):
+    """Yield the batch results as CSV, one row at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate(0)
+    for job in batch.jobs:
+        writer.writerow([
+            job.index, job.filename, job.sha256, job.status, job.hazard_detected,
+            ';'.join(job.hazard_terms), job.duration_ms, job.cached, job.error or '', job.response or ''
+        ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
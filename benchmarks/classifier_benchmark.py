@@ -0,0 +1,94 @@
+"""Accuracy and speed of text_classifier against the old substring scans
+
+Run from the repository root:
+
+    python benchmarks/classifier_benchmark.py [iterations]
+
+Checks every entry of classifier_corpus.json (exit status 1 on any
+mismatch) and times both implementations per message and per response.
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import text_classifier
+from fake_model import SENTENCES
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'classifier_corpus.json')
+
+LEGACY_HAZARD_KEYWORDS = [
+    'hazard', 'hazards', 'risk', 'risks', 'danger', 'dangerous',
+    'broken', 'damaged', 'crack', 'cracked', 'defect', 'defective',
+    'unsafe', 'malfunction', 'failure', 'fault', 'faulty',
+    'concern', 'issue', 'problem', 'warning', 'alert'
+]
+
+
+def legacy_is_acknowledgment(message):
+    """The check chat() used before text_classifier"""
+    normalized_message = message.lower().strip().replace("'", "").replace(",", "").replace(".", "")
+    return (
+        normalized_message in text_classifier.ACKNOWLEDGMENTS or
+        (len(normalized_message.split()) <= 3 and any(ack in normalized_message for ack in text_classifier.ACKNOWLEDGMENTS))
+    ) and not any(question_word in normalized_message for question_word in text_classifier.QUESTION_WORDS)
+
+
+def legacy_has_hazard(response):
+    return any(keyword in response.lower() for keyword in LEGACY_HAZARD_KEYWORDS)
+
+
+def check(corpus):
+    failures = []
+    legacy_errors = 0
+    for entry in corpus['messages']:
+        result = text_classifier.is_acknowledgment(entry['text'])
+        if result != entry['is_acknowledgment']:
+            failures.append(f"message {entry['text']!r}: got {result}, expected {entry['is_acknowledgment']}")
+        legacy_errors += legacy_is_acknowledgment(entry['text']) != entry['is_acknowledgment']
+    for entry in corpus['responses']:
+        terms = text_classifier.hazard_terms(entry['text'])
+        if terms != entry['hazards']:
+            failures.append(f"response {entry['text']!r}: got {terms}, expected {entry['hazards']}")
+        scanned = text_classifier.scan(entry['text']).terms(text_classifier.HAZARD)
+        if scanned != terms:
+            failures.append(f"response {entry['text']!r}: scan() found {scanned}, hazard_terms() {terms}")
+        legacy_errors += legacy_has_hazard(entry['text']) != bool(entry['hazards'])
+    total = len(corpus['messages']) + len(corpus['responses'])
+    print(f"corpus: {total} entries, {len(failures)} classifier mismatches, {legacy_errors} legacy misclassifications")
+    for failure in failures:
+        print(f"  FAIL {failure}")
+    return not failures
+
+
+def bench(label, func, texts, iterations):
+    seconds = timeit.timeit(lambda: [func(text) for text in texts], number=iterations)
+    per_call_us = seconds / (iterations * len(texts)) * 1e6
+    print(f"{label:<34} {per_call_us:8.2f} us/call")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with open(CORPUS_PATH) as f:
+        corpus = json.load(f)
+    ok = check(corpus)
+
+    messages = [entry['text'] for entry in corpus['messages']]
+    # Model responses are usually a few hundred words
+    responses = [' '.join([entry['text']] * 20) for entry in corpus['responses']]
+    bench('message: legacy substring scans', legacy_is_acknowledgment, messages, iterations)
+    bench('message: text_classifier', text_classifier.is_acknowledgment, messages, iterations)
+    # The corpus repeats near misses ("tissue", "asterisk") far more often than real responses do
+    typical = [' '.join(SENTENCES * 2), ' '.join([s for s in SENTENCES if not text_classifier.hazard_terms(s)] * 4)]
+    bench('response: legacy substring scans', legacy_has_hazard, responses, iterations // 10)
+    bench('response: text_classifier', text_classifier.hazard_terms, responses, iterations // 10)
+    bench('typical responses: legacy', legacy_has_hazard, typical, iterations // 10)
+    bench('typical responses: text_classifier', text_classifier.hazard_terms, typical, iterations // 10)
+    bench('response: full scan with positions', lambda t: text_classifier.scan(t).hazard_report(), responses, iterations // 10)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
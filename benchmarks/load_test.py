@@ -0,0 +1,391 @@
+"""Latency, throughput and memory of the app under load, without the real model
+
+Run from the repository root:
+
+    python benchmarks/load_test.py [--scenario inspection] [--concurrency 16] [--sessions 200]
+
+Starts gunicorn with the repository's gunicorn_config.py (GUNICORN_* and
+other settings are taken from the environment, --workers/--threads
+override them) in a scratch directory, with MODEL_BACKEND=fake so model
+calls go to fake_model.FakeGenerativeModel. Each virtual user runs the
+scenario's steps for one session after another until --sessions sessions
+are done. Prints p50/p95/p99 per step, requests per second and the RSS of
+every gunicorn worker, sampled while the test runs. With more than one
+worker, set SESSION_BACKEND=sqlite so a session's turns share state.
+
+--json writes the report; --baseline compares against an earlier report
+and exits with status 1 if any step's p95 or the overall RPS is worse by
+more than --tolerance. --url drives a server that is already running
+(RSS is then not sampled).
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from io import BytesIO
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from model_client import percentile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FOLLOWUPS = [
+    "What should be fixed first?",
+    "How urgent is this, and who should handle it?",
+    "Look again at the top left corner of the image, is anything damaged there?",
+    "Summarize the findings for the maintenance report.",
+]
+
+# Steps each virtual user runs per session, in order
+SCENARIOS = {
+    'inspection': ['init', 'upload', 'analyze', 'followup', 'followup', 'acknowledgment', 'export_pdf', 'clear'],
+    'chat': ['init', 'upload', 'analyze', 'followup', 'followup', 'followup', 'followup', 'acknowledgment', 'clear'],
+    'upload': ['init', 'upload', 'upload', 'upload', 'clear'],
+    'export': ['init', 'upload', 'analyze', 'followup', 'export_pdf', 'export_pdf', 'clear'],
+}
+
+
+def make_images(count, edge, seed):
+    """Distinct JPEGs (noise over a gradient), so uploads are not all deduplicated"""
+    rng = random.Random(seed)
+    images = []
+    for _ in range(count):
+        base = Image.linear_gradient('L').resize((edge, edge)).convert('RGB')
+        noise = Image.effect_noise((edge, edge), rng.uniform(20, 80)).convert('RGB')
+        image = Image.blend(base, noise, 0.5)
+        out = BytesIO()
+        image.save(out, format='JPEG', quality=90)
+        images.append(out.getvalue())
+    return images
+
+
+class Recorder:
+    """Latency samples and error counts per step, shared by all virtual users"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def add(self, step, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(step, []).append(seconds * 1000)
+            if not ok:
+                self.errors[step] = self.errors.get(step, 0) + 1
+
+    def summary(self):
+        steps = {}
+        with self._lock:
+            for step, samples in self.samples.items():
+                ordered = sorted(samples)
+                steps[step] = {
+                    'count': len(ordered),
+                    'errors': self.errors.get(step, 0),
+                    'p50_ms': round(percentile(ordered, 50), 1),
+                    'p95_ms': round(percentile(ordered, 95), 1),
+                    'p99_ms': round(percentile(ordered, 99), 1),
+                    'mean_ms': round(sum(ordered) / len(ordered), 1),
+                }
+        return steps
+
+
+class VirtualUser:
+    """Runs scenario sessions over one keep-alive connection"""
+
+    def __init__(self, host, port, recorder, images, bypass_cache):
+        self.host = host
+        self.port = port
+        self.recorder = recorder
+        self.images = images
+        self.bypass_cache = bypass_cache
+        self.connection = http.client.HTTPConnection(host, port, timeout=300)
+        self.session_id = None
+        self.followups = 0
+
+    def request(self, step, method, path, body=None, headers=None):
+        started = time.perf_counter()
+        ok = False
+        try:
+            self.connection.request(method, path, body=body, headers=headers or {})
+            response = self.connection.getresponse()
+            data = response.read()
+            ok = response.status < 400
+            if ok and response.getheader('Content-Type', '').startswith('application/json'):
+                payload = json.loads(data)
+                ok = isinstance(payload, list) or not payload.get('error')
+        except (OSError, http.client.HTTPException, ValueError):
+            # Reconnect on the next request
+            self.connection.close()
+        self.recorder.add(step, time.perf_counter() - started, ok)
+
+    def post_json(self, step, path, payload):
+        self.request(step, 'POST', path, json.dumps(payload), {'Content-Type': 'application/json'})
+
+    def chat(self, step, message):
+        self.post_json(step, '/chat', {
+            'session_id': self.session_id, 'message': message, 'bypass_cache': self.bypass_cache
+        })
+
+    def run_session(self, steps):
+        self.session_id = f"bench-{uuid.uuid4().hex[:12]}"
+        self.followups = 0
+        for step in steps:
+            getattr(self, f"step_{step}")()
+
+    def step_init(self):
+        self.post_json('init', '/init_session', {'session_id': self.session_id})
+
+    def step_upload(self):
+        boundary = uuid.uuid4().hex
+        image = random.choice(self.images)
+        body = (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"session_id\"\r\n\r\n{self.session_id}\r\n"
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"files\"; filename=\"inspection.jpg\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n"
+        ).encode('utf-8') + image + f"\r\n--{boundary}--\r\n".encode('utf-8')
+        self.request('upload', 'POST', '/upload', body, {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+
+    def step_analyze(self):
+        self.chat('analyze', "Analyze this image for safety hazards.")
+
+    def step_followup(self):
+        self.chat('followup', FOLLOWUPS[self.followups % len(FOLLOWUPS)])
+        self.followups += 1
+
+    def step_acknowledgment(self):
+        self.chat('acknowledgment', "thanks")
+
+    def step_export_pdf(self):
+        self.post_json('export_pdf', '/export/pdf', {'session_id': self.session_id})
+
+    def step_clear(self):
+        self.post_json('clear', '/clear', {'session_id': self.session_id})
+
+
+class RssSampler(threading.Thread):
+    """Samples the RSS of a gunicorn master's worker processes from /proc"""
+
+    def __init__(self, master_pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.master_pid = master_pid
+        self.interval = interval
+        self.workers = {}
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            self.sample()
+            self._done.wait(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        self.sample()
+
+    def sample(self):
+        try:
+            with open(f"/proc/{self.master_pid}/task/{self.master_pid}/children") as f:
+                pids = [int(pid) for pid in f.read().split()]
+        except OSError:
+            return
+        for pid in pids:
+            rss = read_rss_mb(pid)
+            if rss is None:
+                continue
+            worker = self.workers.setdefault(pid, {'pid': pid, 'start_mb': rss, 'peak_mb': rss, 'end_mb': rss})
+            worker['peak_mb'] = max(worker['peak_mb'], rss)
+            worker['end_mb'] = rss
+
+
+def read_rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, workdir):
+    """Start gunicorn with the repo's config; returns (process, port)"""
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(port),
+        'MODEL_BACKEND': 'fake',
+        'PYTHONPATH': os.pathsep.join(filter(None, [REPO_ROOT, env.get('PYTHONPATH')])),
+        'FAKE_MODEL_LATENCY_MS': str(args.latency_ms),
+        'FAKE_MODEL_LATENCY_SIGMA': str(args.latency_sigma),
+        'FAKE_MODEL_RESPONSE_CHARS': str(args.response_chars),
+        'FAKE_MODEL_ERROR_RATE': str(args.error_rate),
+    })
+    if args.workers:
+        env['GUNICORN_WORKERS'] = str(args.workers)
+    if args.threads:
+        env['GUNICORN_THREADS'] = str(args.threads)
+    log = open(os.path.join(workdir, 'gunicorn.log'), 'wb')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(REPO_ROOT, 'gunicorn_config.py'), 'app:app'],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}, see {log.name}")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/stats/sessions')
+            if connection.getresponse().status == 200:
+                return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"gunicorn did not start within 60s, see {log.name}")
+
+
+def run_load(host, port, args):
+    recorder = Recorder()
+    images = make_images(args.images, args.image_edge, args.seed)
+    steps = SCENARIOS[args.scenario]
+    remaining = [args.sessions]
+    remaining_lock = threading.Lock()
+
+    def virtual_user():
+        user = VirtualUser(host, port, recorder, images, args.bypass_cache)
+        while True:
+            with remaining_lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            user.run_session(steps)
+
+    threads = [threading.Thread(target=virtual_user) for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder, time.perf_counter() - started
+
+
+def print_report(report):
+    print(f"\nscenario {report['scenario']}: {report['sessions']} sessions, "
+          f"concurrency {report['concurrency']}, fake model {report['latency_ms']} ms")
+    print(f"{'step':<16}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for step, s in report['steps'].items():
+        print(f"{step:<16}{s['count']:>7}{s['errors']:>8}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}{s['mean_ms']:>10}")
+    print(f"\n{report['requests']} requests in {report['elapsed_s']} s: {report['rps']} req/s, "
+          f"{report['sessions_per_s']} sessions/s")
+    if report['workers']:
+        print(f"\n{'worker pid':<12}{'start MB':>10}{'peak MB':>10}{'end MB':>10}")
+        for w in report['workers']:
+            print(f"{w['pid']:<12}{w['start_mb']:>10}{w['peak_mb']:>10}{w['end_mb']:>10}")
+
+
+def compare(report, baseline, tolerance):
+    """Regressions against a baseline report (empty if none)"""
+    regressions = []
+    for step, s in report['steps'].items():
+        base = baseline.get('steps', {}).get(step)
+        if base and base['p95_ms'] and s['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{step}: p95 {s['p95_ms']} ms vs {base['p95_ms']} ms")
+    if baseline.get('rps') and report['rps'] < baseline['rps'] * (1 - tolerance):
+        regressions.append(f"throughput: {report['rps']} req/s vs {baseline['rps']} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='inspection')
+    parser.add_argument('--concurrency', type=int, default=16, help='virtual users')
+    parser.add_argument('--sessions', type=int, default=100, help='scenario runs in total')
+    parser.add_argument('--url', help='drive this server instead of starting gunicorn')
+    parser.add_argument('--workers', type=int, help='GUNICORN_WORKERS for the started server')
+    parser.add_argument('--threads', type=int, help='GUNICORN_THREADS for the started server')
+    parser.add_argument('--latency-ms', type=float, default=800.0, help='median fake model latency')
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='log-normal spread of the latency')
+    parser.add_argument('--response-chars', type=int, default=1200)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of model calls that fail')
+    parser.add_argument('--images', type=int, default=20, help='distinct images to upload')
+    parser.add_argument('--image-edge', type=int, default=1024)
+    parser.add_argument('--bypass-cache', action='store_true', help='skip the analysis cache')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write the report here')
+    parser.add_argument('--baseline', help='report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before failing')
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    process = sampler = workdir = None
+    try:
+        if args.url:
+            parts = urlsplit(args.url)
+            host, port = parts.hostname, parts.port or 80
+        else:
+            workdir = tempfile.mkdtemp(prefix='load-test-')
+            process, port = start_server(args, workdir)
+            host = '127.0.0.1'
+            sampler = RssSampler(process.pid)
+            sampler.start()
+        recorder, elapsed = run_load(host, port, args)
+    finally:
+        if sampler:
+            sampler.stop()
+        if process:
+            process.terminate()
+            process.wait(timeout=30)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    steps = recorder.summary()
+    requests = sum(s['count'] for s in steps.values())
+    report = {
+        'scenario': args.scenario,
+        'sessions': args.sessions,
+        'concurrency': args.concurrency,
+        'latency_ms': args.latency_ms,
+        'steps': steps,
+        'requests': requests,
+        'elapsed_s': round(elapsed, 2),
+        'rps': round(requests / elapsed, 1),
+        'sessions_per_s': round(args.sessions / elapsed, 2),
+        'workers': sorted(sampler.workers.values(), key=lambda w: w['pid']) if sampler else [],
+    }
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    failed = any(s['errors'] for s in steps.values()) and not args.error_rate
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
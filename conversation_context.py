@@ -0,0 +1,165 @@
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import List
+
+from text_classifier import KeywordClassifier, HAZARDS
+
+# Roughly four characters per token for English text
+CHARS_PER_TOKEN = 4
+
+# Gemini bills an image as a fixed number of tokens; audio at ~32 tokens/s,
+# i.e. about 1 token per 1000 bytes of 16 kHz 16-bit PCM
+IMAGE_TOKENS = 258
+AUDIO_BYTES_PER_TOKEN = 1000
+
+# Words that mean the question needs the file itself, not the earlier analysis
+FILE_REFERENCE_WORDS = [
+    'image', 'picture', 'photo', 'pic', 'file', 'audio', 'recording', 'sound', 'clip',
+    'look', 'see', 'visible', 'show', 'zoom', 'corner', 'top', 'bottom',
+    'background', 'foreground', 'color', 'colour', 'listen', 'hear', 'noise',
+    'again', 'reanalyze', 'closer', 'detail', 'details', 'exactly'
+]
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+_MARKDOWN = re.compile(r'[*#`]+')
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN if text else 0
+
+
+def part_tokens(part):
+    """Approximate prompt tokens for an inline_data part"""
+    inline = part.get('inline_data', {})
+    if inline.get('mime_type', '').startswith('audio/'):
+        return len(inline.get('data', '')) * 3 // 4 // AUDIO_BYTES_PER_TOKEN
+    return IMAGE_TOKENS
+
+
+def _first_sentences(text, limit):
+    sentences = _SENTENCE_END.split(' '.join(_MARKDOWN.sub('', text).split()))
+    out = ''
+    for sentence in sentences:
+        if out and len(out) + len(sentence) > limit:
+            break
+        out = f"{out} {sentence}".strip()
+    return out[:limit]
+
+
+@dataclass(slots=True)
+class ContextPlan:
+    """What goes into the prompt for one turn"""
+    summary: str
+    history: List = field(default_factory=list)
+    attach_file: bool = True
+    history_tokens: int = 0
+
+
+class ContextBuilder:
+    """Packs conversation history into a token budget
+
+    The newest messages are kept verbatim while they fit; older ones are
+    folded into a rolling summary on the session one at a time as they
+    fall out of the window, so the summary is extended incrementally and
+    never rebuilt. Each folded message contributes one line (its opening
+    sentences plus any sentence that mentions a hazard), and the oldest
+    lines are dropped once the summary exceeds its own budget.
+    """
+
+    def __init__(self, history_tokens=1500, summary_tokens=400, line_chars=240, reattach='auto'):
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.line_chars = line_chars
+        self.reattach = reattach
+        self._file_words = KeywordClassifier({'file': FILE_REFERENCE_WORDS})
+        self._hazards = HAZARDS
+        self._lock = threading.Lock()
+        self._counters = {'turns': 0, 'file_attached': 0, 'file_skipped': 0, 'messages_summarized': 0,
+                          'prompt_tokens_total': 0, 'prompt_tokens_max': 0}
+
+    def needs_file(self, record, message):
+        """Whether this turn must re-send the file rather than rely on last_analysis"""
+        if not record.files:
+            return False
+        if self.reattach == 'always' or not record.last_analysis:
+            return True
+        return bool(self._file_words.scan(message).matches)
+
+    def summarize(self, msg):
+        """One summary line for a message"""
+        role = "User" if msg.role == 'user' else "Assistant"
+        line = _first_sentences(msg.content, self.line_chars // 2 if msg.role == 'assistant' else self.line_chars)
+        if msg.role == 'assistant':
+            # Keep findings that mention hazards even if they come late in the answer
+            for sentence in _SENTENCE_END.split(' '.join(msg.content.split())):
+                if len(line) >= self.line_chars:
+                    break
+                if sentence not in line and self._hazards.scan(sentence).matches:
+                    line = f"{line} {_MARKDOWN.sub('', sentence)}"
+        return f"{role}: {line[:self.line_chars]}"
+
+    def _fold(self, record, upto):
+        """Fold messages [summarized_count, upto) into the rolling summary"""
+        lines = record.context_summary.split('\n') if record.context_summary else []
+        for msg in record.messages[record.summarized_count:upto]:
+            lines.append(self.summarize(msg))
+        folded = upto - record.summarized_count
+        budget = self.summary_tokens * CHARS_PER_TOKEN
+        while len(lines) > 1 and sum(len(line) + 1 for line in lines) > budget:
+            lines.pop(0)
+        record.context_summary = '\n'.join(lines)
+        record.summarized_count = upto
+        with self._lock:
+            self._counters['messages_summarized'] += folded
+
+    def plan(self, record, message):
+        """Choose the history, summary and file attachment for this turn
+
+        The record's last message is the current user message; it is not
+        part of the history.
+        """
+        previous = record.messages[:-1]
+        kept = []
+        used = 0
+        start = len(previous)
+        while start > record.summarized_count:
+            msg = previous[start - 1]
+            cost = estimate_tokens(msg.content) + 2
+            if kept and used + cost > self.history_tokens:
+                break
+            kept.append(msg)
+            used += cost
+            start -= 1
+        kept.reverse()
+        if start > record.summarized_count:
+            self._fold(record, start)
+        return ContextPlan(
+            summary=record.context_summary,
+            history=kept,
+            attach_file=self.needs_file(record, message),
+            history_tokens=used
+        )
+
+    def record_turn(self, record, plan, prompt_tokens, file_tokens):
+        """Count and log the size of the prompt that was sent"""
+        with self._lock:
+            self._counters['turns'] += 1
+            if record.files:
+                self._counters['file_attached' if plan.attach_file else 'file_skipped'] += 1
+            self._counters['prompt_tokens_total'] += prompt_tokens + file_tokens
+            self._counters['prompt_tokens_max'] = max(self._counters['prompt_tokens_max'], prompt_tokens + file_tokens)
+        if plan.attach_file:
+            file_note = f"file {file_tokens}"
+        else:
+            file_note = 'file reused from analysis' if record.files else 'no file'
+        print(f"Prompt for {record.session_id}: ~{prompt_tokens + file_tokens} tokens "
+              f"(text {prompt_tokens}, history {len(plan.history)} msgs/{plan.history_tokens}, "
+              f"summary {estimate_tokens(plan.summary)}, {file_note})")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats['prompt_tokens_avg'] = round(stats['prompt_tokens_total'] / stats['turns'], 1) if stats['turns'] else 0.0
+        stats.update({'history_budget': self.history_tokens, 'summary_budget': self.summary_tokens, 'reattach': self.reattach})
+        return stats
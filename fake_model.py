@@ -0,0 +1,93 @@
+import os
+import random
+import threading
+import time
+
+# Sentences the fake answers are built from; some mention hazards so the
+# ticket button logic runs as it does with real analyses
+SENTENCES = [
+    "The image shows a metal bracket mounted on a concrete wall.",
+    "There is a visible crack along the lower weld seam.",
+    "Surface corrosion is present on the left edge.",
+    "The fasteners appear intact and correctly torqued.",
+    "No immediate safety hazard is visible in this area.",
+    "The paint coating is worn near the mounting holes.",
+    "A loose cable runs across the walkway, which is a trip risk.",
+    "Lighting is adequate and the labels are legible.",
+    "The component looks damaged and should be inspected by a technician.",
+    "Overall condition is fair; schedule a follow-up inspection.",
+]
+
+
+class FakeModelError(Exception):
+    """Injected failure; looks like a 503 so the client retries it"""
+
+    status_code = 503
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Local stand-in for gen_ai_hub's GenerativeModel, for benchmarks
+
+    Latency is log-normal around latency_ms (sigma is the spread of the
+    underlying normal), responses are about response_chars long and
+    error_rate of the calls fail with a retryable error. Streaming returns
+    the text in stream_chunks pieces with the latency spread between them.
+    """
+
+    def __init__(self, latency_ms=800.0, latency_sigma=0.5, response_chars=1200, error_rate=0.0,
+                 stream_chunks=8, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.response_chars = response_chars
+        self.error_rate = error_rate
+        self.stream_chunks = max(1, stream_chunks)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        seed = os.getenv('FAKE_MODEL_SEED')
+        return cls(
+            latency_ms=float(os.getenv('FAKE_MODEL_LATENCY_MS', '800')),
+            latency_sigma=float(os.getenv('FAKE_MODEL_LATENCY_SIGMA', '0.5')),
+            response_chars=int(os.getenv('FAKE_MODEL_RESPONSE_CHARS', '1200')),
+            error_rate=float(os.getenv('FAKE_MODEL_ERROR_RATE', '0')),
+            stream_chunks=int(os.getenv('FAKE_MODEL_STREAM_CHUNKS', '8')),
+            seed=int(seed) if seed else None
+        )
+
+    def _draw(self):
+        """(latency in seconds, fails?, response text) for one call"""
+        with self._lock:
+            latency = self.latency_ms / 1000 * self._random.lognormvariate(0, self.latency_sigma)
+            fails = self._random.random() < self.error_rate
+            start = self._random.randrange(len(SENTENCES))
+        sentences = []
+        length = 0
+        while length < self.response_chars:
+            sentence = SENTENCES[(start + len(sentences)) % len(SENTENCES)]
+            sentences.append(sentence)
+            length += len(sentence) + 1
+        return latency, fails, ' '.join(sentences)[:max(self.response_chars, 1)]
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        latency, fails, text = self._draw()
+        if stream:
+            return self._stream(latency, fails, text)
+        time.sleep(latency)
+        if fails:
+            raise FakeModelError('Injected model failure')
+        return FakeResponse(text)
+
+    def _stream(self, latency, fails, text):
+        step = -(-len(text) // self.stream_chunks)
+        for i in range(0, len(text), step):
+            time.sleep(latency / self.stream_chunks)
+            if fails:
+                raise FakeModelError('Injected model failure')
+            yield FakeResponse(text[i:i + step])
@@ -0,0 +1,279 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, asdict
+from datetime import datetime, date, timedelta
+from typing import Optional
+
+RATINGS = (1, 2, 3, 4, 5)
+
+EXPORT_CHUNK = 1000
+MAX_ROLLING_DAYS = 90
+
+CSV_COLUMNS = ['feedback_id', 'created', 'session_id', 'rating', 'file_type', 'file_name', 'comment']
+
+
+def normalize_rating(rating):
+    """The rating as an int from RATINGS, or None when missing or out of range"""
+    try:
+        value = int(rating)
+    except (TypeError, ValueError):
+        return None
+    return value if value in RATINGS else None
+
+
+@dataclass(slots=True)
+class Feedback:
+    feedback_id: int
+    created_at: float
+    session_id: str
+    rating: Optional[int] = None
+    comment: str = ''
+    file_type: Optional[str] = None
+    file_name: Optional[str] = None
+
+    def to_dict(self):
+        data = asdict(self)
+        data['created'] = datetime.fromtimestamp(self.created_at).isoformat()
+        return data
+
+
+class FeedbackStore:
+    """Feedback from every session in a SQLite (WAL) database shared by all workers
+
+    Each insert updates the aggregate tables (totals, rating histogram, per
+    day and per file type counts and rating sums) in the same transaction,
+    so summary reads touch a handful of rows however much feedback has been
+    stored. Exports read in id-ordered chunks and are streamed row by row.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = {'submitted': 0, 'exported': 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+
+    def _connection(self):
+        # Connections are per thread and re-opened after fork (preload_app)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=10000')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        self._connection().executescript("""
+            CREATE TABLE IF NOT EXISTS feedback (
+                feedback_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                session_id TEXT NOT NULL,
+                rating INTEGER,
+                comment TEXT NOT NULL,
+                file_type TEXT,
+                file_name TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_feedback_session ON feedback (session_id, feedback_id);
+            CREATE INDEX IF NOT EXISTS idx_feedback_created ON feedback (created_at);
+            CREATE TABLE IF NOT EXISTS feedback_totals (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                count INTEGER NOT NULL,
+                rated INTEGER NOT NULL,
+                rating_sum INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS feedback_by_rating (
+                rating INTEGER PRIMARY KEY,
+                count INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS feedback_by_day (
+                day TEXT PRIMARY KEY,
+                count INTEGER NOT NULL,
+                rated INTEGER NOT NULL,
+                rating_sum INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS feedback_by_file_type (
+                file_type TEXT PRIMARY KEY,
+                count INTEGER NOT NULL,
+                rated INTEGER NOT NULL,
+                rating_sum INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO feedback_totals (id, count, rated, rating_sum) VALUES (1, 0, 0, 0);
+        """)
+
+    def add(self, session_id, rating=None, comment='', file_type=None, file_name=None):
+        now = time.time()
+        rating = normalize_rating(rating)
+        rated = 0 if rating is None else 1
+        score = rating or 0
+        conn = self._connection()
+        # One write transaction for the row and its aggregates, so readers
+        # never see a row the aggregates don't count (or the reverse)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = conn.execute(
+                'INSERT INTO feedback (created_at, session_id, rating, comment, file_type, file_name) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (now, session_id, rating, comment or '', file_type, file_name)
+            )
+            conn.execute(
+                'UPDATE feedback_totals SET count = count + 1, rated = rated + ?, rating_sum = rating_sum + ? '
+                'WHERE id = 1', (rated, score)
+            )
+            if rating is not None:
+                conn.execute(
+                    'INSERT INTO feedback_by_rating (rating, count) VALUES (?, 1) '
+                    'ON CONFLICT (rating) DO UPDATE SET count = count + 1', (rating,)
+                )
+            conn.execute(
+                'INSERT INTO feedback_by_day (day, count, rated, rating_sum) VALUES (?, 1, ?, ?) '
+                'ON CONFLICT (day) DO UPDATE SET count = count + 1, rated = rated + excluded.rated, '
+                'rating_sum = rating_sum + excluded.rating_sum',
+                (date.fromtimestamp(now).isoformat(), rated, score)
+            )
+            conn.execute(
+                'INSERT INTO feedback_by_file_type (file_type, count, rated, rating_sum) VALUES (?, 1, ?, ?) '
+                'ON CONFLICT (file_type) DO UPDATE SET count = count + 1, rated = rated + excluded.rated, '
+                'rating_sum = rating_sum + excluded.rating_sum',
+                (file_type or 'none', rated, score)
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        with self._lock:
+            self._counters['submitted'] += 1
+        return Feedback(cursor.lastrowid, now, session_id, rating, comment or '', file_type, file_name)
+
+    def summary(self, days=7):
+        """Totals, rating histogram, per file type averages and the last days' daily averages
+
+        Reads only the aggregate tables: constant work for any number of
+        stored entries (days is capped at MAX_ROLLING_DAYS).
+        """
+        days = max(1, min(days, MAX_ROLLING_DAYS))
+        conn = self._connection()
+        # One read transaction, so the tables come from the same snapshot
+        conn.execute('BEGIN')
+        try:
+            return self._summary(conn, days)
+        finally:
+            conn.execute('COMMIT')
+
+    def _summary(self, conn, days):
+        count, rated, rating_sum = conn.execute(
+            'SELECT count, rated, rating_sum FROM feedback_totals WHERE id = 1'
+        ).fetchone()
+        histogram = {str(rating): 0 for rating in RATINGS}
+        for rating, n in conn.execute('SELECT rating, count FROM feedback_by_rating'):
+            histogram[str(rating)] = n
+        file_types = {
+            file_type: {'count': n, 'rated': r, 'average': _average(s, r)}
+            for file_type, n, r, s in conn.execute(
+                'SELECT file_type, count, rated, rating_sum FROM feedback_by_file_type ORDER BY count DESC'
+            )
+        }
+        first_day = date.today() - timedelta(days=days - 1)
+        rows = {
+            day: (n, r, s) for day, n, r, s in conn.execute(
+                'SELECT day, count, rated, rating_sum FROM feedback_by_day WHERE day >= ?',
+                (first_day.isoformat(),)
+            )
+        }
+        daily = []
+        window_rated = window_sum = 0
+        for offset in range(days):
+            day = (first_day + timedelta(days=offset)).isoformat()
+            n, r, s = rows.get(day, (0, 0, 0))
+            window_rated += r
+            window_sum += s
+            daily.append({'day': day, 'count': n, 'rated': r, 'average': _average(s, r)})
+        return {
+            'count': count,
+            'rated': rated,
+            'average': _average(rating_sum, rated),
+            'histogram': histogram,
+            'file_types': file_types,
+            'daily': daily,
+            'rolling_average': _average(window_sum, window_rated),
+            'rolling_days': days
+        }
+
+    def _where(self, session_id, since, until):
+        clauses, params = [], []
+        if session_id:
+            clauses.append('session_id = ?')
+            params.append(session_id)
+        if since is not None:
+            clauses.append('created_at >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('created_at < ?')
+            params.append(until)
+        return clauses, params
+
+    def iter_feedback(self, session_id=None, since=None, until=None):
+        """Every matching entry, oldest first, read EXPORT_CHUNK rows at a time"""
+        clauses, params = self._where(session_id, since, until)
+        last = 0
+        while True:
+            where = ' AND '.join(clauses + ['feedback_id > ?'])
+            rows = self._connection().execute(
+                'SELECT feedback_id, created_at, session_id, rating, comment, file_type, file_name '
+                f'FROM feedback WHERE {where} ORDER BY feedback_id LIMIT ?', (*params, last, EXPORT_CHUNK)
+            ).fetchall()
+            for row in rows:
+                yield Feedback(*row)
+            with self._lock:
+                self._counters['exported'] += len(rows)
+            if len(rows) < EXPORT_CHUNK:
+                return
+            last = rows[-1][0]
+
+    def export_ndjson(self, **filters):
+        for entry in self.iter_feedback(**filters):
+            yield json.dumps(entry.to_dict()) + '\n'
+
+    def export_csv(self, **filters):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+        yield buffer.getvalue()
+        for entry in self.iter_feedback(**filters):
+            buffer.seek(0)
+            buffer.truncate()
+            data = entry.to_dict()
+            writer.writerow([data[column] for column in CSV_COLUMNS])
+            yield buffer.getvalue()
+
+    def stats(self):
+        conn = self._connection()
+        with self._lock:
+            stats = dict(self._counters)
+        stats['entries'] = conn.execute('SELECT count FROM feedback_totals WHERE id = 1').fetchone()[0]
+        stats['bytes'] = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return stats
+
+
+def session_feedback_csv(entries):
+    """CSV of one session's FeedbackEntry list (the /export/feedback download)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['Timestamp', 'Rating', 'Comment'])
+    for entry in entries:
+        writer.writerow([entry.timestamp, '' if entry.rating is None else entry.rating, entry.comment])
+    return buffer.getvalue()
+
+
+def _average(total, count):
+    return round(total / count, 3) if count else None
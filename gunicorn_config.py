@@ -1,14 +1,35 @@
 import os
+import shutil
 
 workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
 threads = int(os.environ.get('GUNICORN_THREADS', '4'))
 timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
 bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
-worker_class = 'sync'
-worker_connections = 1000
+# 'sync' (threads bound concurrency) or 'gevent' (cooperative; model calls are
+# bounded by MODEL_MAX_IN_FLIGHT instead of the thread count)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '1000'))
 max_requests = 1000
 max_requests_jitter = 50
 preload_app = True
 accesslog = '-'
 errorlog = '-'
 loglevel = 'info'
+
+if worker_class == 'gevent':
+    # Patch before the app is preloaded so the model client's sockets yield
+    from gevent import monkey
+    monkey.patch_all()
+
+# Workers write Prometheus samples here and /metrics merges them. A directory
+# set from outside must be emptied by whoever sets it before each start.
+if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = os.path.join('data', 'metrics')
+    shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's live gauges; its counters and histograms are kept
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
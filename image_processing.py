@@ -0,0 +1,79 @@
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+FORMAT_MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp', 'PNG': 'image/png'}
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'WEBP': '.webp', 'PNG': '.png'}
+
+
+class ImageNormalizer:
+    """Prepares images for the model: EXIF orientation, downscale, re-encode
+
+    Re-encoding drops EXIF/XMP/ICC metadata. If the result would not be
+    smaller and no rotation or resize was needed, the original is kept.
+    """
+
+    def __init__(self, max_edge=1568, image_format='JPEG', quality=85):
+        self.max_edge = max_edge
+        self.image_format = image_format.upper()
+        self.quality = quality
+        self.mime_type = FORMAT_MIME_TYPES[self.image_format]
+        self.extension = FORMAT_EXTENSIONS[self.image_format]
+
+    @property
+    def variant_key(self):
+        """Identifies the settings, so cached variants are redone when they change"""
+        return f"img{self.max_edge}{self.image_format.lower()}q{self.quality}"
+
+    def scaled(self, max_edge):
+        """Same settings with a smaller edge (fitting an image to a size budget)"""
+        return ImageNormalizer(max_edge, self.image_format, self.quality)
+
+    def __call__(self, data, mime_type):
+        """Returns (data, mime_type, info)"""
+        with Image.open(BytesIO(data)) as original:
+            original_size = original.size
+            had_orientation = original.getexif().get(0x0112, 1) != 1
+            image = ImageOps.exif_transpose(original)
+            if image is None:
+                image = original
+
+            resized = max(image.size) > self.max_edge
+            if resized:
+                image = image.copy()
+                image.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS)
+
+            if self.image_format == 'JPEG' and image.mode != 'RGB':
+                image = self._flatten(image)
+
+            out = BytesIO()
+            save_options = {'optimize': True}
+            if self.image_format in ('JPEG', 'WEBP'):
+                save_options['quality'] = self.quality
+            image.save(out, format=self.image_format, **save_options)
+            processed = out.getvalue()
+            final_size = image.size
+
+        if len(processed) >= len(data) and not resized and not had_orientation:
+            processed, final_mime = data, mime_type
+        else:
+            final_mime = self.mime_type
+
+        info = {
+            'original_bytes': len(data),
+            'model_bytes': len(processed),
+            'bytes_saved': len(data) - len(processed),
+            'original_dimensions': list(original_size),
+            'model_dimensions': list(final_size),
+        }
+        return processed, final_mime, info
+
+    @staticmethod
+    def _flatten(image):
+        """Convert to RGB, compositing any transparency onto white"""
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            rgba = image.convert('RGBA')
+            background = Image.new('RGB', rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.split()[-1])
+            return background
+        return image.convert('RGB')
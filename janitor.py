@@ -0,0 +1,131 @@
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+class Janitor:
+    """Periodically sweeps idle sessions and garbage-collects uploads
+
+    Every worker sweeps its own sessions (the memory backend is per
+    process). Upload collection touches the shared folder, so only the
+    worker holding an exclusive lock on lock_path runs it; the lock is held
+    for the worker's lifetime and passes to another worker when it exits.
+    The last collection report is written to report_path so any worker can
+    serve it.
+
+    on_tick() runs in every worker before each sweep, e.g. to refresh upload
+    references held by work that outlives ref_ttl (long batches).
+    """
+
+    def __init__(self, sessions, upload_store, interval=300, ref_ttl=3600, quota_bytes=0,
+                 lock_path='data/janitor.lock', report_path='data/janitor.json', on_tick=None):
+        self.sessions = sessions
+        self.upload_store = upload_store
+        self.interval = interval
+        self.ref_ttl = ref_ttl
+        self.quota_bytes = quota_bytes
+        self.lock_path = lock_path
+        self.report_path = report_path
+        self.on_tick = on_tick
+        self._lock = threading.Lock()
+        self._thread_pid = None
+        self._lock_file = None
+        self._counters = {'runs': 0, 'sessions_swept': 0, 'errors': 0}
+        os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+
+    def ensure_started(self):
+        """Start the sweep thread in this process (cheap once it is running)"""
+        if self.interval <= 0 or self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            # Started after fork so each worker gets its own thread
+            self._thread_pid = os.getpid()
+            self._lock_file = None
+            self._counters = {'runs': 0, 'sessions_swept': 0, 'errors': 0}
+            threading.Thread(target=self._loop, name='janitor', daemon=True).start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception as e:
+                self._counters['errors'] += 1
+                print(f"Janitor error: {e}")
+
+    @property
+    def leader(self):
+        """Whether this worker currently collects uploads"""
+        return self._lock_file is not None and self._thread_pid == os.getpid()
+
+    def is_leader(self):
+        """Try to take (or confirm) the cross-worker collection lock"""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        print(f"Janitor: worker {os.getpid()} is collecting uploads")
+        return True
+
+    def run_once(self):
+        """One sweep; returns the upload report if this worker collected"""
+        if self.on_tick:
+            self.on_tick()
+        swept = self.sessions.sweep()
+        self._counters['runs'] += 1
+        self._counters['sessions_swept'] += swept
+        if not self.is_leader():
+            return None
+
+        started = time.monotonic()
+        report = self.upload_store.collect(self.ref_ttl, self.quota_bytes)
+        report.update({
+            'finished': time.time(),
+            'duration_ms': round((time.monotonic() - started) * 1000, 1),
+            'sessions_swept': swept,
+            'quota_bytes': self.quota_bytes,
+            'pid': os.getpid(),
+        })
+        self._write_report(report)
+        if report['bytes_reclaimed'] or report['refs_expired']:
+            print(f"Janitor reclaimed {report['bytes_reclaimed'] / 1024 / 1024:.1f} MB "
+                  f"({report['blobs_deleted']} expired, {report['quota_evicted']} over quota, "
+                  f"{report['refs_expired']} refs, {report['temp_files']} temp files); "
+                  f"uploads now {report['disk_bytes'] / 1024 / 1024:.1f} MB")
+        if report['quota_in_use']:
+            print(f"Janitor: uploads exceed the quota but {report['quota_in_use']} files are still in use")
+        return report
+
+    def _write_report(self, report):
+        folder = os.path.dirname(self.report_path) or '.'
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.janitor-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(report, f)
+        os.replace(tmp_path, self.report_path)
+
+    def last_report(self):
+        try:
+            with open(self.report_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def stats(self):
+        return {
+            **self._counters,
+            'interval': self.interval,
+            'ref_ttl': self.ref_ttl,
+            'quota_bytes': self.quota_bytes,
+            'leader': self.leader,
+            'last_collection': self.last_report(),
+        }
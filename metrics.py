@@ -0,0 +1,122 @@
+import os
+import time
+from contextlib import contextmanager
+
+from flask import g, request
+import tracing
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+# Under gunicorn every worker writes its samples to files in
+# PROMETHEUS_MULTIPROC_DIR (set in gunicorn_config.py) and /metrics merges
+# them, so a scrape sees the whole server whichever worker answers it.
+# Without the variable (flask run) the default in-process registry is used.
+
+# Seconds; model calls and PDF builds run far longer than plain routes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# 1 KB to 64 MB in steps of 4x
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(9))
+
+REQUEST_SECONDS = Histogram(
+    'app_request_duration_seconds', 'Request latency until the response body has been sent',
+    ['route', 'method', 'status'], buckets=LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    'app_stage_duration_seconds', 'Time spent in one stage of request handling',
+    ['stage'], buckets=LATENCY_BUCKETS
+)
+MODEL_SECONDS = Histogram(
+    'app_model_call_duration_seconds', 'Model call latency including retries',
+    ['mode', 'outcome'], buckets=LATENCY_BUCKETS
+)
+MODEL_ERRORS = Counter('app_model_errors_total', 'Failed model attempts and rejected calls', ['kind'])
+PROMPT_TEXT_BYTES = Histogram('app_prompt_text_bytes', 'Text sent to the model per chat turn', buckets=SIZE_BUCKETS)
+PROMPT_INLINE_BYTES = Histogram(
+    'app_prompt_inline_data_bytes', 'Base64 file data sent to the model per chat turn', buckets=SIZE_BUCKETS
+)
+CHAT_TURNS = Counter(
+    'app_chat_turns_total', 'Chat turns by kind (acknowledgment, analysis or offer) and what answered them',
+    ['kind', 'source']
+)
+SESSIONS_ACTIVE = Gauge(
+    'app_sessions_active', 'Sessions currently stored (workers refresh it every janitor interval)',
+    multiprocess_mode='livesum'
+)
+UPLOAD_FOLDER_BYTES = Gauge(
+    'app_upload_folder_bytes', 'Bytes used by uploads and their model variants', multiprocess_mode='livemax'
+)
+TICKETS_CREATED = Counter('app_tickets_created_total', 'Quality inspection tickets created by severity', ['severity'])
+FEEDBACK_SUBMITTED = Counter('app_feedback_submitted_total', 'Feedback submissions by rating', ['rating'])
+
+RATINGS = {'1', '2', '3', '4', '5'}
+
+
+def instrument(app):
+    """Time every request by its route template (/batch/<batch_id>, not the id)"""
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        histogram = REQUEST_SECONDS.labels(route, request.method, str(response.status_code))
+        # Runs when the WSGI server closes the body, so streams are timed to the end
+        response.call_on_close(lambda: histogram.observe(time.perf_counter() - started))
+        return response
+
+
+@contextmanager
+def stage(name):
+    """Time a stage for the stage histogram and the request's trace"""
+    started = time.perf_counter()
+    try:
+        with tracing.span(name):
+            yield
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+
+def observe_model_call(mode, seconds, outcome):
+    MODEL_SECONDS.labels(mode, outcome).observe(seconds)
+
+
+def count_model_error(kind):
+    MODEL_ERRORS.labels(kind).inc()
+
+
+def observe_prompt(parts):
+    """Record the text and inline-data sizes of a prompt's parts"""
+    text_bytes = 0
+    inline_bytes = 0
+    for part in parts:
+        if 'text' in part:
+            text_bytes += len(part['text'].encode('utf-8'))
+        else:
+            inline_bytes += len(part.get('inline_data', {}).get('data', ''))
+    PROMPT_TEXT_BYTES.observe(text_bytes)
+    PROMPT_INLINE_BYTES.observe(inline_bytes)
+
+
+def count_chat_turn(kind, source):
+    CHAT_TURNS.labels(kind, source).inc()
+
+
+def count_feedback(rating):
+    FEEDBACK_SUBMITTED.labels(str(rating) if str(rating) in RATINGS else 'other').inc()
+
+
+def render():
+    """(body, content type) of the Prometheus text exposition"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
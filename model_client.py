@@ -0,0 +1,414 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed
+
+# Recent call latencies kept for the percentile stats
+LATENCY_SAMPLES = 1024
+
+
+class ModelBusyError(Exception):
+    """Raised when no in-flight slot frees up within the queue timeout"""
+
+
+class BoundedModelClient:
+    """Wraps a GenerativeModel and bounds the number of concurrent calls
+
+    Concurrency is limited by max_in_flight rather than by worker threads,
+    so it also holds under the gevent worker where each request is a
+    greenlet (threading primitives are cooperative once monkey-patched).
+    """
+
+    def __init__(self, model, max_in_flight=64, acquire_timeout=30.0):
+        self.model = model
+        self.max_in_flight = max_in_flight
+        self.acquire_timeout = acquire_timeout
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._lock:
+                self._rejected += 1
+            raise ModelBusyError(f'All {self.max_in_flight} model slots are busy')
+        with self._lock:
+            self._in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        if stream:
+            return self._stream(contents, **kwargs)
+        self._acquire()
+        try:
+            return self.model.generate_content(contents, **kwargs)
+        finally:
+            self._release()
+
+    def _stream(self, contents, **kwargs):
+        # The slot is taken on first iteration and held until the last chunk
+        self._acquire()
+        try:
+            for chunk in self.model.generate_content(contents, stream=True, **kwargs):
+                yield chunk
+        finally:
+            self._release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': self._in_flight,
+                'max_in_flight': self.max_in_flight,
+                'rejected': self._rejected,
+            }
+
+
+class ModelUnavailableError(Exception):
+    """Raised when the model cannot be initialized or the circuit is open"""
+
+
+def is_transient(error):
+    """Whether a failed model call is worth retrying (timeouts, 408/429/5xx)"""
+    if isinstance(error, (ModelBusyError, ModelUnavailableError)):
+        return False
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is None and isinstance(getattr(error, 'code', None), int):
+        status = error.code
+    if isinstance(status, int):
+        return status in (408, 429) or status >= 500
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    name = type(error).__name__
+    return any(marker in name for marker in _TRANSIENT_NAMES)
+
+
+# Exception class names used by the HTTP/gRPC clients for retryable failures
+_TRANSIENT_NAMES = (
+    'Timeout', 'Connection', 'ServiceUnavailable', 'TooManyRequests',
+    'ResourceExhausted', 'InternalServerError', 'DeadlineExceeded', 'RemoteProtocol'
+)
+
+
+class CircuitBreaker:
+    """Fails fast after repeated transient failures
+
+    Closed until failure_threshold consecutive failures, then open for
+    reset_timeout seconds; after that one probe call is let through
+    (half-open) and its outcome closes or re-opens the circuit. A probe
+    that ends without either outcome (permanent error, abandoned stream)
+    must be released; one still out after reset_timeout is replaced.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+        self._counters = {'opened': 0, 'short_circuited': 0}
+
+    def allow(self):
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and (not self._probing or now - self._probe_started >= self.reset_timeout):
+                self._probing = True
+                self._probe_started = now
+                return True
+            self._counters['short_circuited'] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self._failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+                self._counters['opened'] += 1
+
+    def release(self):
+        """End a call let through by allow() that neither succeeded nor failed transiently
+
+        In half-open state the next call becomes the probe; no-op otherwise.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+
+    def retry_after(self):
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self._failures,
+                **self._counters,
+            }
+
+
+class ResilientModelClient(BoundedModelClient):
+    """Bounded model client that is created lazily in each worker process
+
+    factory() builds the GenerativeModel (and its proxy client) on first
+    use after fork, so preloaded gunicorn workers never share the master's
+    connections; the instance and its HTTP connection pool are then reused
+    by every thread of the worker. Transient failures are retried with
+    jittered exponential backoff, slow calls can be hedged with a second
+    request after hedge_after seconds, and a circuit breaker fails fast
+    while the backend is down.
+
+    on_call(mode, seconds, outcome) is called after every call ('generate'
+    or 'stream', 'success' or 'error') and on_error(kind) for every failed
+    attempt or rejected call, e.g. to export metrics.
+    """
+
+    def __init__(self, factory, max_in_flight=64, acquire_timeout=30.0, retries=2,
+                 backoff_base=0.5, backoff_max=8.0, hedge_after=0.0, breaker=None,
+                 on_call=None, on_error=None):
+        super().__init__(None, max_in_flight=max_in_flight, acquire_timeout=acquire_timeout)
+        self.factory = factory
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self.on_call = on_call
+        self.on_error = on_error
+        self._model_pid = None
+        self._init_lock = threading.Lock()
+        self._executor = None
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._counters = {
+            'initializations': 0, 'init_failures': 0, 'calls': 0, 'successes': 0,
+            'transient_errors': 0, 'permanent_errors': 0, 'retries': 0,
+            'hedges': 0, 'hedge_wins': 0, 'latency_total_ms': 0.0, 'latency_max_ms': 0.0,
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _get_model(self):
+        pid = os.getpid()
+        if self.model is not None and self._model_pid == pid:
+            return self.model
+        with self._init_lock:
+            if self.model is None or self._model_pid != pid:
+                if not self.breaker.allow():
+                    raise ModelUnavailableError('Model backend is unavailable (circuit open)')
+                try:
+                    model = self.factory()
+                except BaseException:
+                    # A factory that raises must not leave the half-open probe taken
+                    self.breaker.release()
+                    raise
+                if model is None:
+                    self._count('init_failures')
+                    self._notify_error('init_failure')
+                    self.breaker.record_failure()
+                    raise ModelUnavailableError('Model could not be initialized')
+                self.breaker.record_success()
+                self.model = model
+                self._model_pid = pid
+                self._executor = None
+                self._count('initializations')
+        return self.model
+
+    def _backoff(self, attempt):
+        # Full jitter: spreads retries from many callers over the whole window
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _record_latency(self, started, mode, outcome):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._latencies.append(elapsed_ms)
+            self._counters['latency_total_ms'] += elapsed_ms
+            self._counters['latency_max_ms'] = max(self._counters['latency_max_ms'], elapsed_ms)
+        if self.on_call:
+            self.on_call(mode, elapsed_ms / 1000, outcome)
+
+    def _notify_error(self, kind):
+        if self.on_error:
+            self.on_error(kind)
+
+    def _record_error(self, error):
+        if is_transient(error):
+            self._count('transient_errors')
+            self._notify_error('transient')
+            self.breaker.record_failure()
+            return True
+        self._count('permanent_errors')
+        self._notify_error('busy' if isinstance(error, ModelBusyError) else 'permanent')
+        return False
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            self._notify_error('circuit_open')
+            raise ModelUnavailableError(
+                f'Model backend is unavailable (circuit open, retry in {self.breaker.retry_after():.0f}s)'
+            )
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        if stream:
+            return self._stream(contents, **kwargs)
+        model = self._get_model()
+        self._count('calls')
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            for attempt in range(self.retries + 1):
+                self._check_breaker()
+                try:
+                    if self.hedge_after > 0:
+                        response = self._hedged_call(model, contents, kwargs)
+                    else:
+                        response = self._call(model, contents, kwargs)
+                except Exception as e:
+                    if not self._record_error(e) or attempt == self.retries:
+                        raise
+                    self._count('retries')
+                    time.sleep(self._backoff(attempt))
+                    continue
+                else:
+                    self.breaker.record_success()
+                    self._count('successes')
+                    outcome = 'success'
+                    return response
+                finally:
+                    # Every exit path resolves a half-open probe (no-op once recorded)
+                    self.breaker.release()
+        finally:
+            self._record_latency(started, 'generate', outcome)
+
+    def _call(self, model, contents, kwargs, blocking=True):
+        if blocking:
+            self._acquire()
+        elif self._slots.acquire(blocking=False):
+            with self._lock:
+                self._in_flight += 1
+        else:
+            raise ModelBusyError('No free model slot for a hedged request')
+        try:
+            return model.generate_content(contents, **kwargs)
+        finally:
+            self._release()
+
+    def _pool(self):
+        with self._init_lock:
+            if self._executor is None:
+                # Threads are created on demand; the slots bound real concurrency
+                self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight * 2, thread_name_prefix='model')
+            return self._executor
+
+    def _hedged_call(self, model, contents, kwargs):
+        pool = self._pool()
+        primary = pool.submit(self._call, model, contents, kwargs)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+        # The hedge only runs if a slot is free right now, so it never queues
+        hedge = pool.submit(self._call, model, contents, kwargs, False)
+        error = None
+        for future in as_completed([primary, hedge]):
+            try:
+                result = future.result()
+            except ModelBusyError:
+                if future is primary:
+                    raise
+                continue
+            except Exception as e:
+                error = error or e
+                continue
+            if future is hedge:
+                self._count('hedge_wins')
+            return result
+        raise error
+
+    def _stream(self, contents, **kwargs):
+        # Retries are only possible until the first chunk has been relayed
+        model = self._get_model()
+        self._count('calls')
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            for attempt in range(self.retries + 1):
+                self._check_breaker()
+                relayed = acquired = False
+                try:
+                    # Inside the try: a busy rejection must also give back a half-open probe
+                    self._acquire()
+                    acquired = True
+                    for chunk in model.generate_content(contents, stream=True, **kwargs):
+                        relayed = True
+                        yield chunk
+                except Exception as e:
+                    if not self._record_error(e) or relayed or attempt == self.retries:
+                        raise
+                    self._count('retries')
+                else:
+                    self.breaker.record_success()
+                    self._count('successes')
+                    outcome = 'success'
+                    return
+                finally:
+                    # Also reached when the client disconnects (GeneratorExit)
+                    if acquired:
+                        self._release()
+                    self.breaker.release()
+                time.sleep(self._backoff(attempt))
+        finally:
+            self._record_latency(started, 'stream', outcome)
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats.update(self._counters)
+            latencies = sorted(self._latencies)
+        stats['initialized'] = self.model is not None and self._model_pid == os.getpid()
+        stats['latency_avg_ms'] = round(stats['latency_total_ms'] / stats['calls'], 1) if stats['calls'] else 0.0
+        stats['latency_p50_ms'] = round(percentile(latencies, 50), 1)
+        stats['latency_p95_ms'] = round(percentile(latencies, 95), 1)
+        stats['latency_p99_ms'] = round(percentile(latencies, 99), 1)
+        stats['latency_total_ms'] = round(stats['latency_total_ms'], 1)
+        stats['latency_max_ms'] = round(stats['latency_max_ms'], 1)
+        stats['breaker'] = self.breaker.stats()
+        return stats
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list (0.0 if empty)"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
@@ -0,0 +1,268 @@
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageOps
+
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+
+# Multi-index hashing: the 64-bit hash is split into m chunks, each with
+# its own table. Two hashes within distance d agree to within d // m bits
+# on at least one chunk (pigeonhole), so a query only probes the chunk
+# values that close to its own in every table. m grows with the threshold
+# so that d // m stays at most 1: a handful of probes per table.
+MIN_CHUNKS = 4
+MAX_DISTANCE = 12
+
+# Bits set in each byte value (np.bitwise_count needs NumPy 2)
+_BYTE_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def dhash(data):
+    """64-bit difference hash of an image: one bit per horizontally adjacent pixel pair
+
+    The image is reduced to 9x8 grey pixels and each bit says whether a
+    pixel is brighter than its right neighbour, so re-encoding, resizing
+    and small changes of exposure or framing flip only a few bits.
+    """
+    with Image.open(BytesIO(data)) as image:
+        # JPEG decodes at 1/2..1/8 scale directly: no full-size decode for a 9x8 thumbnail
+        image.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+        image = ImageOps.exif_transpose(image) or image
+        pixels = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS).tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def _popcount(values):
+    """Bits set in each uint64"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return _BYTE_POPCOUNT[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def _chunks_for(threshold):
+    """(shift, mask) of each chunk for an index searched up to threshold bits"""
+    count = max(MIN_CHUNKS, threshold // 2 + 1)
+    bounds = [HASH_BITS * i // count for i in range(count + 1)]
+    return [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+
+
+def _masks_within(mask, radius):
+    """Every value under mask with at most radius bits set"""
+    return [value for value in range(mask + 1) if value.bit_count() <= radius]
+
+
+@dataclass(slots=True)
+class Match:
+    sha256: str
+    distance: int
+    analysis: str
+    file_name: Optional[str]
+    created_at: float
+
+    @property
+    def similarity(self):
+        return round(100 * (1 - self.distance / HASH_BITS), 1)
+
+    def to_dict(self):
+        return {
+            'id': self.sha256,
+            'distance': self.distance,
+            'similarity': self.similarity,
+            'file_name': self.file_name,
+            'analysed_at': time.strftime('%Y-%m-%d %H:%M', time.localtime(self.created_at)),
+        }
+
+
+class NearDuplicateIndex:
+    """Perceptual hashes of analysed images, searchable by Hamming distance
+
+    Rows (hash, first analysis of the image) live in a SQLite (WAL)
+    database shared by all workers and survive restarts; each worker keeps
+    the hashes in memory in a multi-index hash table and picks up rows
+    added by other workers at most every refresh_interval seconds.
+    Entries older than max_age are not matched (equipment changes).
+    """
+
+    def __init__(self, path, threshold=6, max_age=86400, refresh_interval=1.0):
+        if not 0 <= threshold <= MAX_DISTANCE:
+            raise ValueError(f"threshold must be between 0 and {MAX_DISTANCE}")
+        self.path = path
+        self.threshold = threshold
+        self.max_age = max_age
+        self.refresh_interval = refresh_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Parallel arrays by position (grown by doubling); tables map a chunk value to positions
+        self._size = 0
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._created = np.zeros(0, dtype=np.float64)
+        self._rowids = np.zeros(0, dtype=np.int64)
+        self._chunks = _chunks_for(threshold)
+        self._tables = [{} for _ in self._chunks]
+        self._masks = {}
+        self._last_rowid = 0
+        self._refreshed = 0.0
+        self._pid = None
+        self._counters = {'queries': 0, 'matches': 0, 'added': 0, 'candidates': 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript("""
+            CREATE TABLE IF NOT EXISTS near_duplicates (
+                id INTEGER PRIMARY KEY,
+                sha256 TEXT NOT NULL UNIQUE,
+                phash TEXT NOT NULL,
+                file_name TEXT,
+                analysis TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+        """)
+
+    def _connection(self):
+        # Connections are per thread and re-opened after fork (preload_app)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=10000')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _refresh(self, force=False):
+        """Load rows added since the last refresh (lock held)"""
+        now = time.monotonic()
+        if not force and now - self._refreshed < self.refresh_interval:
+            return
+        self._refreshed = now
+        rows = self._connection().execute(
+            'SELECT id, phash, created_at FROM near_duplicates WHERE id > ? ORDER BY id', (self._last_rowid,)
+        ).fetchall()
+        if not rows:
+            return
+        needed = self._size + len(rows)
+        if needed > len(self._hashes):
+            capacity = max(needed, 2 * len(self._hashes), 1024)
+            for name in ('_hashes', '_created', '_rowids'):
+                old = getattr(self, name)
+                grown = np.zeros(capacity, dtype=old.dtype)
+                grown[:self._size] = old[:self._size]
+                setattr(self, name, grown)
+        for rowid, phash, created_at in rows:
+            self._insert(rowid, int(phash, 16), created_at)
+        self._last_rowid = rows[-1][0]
+
+    def _insert(self, rowid, phash, created_at):
+        position = self._size
+        self._hashes[position] = phash
+        self._created[position] = created_at
+        self._rowids[position] = rowid
+        self._size += 1
+        for (shift, mask), table in zip(self._chunks, self._tables):
+            chunk = (phash >> shift) & mask
+            bucket = table.get(chunk)
+            if bucket is None:
+                table[chunk] = array('I', (position,))
+            else:
+                bucket.append(position)
+
+    def _ensure_loaded(self):
+        # Each forked worker builds its own in-memory index from the database
+        if self._pid != os.getpid():
+            self._size = 0
+            self._tables = [{} for _ in self._chunks]
+            self._last_rowid = 0
+            self._pid = os.getpid()
+            self._refresh(force=True)
+        else:
+            self._refresh()
+
+    def add(self, phash, sha256, analysis, file_name=None):
+        """Remember the analysis of an image; the first analysis of each file is kept"""
+        cursor = self._connection().execute(
+            'INSERT OR IGNORE INTO near_duplicates (sha256, phash, file_name, analysis, created_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (sha256, f"{phash:016x}", file_name, analysis, time.time())
+        )
+        if cursor.rowcount:
+            with self._lock:
+                self._counters['added'] += 1
+                # This worker's own entries are searchable right away
+                self._refreshed = 0.0
+
+    def find(self, phash, threshold=None):
+        """Closest analysed image within threshold bits (newest on ties), or None"""
+        threshold = self.threshold if threshold is None else min(threshold, MAX_DISTANCE)
+        radius = threshold // len(self._chunks)
+        cutoff = time.time() - self.max_age if self.max_age > 0 else 0
+        with self._lock:
+            self._ensure_loaded()
+            buckets = []
+            for (shift, mask), table in zip(self._chunks, self._tables):
+                probes = self._masks.get((mask, radius))
+                if probes is None:
+                    probes = self._masks[(mask, radius)] = _masks_within(mask, radius)
+                chunk = (phash >> shift) & mask
+                for probe in probes:
+                    bucket = table.get(chunk ^ probe)
+                    if bucket:
+                        buckets.append(bucket)
+            self._counters['queries'] += 1
+            if not buckets:
+                return None
+            # Verify the candidates in one vectorized pass (a position may repeat across tables)
+            positions = np.concatenate([np.frombuffer(bucket, dtype=np.uint32) for bucket in buckets])
+            self._counters['candidates'] += len(positions)
+            distances = _popcount(self._hashes[positions] ^ np.uint64(phash)).astype(np.int64)
+            distances[self._created[positions] < cutoff] = HASH_BITS + 1
+            best_distance = int(distances.min())
+            if best_distance > threshold:
+                return None
+            best = int(positions[distances == best_distance].max())
+            self._counters['matches'] += 1
+            rowid = int(self._rowids[best])
+        row = self._connection().execute(
+            'SELECT sha256, file_name, analysis, created_at FROM near_duplicates WHERE id = ?', (rowid,)
+        ).fetchone()
+        sha256, file_name, analysis, created_at = row
+        return Match(sha256, best_distance, analysis, file_name, created_at)
+
+    def get(self, sha256, phash):
+        """The stored analysis of sha256 if it is within threshold of phash, else None"""
+        row = self._connection().execute(
+            'SELECT phash, file_name, analysis, created_at FROM near_duplicates WHERE sha256 = ?', (sha256,)
+        ).fetchone()
+        if row is None:
+            return None
+        distance = (int(row[0], 16) ^ phash).bit_count()
+        if distance > self.threshold:
+            return None
+        # Same cutoff as find(): an expired entry cannot be reused either
+        if self.max_age > 0 and row[3] < time.time() - self.max_age:
+            return None
+        return Match(sha256, distance, row[2], row[1], row[3])
+
+    def stats(self):
+        with self._lock:
+            self._ensure_loaded()
+            stats = dict(self._counters)
+            stats['entries'] = self._size
+            stats['buckets'] = sum(len(table) for table in self._tables)
+            stats['tables'] = len(self._tables)
+        stats['threshold'] = self.threshold
+        stats['max_age'] = self.max_age
+        return stats
@@ -0,0 +1,257 @@
+import html
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image as PILImage
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image
+
+# Styles are immutable once built, so one set serves every export
+_styles = getSampleStyleSheet()
+
+TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_styles['Heading1'],
+    fontSize=16,
+    textColor='#2c3e50',
+    spaceAfter=30
+)
+
+USER_STYLE = ParagraphStyle(
+    'UserMessage',
+    parent=_styles['Normal'],
+    fontSize=11,
+    textColor='#2980b9',
+    leftIndent=20,
+    spaceAfter=10,
+    fontName='Helvetica-Bold'
+)
+
+BOT_STYLE = ParagraphStyle(
+    'BotMessage',
+    parent=_styles['Normal'],
+    fontSize=10,
+    textColor='#34495e',
+    leftIndent=20,
+    spaceAfter=15
+)
+
+CAPTION_STYLE = ParagraphStyle(
+    'Caption',
+    parent=_styles['Normal'],
+    fontSize=9,
+    textColor='#7f8c8d',
+    spaceAfter=20
+)
+
+THUMBNAIL_EDGE = 3 * inch
+
+
+def thumbnail(data, max_pixels=600):
+    """(JPEG bytes, (width, height)) thumbnail of an image, or None if it cannot be decoded"""
+    try:
+        with PILImage.open(BytesIO(data)) as image:
+            image.thumbnail((max_pixels, max_pixels))
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            out = BytesIO()
+            image.save(out, format='JPEG', quality=80)
+            return out.getvalue(), image.size
+    except Exception as e:
+        print(f"PDF thumbnail error: {e}")
+        return None
+
+
+def build_pdf(messages, image=None, image_name=None, progress=None):
+    """Render (role, content) pairs to PDF bytes, entirely in memory
+
+    image is the original bytes of the analyzed image; progress(done, total)
+    is called while the document is laid out.
+    """
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+
+    story = [
+        Paragraph("Image/Audio Assistant - Chat Export", TITLE_STYLE),
+        Spacer(1, 0.2 * inch)
+    ]
+
+    thumb = thumbnail(image) if image else None
+    if thumb:
+        data, (width, height) = thumb
+        scale = THUMBNAIL_EDGE / max(width, height)
+        story.append(Image(BytesIO(data), width=width * scale, height=height * scale))
+        if image_name:
+            story.append(Paragraph(html.escape(image_name), CAPTION_STYLE))
+
+    for role, content in messages:
+        if role == 'user':
+            story.append(Paragraph(f"<b>You:</b> {html.escape(content)}", USER_STYLE))
+        else:
+            # Clean bot response for PDF
+            story.append(Paragraph(f"<b>Assistant:</b> {html.escape(content.replace('**', ''))}", BOT_STYLE))
+
+    if progress:
+        # reportlab reports layout progress in bytes of story estimated/placed
+        total = {'size': 0}
+
+        def on_progress(kind, value):
+            if kind == 'SIZE_EST':
+                total['size'] = value
+            elif kind == 'PROGRESS' and total['size']:
+                progress(value, total['size'])
+
+        doc.setProgressCallBack(on_progress)
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def _process_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, owned by another user
+        return True
+    return True
+
+
+class PdfExportJobs:
+    """Builds PDFs for long conversations on a background thread
+
+    Progress and the finished file are written to folder, so any worker
+    can report status and serve the download. Jobs older than ttl are
+    removed when new ones are submitted.
+
+    Each status records the worker that owns the job and a heartbeat that
+    a running job refreshes at least every heartbeat_interval seconds. A
+    job whose owner has exited, or whose heartbeat is older than
+    stale_after, is reported (and recorded) as an error instead of
+    staying 'queued' or 'running' forever.
+    """
+
+    def __init__(self, folder, max_workers=2, ttl=3600, stale_after=120, heartbeat_interval=5):
+        self.folder = folder
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.stale_after = stale_after
+        self.heartbeat_interval = heartbeat_interval
+        self._host = socket.gethostname()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        os.makedirs(folder, exist_ok=True)
+
+    def _pool(self):
+        # Created lazily so each forked worker gets its own threads
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pdf-export')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _status_path(self, job_id):
+        return os.path.join(self.folder, f"{job_id}.json")
+
+    def pdf_path(self, job_id):
+        return os.path.join(self.folder, f"{job_id}.pdf")
+
+    def _write_status(self, job_id, status):
+        status['heartbeat'] = time.time()
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, prefix='.export-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(status, f)
+        os.replace(tmp_path, self._status_path(job_id))
+
+    def submit(self, filename, messages, image=None, image_name=None):
+        """Queue an export; returns the job id"""
+        self.cleanup()
+        job_id = os.urandom(8).hex()
+        status = {'job_id': job_id, 'status': 'queued', 'progress': 0.0, 'filename': filename,
+                  'messages': len(messages), 'created': time.time(), 'host': self._host, 'pid': os.getpid()}
+        self._write_status(job_id, status)
+        self._pool().submit(self._run, job_id, status, messages, image, image_name)
+        return job_id
+
+    def _run(self, job_id, status, messages, image, image_name):
+        status['status'] = 'running'
+        self._write_status(job_id, status)
+        last_written = [time.monotonic()]
+        write_lock = threading.Lock()
+        finished = threading.Event()
+
+        def progress(done, total):
+            with write_lock:
+                status['progress'] = round(min(done / total, 1.0), 3)
+                # Snapshot at most a few times per second
+                if time.monotonic() - last_written[0] > 0.25:
+                    last_written[0] = time.monotonic()
+                    self._write_status(job_id, status)
+
+        def heartbeat():
+            # Layout can go quiet for a while (e.g. a large image); keep the job visibly alive
+            while not finished.wait(self.heartbeat_interval):
+                with write_lock:
+                    if not finished.is_set() and time.monotonic() - last_written[0] > self.heartbeat_interval:
+                        last_written[0] = time.monotonic()
+                        self._write_status(job_id, status)
+
+        threading.Thread(target=heartbeat, name=f"pdf-heartbeat-{job_id}", daemon=True).start()
+        try:
+            pdf = build_pdf(messages, image, image_name, progress)
+            fd, tmp_path = tempfile.mkstemp(dir=self.folder, prefix='.export-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(pdf)
+            os.replace(tmp_path, self.pdf_path(job_id))
+            outcome = {'status': 'done', 'progress': 1.0, 'bytes': len(pdf)}
+        except Exception as e:
+            print(f"PDF export job error: {e}")
+            outcome = {'status': 'error', 'error': str(e)}
+        with write_lock:
+            finished.set()
+            status.update(outcome, finished=time.time())
+            self._write_status(job_id, status)
+
+    def get(self, job_id):
+        try:
+            with open(self._status_path(job_id)) as f:
+                status = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        error = self._stale_error(status)
+        if error:
+            print(f"PDF export job {job_id}: {error}")
+            status.update({'status': 'error', 'error': error, 'finished': time.time()})
+            self._write_status(job_id, status)
+        return status
+
+    def _stale_error(self, status):
+        """Why an unfinished job will never finish, or None"""
+        if status.get('status') not in ('queued', 'running'):
+            return None
+        if status.get('host') == self._host and not _process_alive(status.get('pid')):
+            return 'The export was interrupted (its worker exited); please export again'
+        if status['status'] == 'running' and time.time() - status.get('heartbeat', 0) > self.stale_after:
+            return 'The export stopped responding; please export again'
+        return None
+
+    def cleanup(self):
+        cutoff = time.time() - self.ttl
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
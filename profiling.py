@@ -0,0 +1,144 @@
+import cProfile
+import fcntl
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+MODES = ('cprofile', 'sample')
+
+
+class CProfileRun:
+    """Deterministic profile of the request's thread"""
+
+    suffix = '.prof'
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self, path):
+        self.profile.disable()
+        self.profile.dump_stats(path)
+
+
+class SamplingRun:
+    """Samples the request thread's stack every interval seconds
+
+    Much lower overhead than cProfile on long model waits; the output is
+    folded stacks ("outer;inner count" per line) for flame graph tools.
+    """
+
+    suffix = '.folded'
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self._done = threading.Event()
+        self._sampler = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+        self._sampler.start()
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self, path):
+        self._done.set()
+        self._sampler.join()
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RequestProfiler:
+    """Profiles the next N requests when armed, in whichever worker serves them
+
+    The armed state lives in a file under folder so arming from one worker
+    applies to all of them; each worker claims requests under a file lock.
+    Profiles are written to folder as <time>-<request id>.prof (pstats) or
+    .folded (sampled stacks).
+    """
+
+    def __init__(self, folder, sample_interval=0.005):
+        self.folder = folder
+        self.sample_interval = sample_interval
+        self.state_path = os.path.join(folder, 'armed.json')
+        os.makedirs(folder, exist_ok=True)
+
+    @contextmanager
+    def _locked(self):
+        with open(os.path.join(self.folder, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def arm(self, count, mode='cprofile', path_prefix=''):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        state = {'remaining': count, 'mode': mode, 'path_prefix': path_prefix, 'armed_at': time.time()}
+        with self._locked():
+            if count > 0:
+                with open(self.state_path, 'w') as f:
+                    json.dump(state, f)
+            elif os.path.exists(self.state_path):
+                os.remove(self.state_path)
+        return state
+
+    def start(self, path, request_id):
+        """Begin profiling this request if armed for it; returns a handle or None"""
+        # Unarmed is the common case and costs one stat()
+        if not os.path.exists(self.state_path):
+            return None
+        with self._locked():
+            state = self._read_state()
+            if not state or not path.startswith(state['path_prefix']):
+                return None
+            state['remaining'] -= 1
+            if state['remaining'] > 0:
+                with open(self.state_path, 'w') as f:
+                    json.dump(state, f)
+            else:
+                os.remove(self.state_path)
+        try:
+            run = CProfileRun() if state['mode'] == 'cprofile' else SamplingRun(self.sample_interval)
+        except ValueError as e:
+            # Another profiler is already active in this process
+            print(f"Profiler not started for {request_id}: {e}")
+            return None
+        return run, f"{time.strftime('%Y%m%d-%H%M%S')}-{request_id}{run.suffix}"
+
+    def finish(self, handle):
+        run, filename = handle
+        path = os.path.join(self.folder, filename)
+        try:
+            run.stop(path)
+            print(f"Profile written to {path}")
+        except Exception as e:
+            print(f"Profile error: {e}")
+
+    def status(self, limit=20):
+        profiles = sorted(
+            (name for name in os.listdir(self.folder) if name.endswith(('.prof', '.folded'))),
+            reverse=True
+        )
+        return {'armed': self._read_state(), 'profiles': profiles[:limit]}
@@ -0,0 +1,100 @@
+import threading
+
+# Acknowledgment phrases by the kind of canned answer they get
+ACKNOWLEDGMENT_CLASSES = {
+    'thanks': [
+        'ok', 'okay', 'okey', 'oke', 'k',
+        'nice', 'good', 'great', 'excellent', 'awesome', 'perfect', 'cool', 'fine',
+        'thanks', 'thank you', 'thankyou', 'thx', 'ty',
+        'alright', 'got it', 'understood', 'i see', 'i understand'
+    ],
+    'decline': ['no', 'nope', 'nah', 'not really', 'no thanks', 'im good', "i'm good"],
+    'affirm': ['yes', 'yeah', 'yep', 'yup', 'sure', 'of course'],
+}
+
+# The same sentences the acknowledgment prompt asks the model to choose from
+DEFAULT_REPLIES = {
+    'thanks': "You're welcome! Feel free to ask if you need anything else or upload a new file for analysis.",
+    'decline': "Understood. Feel free to upload a new file when you're ready, or let me know if you need anything else.",
+    'affirm': "What specific aspect would you like me to elaborate on?",
+}
+
+# When a message mixes classes ("ok no thanks"), the first match here wins
+CLASS_PRIORITY = ['decline', 'affirm', 'thanks']
+
+
+def normalize(message):
+    """The acknowledgment check's normalization in app.py, plus dropping '!'"""
+    return message.lower().strip().replace("'", "").replace(",", "").replace(".", "").replace("!", "")
+
+
+class AcknowledgmentResponder:
+    """Answers plain acknowledgments locally instead of asking the model
+
+    Only whole words and phrases count, so anything ambiguous returns None
+    and the caller falls back to the model. Classes missing from
+    local_classes always fall back.
+    """
+
+    def __init__(self, replies=None, local_classes=None):
+        self.replies = dict(DEFAULT_REPLIES, **(replies or {}))
+        self.local_classes = set(DEFAULT_REPLIES if local_classes is None else local_classes)
+        self._phrases = {}
+        for response_class in reversed(CLASS_PRIORITY):
+            for phrase in ACKNOWLEDGMENT_CLASSES[response_class]:
+                self._phrases[normalize(phrase)] = response_class
+        self._lock = threading.Lock()
+        self._counters = {'local': 0, 'fallback': 0, **{c: 0 for c in ACKNOWLEDGMENT_CLASSES}}
+
+    def classify(self, message):
+        """Response class of an acknowledgment, or None if it is not clearly one"""
+        normalized = normalize(message)
+        response_class = self._phrases.get(normalized)
+        if response_class:
+            return response_class
+        words = normalized.split()
+        found = set()
+        i = 0
+        while i < len(words):
+            # Prefer two-word phrases ("no thanks") over their single words
+            pair = ' '.join(words[i:i + 2])
+            if i + 1 < len(words) and pair in self._phrases:
+                found.add(self._phrases[pair])
+                i += 2
+            elif words[i] in self._phrases:
+                found.add(self._phrases[words[i]])
+                i += 1
+            else:
+                return None
+        for response_class in CLASS_PRIORITY:
+            if response_class in found:
+                return response_class
+        return None
+
+    def reply(self, message):
+        """Canned reply for the message, or None to let the model answer"""
+        response_class = self.classify(message)
+        local = response_class in self.local_classes
+        with self._lock:
+            self._counters['local' if local else 'fallback'] += 1
+            if local:
+                self._counters[response_class] += 1
+        return self.replies[response_class] if local else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counters,
+                'local_classes': sorted(self.local_classes),
+            }
+
+
+_CLASSIFIER = AcknowledgmentResponder()
+
+
+def offer_answer(message):
+    """How a typed reply answers a reuse-or-fresh offer: 'reuse' for a plain yes, else 'fresh'
+
+    A "no", a thanks or a new question all ask for the image to be analyzed.
+    """
+    return 'reuse' if _CLASSIFIER.classify(message) == 'affirm' else 'fresh'
@@ -0,0 +1,545 @@
+import os
+import socket
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from dataclasses import fields
+from datetime import datetime
+from urllib.parse import urlparse
+
+from session_store import (
+    SessionBackend, SessionConflictError, SessionStore, SessionRecord, Message, FileRecord, FeedbackEntry
+)
+
+# ---------------------------------------------------------------------------
+# Compact binary serialization
+#
+# Values are written with a one-byte tag followed by a fixed-width or
+# length-prefixed payload. Records are written as positional field lists, so
+# new dataclass fields must be appended at the end (older blobs simply decode
+# to the field defaults).
+# ---------------------------------------------------------------------------
+
+FORMAT_VERSION = 1
+COMPRESS_THRESHOLD = 512
+
+_NONE, _TRUE, _FALSE, _INT, _FLOAT, _STR, _LIST = b'N', b'T', b'F', b'i', b'f', b's', b'l'
+_HEAD_FIELDS = [f.name for f in fields(SessionRecord) if f.name not in ('session_id', 'messages', 'nbytes', 'version')]
+_NESTED_TYPES = {'files': FileRecord, 'feedback': FeedbackEntry}
+_ROLE_CODES = {'user': 0, 'assistant': 1}
+_ROLE_NAMES = {code: role for role, code in _ROLE_CODES.items()}
+
+
+def _pack(value, out):
+    if value is None:
+        out.append(_NONE)
+    elif value is True:
+        out.append(_TRUE)
+    elif value is False:
+        out.append(_FALSE)
+    elif isinstance(value, int):
+        out.append(_INT + struct.pack('<q', value))
+    elif isinstance(value, float):
+        out.append(_FLOAT + struct.pack('<d', value))
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        out.append(_STR + struct.pack('<I', len(data)) + data)
+    elif isinstance(value, (list, tuple)):
+        out.append(_LIST + struct.pack('<I', len(value)))
+        for item in value:
+            _pack(item, out)
+    elif hasattr(value, '__dataclass_fields__'):
+        _pack([getattr(value, f.name) for f in fields(value)], out)
+    else:
+        raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _unpack(data, pos):
+    tag = data[pos:pos + 1]
+    pos += 1
+    if tag == _NONE:
+        return None, pos
+    if tag == _TRUE:
+        return True, pos
+    if tag == _FALSE:
+        return False, pos
+    if tag == _INT:
+        return struct.unpack_from('<q', data, pos)[0], pos + 8
+    if tag == _FLOAT:
+        return struct.unpack_from('<d', data, pos)[0], pos + 8
+    if tag == _STR:
+        length = struct.unpack_from('<I', data, pos)[0]
+        pos += 4
+        return data[pos:pos + length].decode('utf-8'), pos + length
+    if tag == _LIST:
+        count = struct.unpack_from('<I', data, pos)[0]
+        pos += 4
+        items = []
+        for _ in range(count):
+            item, pos = _unpack(data, pos)
+            items.append(item)
+        return items, pos
+    raise ValueError(f"Corrupt session blob (tag {tag!r})")
+
+
+def _frame(body):
+    """Prefix a body with the format version and compress large payloads"""
+    if len(body) > COMPRESS_THRESHOLD:
+        return struct.pack('<BB', FORMAT_VERSION, 1) + zlib.compress(body, 6)
+    return struct.pack('<BB', FORMAT_VERSION, 0) + body
+
+
+def _unframe(blob):
+    version, compressed = struct.unpack_from('<BB', blob, 0)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported session blob version {version}")
+    body = blob[2:]
+    return zlib.decompress(body) if compressed else body
+
+
+def encode_head(record):
+    """Serialize everything except the message history"""
+    out = []
+    _pack([getattr(record, name) for name in _HEAD_FIELDS], out)
+    return _frame(b''.join(out))
+
+
+def decode_head(session_id, blob):
+    values, _ = _unpack(_unframe(blob), 0)
+    kwargs = {}
+    for name, value in zip(_HEAD_FIELDS, values):
+        if name in _NESTED_TYPES:
+            value = [_NESTED_TYPES[name](*item) for item in value]
+        kwargs[name] = value
+    return SessionRecord(session_id=session_id, **kwargs)
+
+
+def encode_message(msg):
+    out = [struct.pack('<B', _ROLE_CODES.get(msg.role, 1))]
+    _pack(msg.timestamp, out)
+    _pack(msg.content, out)
+    return _frame(b''.join(out))
+
+
+def decode_message(blob):
+    body = _unframe(blob)
+    role = _ROLE_NAMES.get(body[0], 'assistant')
+    timestamp, pos = _unpack(body, 1)
+    content, _ = _unpack(body, pos)
+    return Message(role=role, content=content, timestamp=timestamp)
+
+
+# ---------------------------------------------------------------------------
+# SQLite (WAL) backend
+# ---------------------------------------------------------------------------
+
+class SQLiteSessionBackend(SessionBackend):
+    """Session store in a SQLite database shared by all workers on a host
+
+    The head (flags, files, feedback, last analysis) is one row; every chat
+    message is its own row, so a turn only inserts the new messages. Head
+    writes only apply if the row's version is still the one loaded.
+    """
+
+    def __init__(self, path, idle_ttl=3600):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self._local = threading.local()
+        self._counters = {'created': 0, 'hits': 0, 'misses': 0, 'evicted_idle': 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+
+    def _connection(self):
+        # Connections are per thread and re-opened after fork (preload_app)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=10000')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        conn = self._connection()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                head BLOB NOT NULL,
+                last_interaction REAL NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_last_interaction
+                ON sessions (last_interaction);
+            CREATE TABLE IF NOT EXISTS session_messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                body BLOB NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            ) WITHOUT ROWID;
+        """)
+        # Databases created before head versions
+        if 'version' not in [row[1] for row in conn.execute('PRAGMA table_info(sessions)')]:
+            conn.execute('ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+
+    def _is_idle(self, last_interaction):
+        return self.idle_ttl > 0 and time.time() - last_interaction > self.idle_ttl
+
+    def get(self, session_id):
+        conn = self._connection()
+        row = conn.execute(
+            'SELECT head, last_interaction, version FROM sessions WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        if row is None:
+            self._counters['misses'] += 1
+            return None
+        record = decode_head(session_id, row[0])
+        if self._is_idle(row[1]):
+            self.delete(session_id)
+            self._counters['evicted_idle'] += 1
+            self._counters['misses'] += 1
+            self._evicted(record)
+            return None
+        record.version = row[2]
+        record.messages = [
+            decode_message(body) for (body,) in conn.execute(
+                'SELECT body FROM session_messages WHERE session_id = ? ORDER BY seq', (session_id,)
+            )
+        ]
+        self._counters['hits'] += 1
+        return record
+
+    def get_or_create(self, session_id):
+        record = self.get(session_id)
+        if record is None:
+            record = SessionRecord(session_id=session_id)
+            self._connection().execute(
+                'INSERT OR IGNORE INTO sessions (session_id, head, last_interaction) VALUES (?, ?, ?)',
+                (session_id, encode_head(record), record.last_interaction)
+            )
+            self._counters['created'] += 1
+        return record
+
+    def _write_head(self, conn, record):
+        """Write the head if its version is unchanged (or the row is gone)"""
+        head = encode_head(record)
+        updated = conn.execute(
+            'UPDATE sessions SET head = ?, last_interaction = ?, version = version + 1 '
+            'WHERE session_id = ? AND version = ?',
+            (head, record.last_interaction, record.session_id, record.version)
+        ).rowcount
+        if not updated:
+            updated = conn.execute(
+                'INSERT OR IGNORE INTO sessions (session_id, head, last_interaction, version) VALUES (?, ?, ?, ?)',
+                (record.session_id, head, record.last_interaction, record.version + 1)
+            ).rowcount
+        if not updated:
+            raise SessionConflictError(record.session_id)
+        record.version += 1
+
+    def save(self, record):
+        self._write_head(self._connection(), record)
+
+    def append_message(self, record, role, content):
+        msg = Message(role=role, content=content, timestamp=datetime.now().isoformat())
+        record.messages.append(msg)
+        self._connection().execute(
+            'INSERT INTO session_messages (session_id, seq, body) VALUES (?, '
+            '(SELECT COALESCE(MAX(seq) + 1, 0) FROM session_messages WHERE session_id = ?), ?)',
+            (record.session_id, record.session_id, encode_message(msg))
+        )
+        return msg
+
+    def clear_messages(self, record):
+        record.messages = []
+        record.context_summary = ''
+        record.summarized_count = 0
+        conn = self._connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self._write_head(conn, record)
+            conn.execute('DELETE FROM session_messages WHERE session_id = ?', (record.session_id,))
+
+    def delete(self, session_id):
+        conn = self._connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM session_messages WHERE session_id = ?', (session_id,))
+            conn.execute('DELETE FROM sessions WHERE session_id = ?', (session_id,))
+
+    def sweep(self):
+        if self.idle_ttl <= 0:
+            return 0
+        cutoff = time.time() - self.idle_ttl
+        conn = self._connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            expired = [
+                decode_head(session_id, head) for session_id, head in conn.execute(
+                    'SELECT session_id, head FROM sessions WHERE last_interaction < ?', (cutoff,)
+                )
+            ]
+            conn.execute(
+                'DELETE FROM session_messages WHERE session_id IN '
+                '(SELECT session_id FROM sessions WHERE last_interaction < ?)', (cutoff,)
+            )
+            conn.execute('DELETE FROM sessions WHERE last_interaction < ?', (cutoff,))
+        self._counters['evicted_idle'] += len(expired)
+        for record in expired:
+            self._evicted(record)
+        return len(expired)
+
+    def stats(self):
+        conn = self._connection()
+        stats = dict(self._counters)
+        stats.update({
+            'backend': 'sqlite',
+            'sessions': conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0],
+            'messages': conn.execute('SELECT COUNT(*) FROM session_messages').fetchone()[0],
+            'bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            'idle_ttl': self.idle_ttl,
+        })
+        return stats
+
+
+# ---------------------------------------------------------------------------
+# Redis-protocol backend
+# ---------------------------------------------------------------------------
+
+class RespError(Exception):
+    pass
+
+
+class RespClient:
+    """Minimal RESP2 client (works with Redis, KeyDB, Valkey or a local stand-in)"""
+
+    def __init__(self, url, timeout=5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock = sock
+        self._local.reader = sock.makefile('rb')
+        self._local.pid = os.getpid()
+        if self.password:
+            self._roundtrip([('AUTH', self.password)])
+        if self.db:
+            self._roundtrip([('SELECT', self.db)])
+
+    def _reset(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = None
+
+    @staticmethod
+    def _encode(args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, bytes):
+                data = arg
+            else:
+                data = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        return b''.join(parts)
+
+    def _read_reply(self):
+        reader = self._local.reader
+        line = reader.readline()
+        if not line:
+            raise ConnectionError('Connection closed by server')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode('utf-8')
+        if kind == b'-':
+            return RespError(payload.decode('utf-8'))
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            count = int(payload)
+            if count < 0:
+                return None
+            return [self._read_reply() for _ in range(count)]
+        raise RespError(f"Unexpected reply {line!r}")
+
+    def _roundtrip(self, commands):
+        self._local.sock.sendall(b''.join(self._encode(cmd) for cmd in commands))
+        replies = [self._read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    def _ensure_connected(self):
+        if getattr(self._local, 'sock', None) is None or self._local.pid != os.getpid():
+            self._connect()
+
+    def pipeline(self, commands):
+        """Send several commands in one round trip and return all replies"""
+        for attempt in range(2):
+            self._ensure_connected()
+            try:
+                return self._roundtrip(commands)
+            except (ConnectionError, OSError):
+                self._reset()
+                if attempt:
+                    raise
+
+    def transaction(self, key, build):
+        """Optimistic transaction: WATCH key, build(value) the commands, run them in MULTI/EXEC
+
+        build returns None to abort. Returns the EXEC replies, or None if
+        aborted or the key changed in between.
+        """
+        for attempt in range(2):
+            self._ensure_connected()
+            try:
+                _, value = self._roundtrip([('WATCH', key), ('GET', key)])
+                commands = build(value)
+                if commands is None:
+                    self._roundtrip([('UNWATCH',)])
+                    return None
+                return self._roundtrip([('MULTI',), *commands, ('EXEC',)])[-1]
+            except (ConnectionError, OSError):
+                self._reset()
+                if attempt:
+                    raise
+
+    def execute(self, *args):
+        return self.pipeline([args])[0]
+
+
+class RedisSessionBackend(SessionBackend):
+    """Session store on a Redis-protocol server shared by all workers and hosts
+
+    Each session is a head string, a head version and a message list; idle
+    expiry is left to the server through key TTLs, so on_evict is never
+    called (the janitor's ref TTL releases those sessions' uploads). Head
+    writes WATCH the version so a stale copy never overwrites a newer head.
+    """
+
+    def __init__(self, url, idle_ttl=3600, prefix='session'):
+        self.client = RespClient(url)
+        self.idle_ttl = idle_ttl
+        self.prefix = prefix
+        self._counters = {'created': 0, 'hits': 0, 'misses': 0}
+
+    def _keys(self, session_id):
+        return (f"{self.prefix}:{session_id}:head", f"{self.prefix}:{session_id}:messages",
+                f"{self.prefix}:{session_id}:version")
+
+    def _expire(self, key):
+        return ('EXPIRE', key, self.idle_ttl) if self.idle_ttl > 0 else ('PERSIST', key)
+
+    def get(self, session_id):
+        head_key, messages_key, version_key = self._keys(session_id)
+        head, version, bodies = self.client.pipeline([
+            ('GET', head_key), ('GET', version_key), ('LRANGE', messages_key, 0, -1)
+        ])
+        if head is None:
+            self._counters['misses'] += 1
+            return None
+        record = decode_head(session_id, head)
+        record.version = int(version or 0)
+        record.messages = [decode_message(body) for body in bodies or []]
+        self._counters['hits'] += 1
+        return record
+
+    def get_or_create(self, session_id):
+        record = self.get(session_id)
+        if record is None:
+            record = SessionRecord(session_id=session_id)
+            head_key = self._keys(session_id)[0]
+            self.client.pipeline([('SET', head_key, encode_head(record), 'NX'), self._expire(head_key)])
+            self._counters['created'] += 1
+        return record
+
+    def _write_head(self, record, *commands):
+        """Run commands and write the head if its version is unchanged (or the session is gone)"""
+        head_key, messages_key, version_key = self._keys(record.session_id)
+
+        def build(version):
+            if version is not None and int(version) != record.version:
+                return None
+            return [
+                *commands,
+                ('SET', head_key, encode_head(record)),
+                ('SET', version_key, record.version + 1),
+                self._expire(head_key),
+                self._expire(version_key),
+                self._expire(messages_key),
+            ]
+
+        if self.client.transaction(version_key, build) is None:
+            raise SessionConflictError(record.session_id)
+        record.version += 1
+
+    def save(self, record):
+        self._write_head(record)
+
+    def append_message(self, record, role, content):
+        msg = Message(role=role, content=content, timestamp=datetime.now().isoformat())
+        record.messages.append(msg)
+        messages_key = self._keys(record.session_id)[1]
+        self.client.pipeline([('RPUSH', messages_key, encode_message(msg)), self._expire(messages_key)])
+        return msg
+
+    def clear_messages(self, record):
+        record.messages = []
+        record.context_summary = ''
+        record.summarized_count = 0
+        self._write_head(record, ('DEL', self._keys(record.session_id)[1]))
+
+    def delete(self, session_id):
+        self.client.execute('DEL', *self._keys(session_id))
+
+    def sweep(self):
+        # Expiry is handled by the server
+        return 0
+
+    def stats(self):
+        stats = dict(self._counters)
+        stats.update({
+            'backend': 'redis',
+            'keys': self.client.execute('DBSIZE'),
+            'idle_ttl': self.idle_ttl,
+        })
+        return stats
+
+
+def create_session_store():
+    """Build the session store selected by SESSION_BACKEND (memory, sqlite, redis)"""
+    backend = os.getenv('SESSION_BACKEND', 'memory').lower()
+    idle_ttl = int(os.getenv('SESSION_IDLE_TTL', '3600'))
+
+    if backend == 'sqlite':
+        return SQLiteSessionBackend(os.getenv('SESSION_DB_PATH', 'data/sessions.db'), idle_ttl=idle_ttl)
+    if backend == 'redis':
+        return RedisSessionBackend(os.getenv('SESSION_REDIS_URL', 'redis://localhost:6379/0'), idle_ttl=idle_ttl)
+
+    return SessionStore(
+        max_sessions=int(os.getenv('SESSION_MAX_COUNT', '1000')),
+        idle_ttl=idle_ttl,
+        memory_budget=int(float(os.getenv('SESSION_MEMORY_BUDGET_MB', '64')) * 1024 * 1024)
+    )
@@ -0,0 +1,308 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+# Rough per-object overhead (bytes) used for memory accounting
+RECORD_OVERHEAD = 600
+ITEM_OVERHEAD = 120
+
+
+@dataclass(slots=True)
+class Message:
+    role: str
+    content: str
+    timestamp: str
+
+    def to_dict(self):
+        return {'role': self.role, 'content': self.content, 'timestamp': self.timestamp}
+
+
+@dataclass(slots=True)
+class FileRecord:
+    filename: str
+    mime_type: str
+    sha256: str = ''
+    size: int = 0
+    # dHash of images as 16 hex digits (near-duplicate lookup), '' otherwise
+    phash: str = ''
+
+    def to_dict(self):
+        return {'filename': self.filename, 'mime_type': self.mime_type, 'sha256': self.sha256, 'size': self.size}
+
+
+@dataclass(slots=True)
+class FeedbackEntry:
+    rating: Optional[int]
+    comment: str
+    timestamp: str
+
+    def to_dict(self):
+        return {'rating': self.rating, 'comment': self.comment, 'timestamp': self.timestamp}
+
+
+@dataclass(slots=True)
+class SessionRecord:
+    session_id: str
+    messages: List[Message] = field(default_factory=list)
+    files: List[FileRecord] = field(default_factory=list)
+    ticket_counter: int = 0
+    feedback: List[FeedbackEntry] = field(default_factory=list)
+    ticket_created: bool = False
+    last_interaction: float = field(default_factory=time.time)
+    feedback_submitted: bool = False
+    ticket_button_clicked: bool = False
+    last_analysis: Optional[str] = None
+    awaiting_followup: bool = False
+    nbytes: int = 0
+    # Rolling summary of messages[:summarized_count] (see conversation_context)
+    context_summary: str = ''
+    summarized_count: int = 0
+    # sha256 of the image a near-duplicate analysis was offered for (a typed reply answers the offer)
+    near_duplicate_offered: str = ''
+    # Head version as last loaded or saved (compare-and-set in shared backends)
+    version: int = 0
+
+    def touch(self):
+        self.last_interaction = time.time()
+
+
+def _text_size(value):
+    return len(value) if value else 0
+
+
+def estimate_size(record):
+    """Approximate resident size of a session record in bytes"""
+    size = RECORD_OVERHEAD + _text_size(record.session_id) + _text_size(record.last_analysis)
+    size += _text_size(record.context_summary)
+    for msg in record.messages:
+        size += ITEM_OVERHEAD + _text_size(msg.content) + _text_size(msg.timestamp)
+    for file_record in record.files:
+        size += ITEM_OVERHEAD + _text_size(file_record.filename)
+    for entry in record.feedback:
+        size += ITEM_OVERHEAD + _text_size(entry.comment)
+    return size
+
+
+class SessionConflictError(Exception):
+    """The session was saved by another request since this copy was loaded"""
+
+
+class SessionBackend:
+    """Interface shared by all session stores used by the app
+
+    Handlers load a record, mutate it and call save(). Chat messages are
+    appended with append_message() so shared backends only write the delta.
+    Shared backends raise SessionConflictError instead of overwriting a
+    newer head.
+    """
+
+    # Called with each record the store drops by itself (idle expiry, LRU or
+    # memory eviction; not delete()), e.g. to release the session's uploads
+    on_evict = None
+
+    def _evicted(self, record):
+        if self.on_evict is None:
+            return
+        try:
+            self.on_evict(record)
+        except Exception as e:
+            print(f"Session eviction hook error for {record.session_id}: {e}")
+
+    def get(self, session_id):
+        raise NotImplementedError
+
+    def get_or_create(self, session_id):
+        raise NotImplementedError
+
+    def save(self, record):
+        raise NotImplementedError
+
+    def append_message(self, record, role, content):
+        raise NotImplementedError
+
+    def clear_messages(self, record):
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def sweep(self):
+        raise NotImplementedError
+
+    def stats(self):
+        raise NotImplementedError
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+
+class SessionStore(SessionBackend):
+    """In-process session store with LRU, idle-TTL and memory-budget eviction
+
+    Records evicted under the lock are handed to on_evict once it is
+    released, so the hook's file I/O never blocks other requests.
+    """
+
+    def __init__(self, max_sessions=1000, idle_ttl=3600, memory_budget=64 * 1024 * 1024):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.memory_budget = memory_budget
+        self._records = OrderedDict()
+        self._lock = threading.RLock()
+        self._total_bytes = 0
+        self._dropped = []
+        self._counters = {
+            'created': 0,
+            'hits': 0,
+            'misses': 0,
+            'evicted_lru': 0,
+            'evicted_idle': 0,
+            'evicted_memory': 0,
+        }
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, session_id):
+        """Return the session record or None, refreshing its LRU position"""
+        with self._lock:
+            record = self._get(session_id)
+        self._notify_evicted()
+        return record
+
+    def _get(self, session_id):
+        record = self._records.get(session_id)
+        if record is None:
+            self._counters['misses'] += 1
+            return None
+        if self._is_idle(record, time.time()):
+            self._evict(session_id, 'evicted_idle')
+            self._counters['misses'] += 1
+            return None
+        self._records.move_to_end(session_id)
+        self._counters['hits'] += 1
+        return record
+
+    def get_or_create(self, session_id):
+        """Return the existing session record or create an empty one"""
+        with self._lock:
+            record = self._get(session_id)
+            if record is None:
+                record = SessionRecord(session_id=session_id)
+                record.nbytes = estimate_size(record)
+                self._records[session_id] = record
+                self._total_bytes += record.nbytes
+                self._counters['created'] += 1
+                self._enforce_limits(keep=session_id)
+        self._notify_evicted()
+        return record
+
+    def save(self, record):
+        """Re-account a record after it was modified and apply eviction"""
+        with self._lock:
+            if self._records.get(record.session_id) is not record:
+                return
+            new_size = estimate_size(record)
+            self._total_bytes += new_size - record.nbytes
+            record.nbytes = new_size
+            self._records.move_to_end(record.session_id)
+            self._enforce_limits(keep=record.session_id)
+        self._notify_evicted()
+
+    def append_message(self, record, role, content):
+        """Append a chat message and account for its size"""
+        msg = Message(role=role, content=content, timestamp=datetime.now().isoformat())
+        with self._lock:
+            record.messages.append(msg)
+            if self._records.get(record.session_id) is record:
+                added = ITEM_OVERHEAD + _text_size(content) + _text_size(msg.timestamp)
+                record.nbytes += added
+                self._total_bytes += added
+                self._enforce_limits(keep=record.session_id)
+        self._notify_evicted()
+        return msg
+
+    def clear_messages(self, record):
+        record.messages = []
+        record.context_summary = ''
+        record.summarized_count = 0
+        self.save(record)
+
+    def delete(self, session_id):
+        with self._lock:
+            if session_id in self._records:
+                self._evict(session_id, None)
+
+    def sweep(self):
+        """Evict every idle session; returns the number evicted"""
+        now = time.time()
+        evicted = 0
+        with self._lock:
+            for session_id, record in list(self._records.items()):
+                if self._is_idle(record, now):
+                    self._evict(session_id, 'evicted_idle')
+                    evicted += 1
+        self._notify_evicted()
+        return evicted
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update({
+                'backend': 'memory',
+                'sessions': len(self._records),
+                'bytes': self._total_bytes,
+                'max_sessions': self.max_sessions,
+                'idle_ttl': self.idle_ttl,
+                'memory_budget': self.memory_budget,
+            })
+            return stats
+
+    def _is_idle(self, record, now):
+        return self.idle_ttl > 0 and now - record.last_interaction > self.idle_ttl
+
+    def _evict(self, session_id, reason):
+        record = self._records.pop(session_id)
+        self._total_bytes -= record.nbytes
+        if reason:
+            self._counters[reason] += 1
+            self._dropped.append(record)
+
+    def _notify_evicted(self):
+        """Pass records evicted under the lock to on_evict (lock not held)"""
+        if not self._dropped:
+            return
+        with self._lock:
+            dropped, self._dropped = self._dropped, []
+        for record in dropped:
+            self._evicted(record)
+
+    def _enforce_limits(self, keep=None):
+        now = time.time()
+        # Oldest entries sit at the front, so idle sessions are found there first
+        for session_id, record in list(self._records.items()):
+            if session_id != keep and self._is_idle(record, now):
+                self._evict(session_id, 'evicted_idle')
+            elif not self._is_idle(record, now):
+                break
+
+        while len(self._records) > self.max_sessions:
+            victim = self._next_victim(keep)
+            if victim is None:
+                break
+            self._evict(victim, 'evicted_lru')
+
+        while self.memory_budget > 0 and self._total_bytes > self.memory_budget:
+            victim = self._next_victim(keep)
+            if victim is None:
+                break
+            self._evict(victim, 'evicted_memory')
+
+    def _next_victim(self, keep):
+        for session_id in self._records:
+            if session_id != keep:
+                return session_id
+        return None
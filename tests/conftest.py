@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+# The app's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """app.py on the fake model, with its folders and databases in a temp dir"""
+    pytest.importorskip('gen_ai_hub')
+    workdir = tmp_path_factory.mktemp('app')
+    previous = os.getcwd()
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('MODEL_BACKEND', 'fake')
+        patch.setenv('FAKE_MODEL_LATENCY_MS', '0')
+        patch.setenv('FAKE_MODEL_RESPONSE_CHARS', '200')
+        patch.setenv('SESSION_BACKEND', 'memory')
+        os.chdir(workdir)
+        try:
+            import app
+            yield app
+        finally:
+            os.chdir(previous)
+
+
+@pytest.fixture
+def app_client(app_module):
+    return app_module.app.test_client()
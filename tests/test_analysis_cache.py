@@ -0,0 +1,63 @@
+import time
+
+from analysis_cache import AnalysisCache, context_digest, make_key, normalize_prompt
+
+SHA = 'ab' * 32
+
+
+def test_prompts_are_normalized():
+    assert normalize_prompt('  Any   HAZARDS?! ') == normalize_prompt('any hazards') == 'any hazards'
+    assert make_key([SHA], 'image', 'Any hazards?', 'prompt') == make_key([SHA], 'image', 'any hazards', 'prompt')
+
+
+def test_key_changes_with_files_type_and_prompt_version():
+    key = make_key([SHA], 'image', 'analyze', 'prompt v1')
+    assert key != make_key(['cd' * 32], 'image', 'analyze', 'prompt v1')
+    assert key != make_key([SHA], 'image:tiled', 'analyze', 'prompt v1')
+    assert key != make_key([SHA], 'image', 'analyze', 'prompt v2')
+    assert key != make_key([SHA, 'cd' * 32], 'image', 'analyze', 'prompt v1')
+
+
+def test_follow_ups_are_keyed_on_the_conversation_before_them():
+    first = context_digest([('user', 'analyze'), ('assistant', 'A crack on the left.')])
+    other = context_digest([('user', 'analyze'), ('assistant', 'Corrosion on the right.')])
+    assert context_digest([]) == '' and first != other
+    assert first != context_digest([('user', 'analyze'), ('assistant', 'A crack on the left.')], summary='earlier')
+    assert make_key([SHA], 'image', 'what about the left side?', 'p', first) != \
+        make_key([SHA], 'image', 'what about the left side?', 'p', other)
+    # A first turn has no context, so it shares its entry with every session
+    assert make_key([SHA], 'image', 'analyze', 'p', context_digest([])) == make_key([SHA], 'image', 'analyze', 'p')
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = AnalysisCache(max_entries=2)
+    cache.put('a', 'A')
+    cache.put('b', 'B')
+    cache.get('a')
+    cache.put('c', 'C')
+    assert cache.get('b') is None and cache.get('a') == 'A' and cache.get('c') == 'C'
+    assert cache.stats()['evicted'] == 1
+
+
+def test_entries_expire_after_the_ttl():
+    cache = AnalysisCache(ttl=60)
+    cache.put('a', 'A')
+    cache._entries['a'] = ('A', time.time() - 61)
+    assert cache.get('a') is None
+    assert cache.stats()['expired'] == 1
+
+
+def test_disk_tier_is_shared_and_survives_restarts(tmp_path):
+    path = str(tmp_path / 'cache' / 'analysis.db')
+    AnalysisCache(path=path).put('a', 'A')
+    cache = AnalysisCache(path=path)
+    assert cache.get('a') == 'A'
+    assert cache.get('a') == 'A'
+    stats = cache.stats()
+    assert stats['disk_hits'] == 1 and stats['hits'] == 1 and stats['hit_ratio'] == 1.0
+
+
+def test_disabled_cache_stores_nothing():
+    cache = AnalysisCache(max_entries=0)
+    cache.put('a', 'A')
+    assert cache.get('a') is None and cache.stats()['stores'] == 0
@@ -0,0 +1,96 @@
+import io
+import wave
+
+import numpy as np
+import pytest
+
+from audio_processing import AudioNormalizer, decode, encode_wav, resample, trim_silence
+
+
+def wav_bytes(samples, rate, width=2):
+    """(frames, channels) float samples -> PCM WAV bytes"""
+    scale = 2 ** (8 * width - 1) - 1
+    pcm = (samples * scale).astype(f"<i{width}")
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as writer:
+        writer.setnchannels(samples.shape[1])
+        writer.setsampwidth(width)
+        writer.setframerate(rate)
+        writer.writeframes(pcm.tobytes())
+    return out.getvalue()
+
+
+def tone(seconds, rate, frequency=440.0, amplitude=0.5):
+    t = np.arange(int(seconds * rate)) / rate
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def test_stereo_is_downmixed_resampled_and_trimmed():
+    rate = 44100
+    silence = np.zeros(rate, dtype=np.float32)
+    mono = np.concatenate([silence, tone(1.0, rate), silence])
+    data = wav_bytes(np.stack([mono, mono], axis=1), rate)
+    processed, mime_type, info = AudioNormalizer(sample_rate=16000)(data, 'audio/wav')
+    assert mime_type == 'audio/wav'
+    with wave.open(io.BytesIO(processed)) as reader:
+        assert reader.getnchannels() == 1 and reader.getframerate() == 16000 and reader.getsampwidth() == 2
+    assert info['original_format'] == '2ch 44100Hz' and info['model_format'] == '1ch 16000Hz'
+    assert info['original_seconds'] == 3.0
+    # The tone plus the padding kept on either side
+    assert 1.0 <= info['model_seconds'] <= 1.3
+    assert info['bytes_saved'] > 0
+
+
+def test_audio_is_never_upsampled_and_kept_when_nothing_shrinks():
+    data = wav_bytes(tone(0.5, 8000)[:, None], 8000)
+    processed, mime_type, info = AudioNormalizer(sample_rate=16000, trim_silence=False)(data, 'audio/wav')
+    assert processed == data and info['model_format'] == '1ch 8000Hz' and info['bytes_saved'] == 0
+
+
+def test_max_seconds_cuts_long_recordings():
+    data = wav_bytes(tone(5.0, 16000)[:, None], 16000)
+    _, _, info = AudioNormalizer(trim_silence=False, max_seconds=2)(data, 'audio/wav')
+    assert info['model_seconds'] == 2.0
+
+
+@pytest.mark.parametrize('width', [1, 2, 3, 4])
+def test_pcm_sample_widths_decode_to_the_same_signal(width):
+    signal = tone(0.1, 8000)
+    if width == 3:
+        pcm = (signal * (2 ** 23 - 1)).astype('<i4')
+        frames = pcm.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    elif width == 1:
+        frames = (signal * 127 + 128).astype(np.uint8).tobytes()
+    else:
+        frames = (signal * (2 ** (8 * width - 1) - 1)).astype(f"<i{width}").tobytes()
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(width)
+        writer.setframerate(8000)
+        writer.writeframes(frames)
+    samples, rate, channels = decode(out.getvalue())
+    assert rate == 8000 and channels == 1
+    assert np.max(np.abs(samples[:, 0] - signal)) < 0.02
+
+
+def test_resampling_keeps_in_band_tones_and_the_duration():
+    resampled = resample(tone(1.0, 48000, frequency=440), 48000, 16000)
+    assert len(resampled) == 16000
+    spectrum = np.abs(np.fft.rfft(resampled))
+    assert np.argmax(spectrum) == 440
+
+
+def test_silence_only_and_compressed_audio_are_left_alone():
+    silence = np.zeros(1600, dtype=np.float32)
+    assert len(trim_silence(silence, 16000, -45)) == 1600
+    normalizer = AudioNormalizer()
+    assert not normalizer.supports('audio/mp3') and normalizer.supports('audio/wav')
+    with pytest.raises(ValueError):
+        decode(b'ID3\x04' + b'\0' * 64)
+
+
+def test_encoded_wav_round_trips():
+    samples = tone(0.2, 16000)
+    decoded, rate, _ = decode(encode_wav(samples, 16000))
+    assert rate == 16000 and np.max(np.abs(decoded[:, 0] - samples)) < 1e-3
@@ -0,0 +1,112 @@
+import csv
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from batch import DONE, ERROR, BatchManager, results_csv
+from session_store import FileRecord
+
+
+def records(count):
+    return [(f"{i}.jpg", FileRecord(f"{i}.jpg", 'image/jpeg', f"{i:064x}", 10)) for i in range(count)]
+
+
+def wait_for(manager, batch_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        batch = manager.get(batch_id)
+        if batch.progress()['status'] == 'complete':
+            return batch
+        time.sleep(0.01)
+    raise AssertionError(f"batch {batch_id} did not complete")
+
+
+def test_jobs_run_at_most_max_workers_at_a_time(tmp_path):
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def analyze(record):
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return {'response': 'ok'}
+
+    manager = BatchManager(str(tmp_path), analyze, max_workers=2)
+    batch = manager.submit(records(8))
+    wait_for(manager, batch.batch_id)
+    assert running[1] == 2
+
+
+def test_results_record_hazards_and_errors(tmp_path):
+    def analyze(record):
+        if record.filename == '1.jpg':
+            raise RuntimeError('model unavailable')
+        return {'response': 'Crack found', 'hazard_terms': ['crack'] if record.filename == '0.jpg' else [],
+                'cached': record.filename == '2.jpg'}
+
+    manager = BatchManager(str(tmp_path), analyze, max_workers=2)
+    batch = wait_for(manager, manager.submit(records(3)).batch_id)
+    first, failed, cached = batch.jobs
+    assert first.status == DONE and first.hazard_detected and first.hazard_terms == ['crack']
+    assert failed.status == ERROR and failed.error == 'model unavailable'
+    assert cached.cached and not cached.hazard_detected
+    progress = batch.progress()
+    assert progress['counts'][DONE] == 2 and progress['counts'][ERROR] == 1 and progress['hazards_found'] == 1
+
+
+def test_other_workers_read_the_snapshot_and_on_finished_runs_once(tmp_path):
+    finished = []
+    manager = BatchManager(str(tmp_path), lambda record: {'response': 'ok'}, max_workers=2,
+                           on_finished=lambda batch, files: finished.append((batch.batch_id, len(files))))
+    batch = manager.submit(records(5))
+    wait_for(manager, batch.batch_id)
+    other = BatchManager(str(tmp_path), None).get(batch.batch_id)
+    assert other.progress()['completed'] == 5 and [job.response for job in other.jobs] == ['ok'] * 5
+    assert finished == [(batch.batch_id, 5)]
+    assert manager.pending_files() == []
+
+
+def test_batches_of_an_exited_worker_are_orphaned(tmp_path):
+    release = threading.Event()
+    manager = BatchManager(str(tmp_path), lambda record: release.wait(5) and {'response': 'ok'}, max_workers=1)
+    batch = manager.submit(records(2))
+    assert not manager.orphaned(batch)
+    snapshot = BatchManager(str(tmp_path), None).get(batch.batch_id)
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    snapshot.owner_pid = process.pid
+    assert BatchManager(str(tmp_path), None).orphaned(snapshot)
+    release.set()
+    wait_for(manager, batch.batch_id)
+
+
+@pytest.mark.parametrize('stale_after, orphaned', [(900.0, False), (0.5, True)])
+def test_batches_without_progress_for_stale_after_are_orphaned(tmp_path, stale_after, orphaned):
+    release = threading.Event()
+    manager = BatchManager(str(tmp_path), lambda record: release.wait(5) and {'response': 'ok'}, max_workers=1)
+    batch = manager.submit(records(1))
+    snapshot = BatchManager(str(tmp_path), None).get(batch.batch_id)
+    # Owned by a live process elsewhere that last made progress a second ago
+    snapshot.owner_pid = os.getppid()
+    snapshot.updated = time.time() - 1
+    assert BatchManager(str(tmp_path), None, stale_after=stale_after).orphaned(snapshot) is orphaned
+    release.set()
+    wait_for(manager, batch.batch_id)
+
+
+def test_results_csv_streams_one_row_per_job(tmp_path):
+    manager = BatchManager(str(tmp_path), lambda record: {'response': 'Rust, "heavy"', 'hazard_terms': ['rust']})
+    batch = wait_for(manager, manager.submit(records(2)).batch_id)
+    chunks = list(results_csv(batch))
+    assert len(chunks) == 3
+    rows = list(csv.DictReader(io.StringIO(''.join(chunks))))
+    assert [row['filename'] for row in rows] == ['0.jpg', '1.jpg']
+    assert rows[0]['hazard_terms'] == 'rust' and rows[0]['response'] == 'Rust, "heavy"'
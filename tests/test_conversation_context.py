@@ -0,0 +1,69 @@
+import base64
+
+from conversation_context import IMAGE_TOKENS, ContextBuilder, estimate_tokens, part_tokens
+from session_store import FileRecord, Message, SessionRecord
+
+
+def session(*contents, files=False, last_analysis=None):
+    record = SessionRecord(session_id='s1', last_analysis=last_analysis)
+    record.messages = [Message('user' if i % 2 == 0 else 'assistant', text, '') for i, text in enumerate(contents)]
+    if files:
+        record.files = [FileRecord('1_a.jpg', 'image/jpeg', 'ab' * 32, 10)]
+    return record
+
+
+def test_newest_messages_are_kept_verbatim_within_the_budget():
+    builder = ContextBuilder(history_tokens=60)
+    record = session(*[f"message {i} " + 'x' * 80 for i in range(6)], 'current question')
+    plan = builder.plan(record, 'current question')
+    assert [msg.content for msg in plan.history] == [msg.content for msg in record.messages[4:6]]
+    assert plan.history_tokens <= 60
+    assert record.summarized_count == 4
+    assert plan.summary.count('\n') == 3 and plan.summary.startswith('User: message 0')
+
+
+def test_the_summary_grows_one_message_at_a_time():
+    builder = ContextBuilder(history_tokens=30)
+    record = session(*['y' * 100] * 4, 'next')
+    builder.plan(record, 'next')
+    folded = record.summarized_count
+    summary = record.context_summary
+    record.messages += [Message('assistant', 'z' * 100, ''), Message('user', 'again', '')]
+    builder.plan(record, 'again')
+    # Only the message that fell out of the window is folded in
+    assert record.summarized_count == folded + 1
+    assert record.context_summary.startswith(summary)
+    assert builder.stats()['messages_summarized'] == record.summarized_count
+
+
+def test_summary_keeps_late_hazard_sentences():
+    builder = ContextBuilder(line_chars=80)
+    answer = 'The weld looks even. The paint is fresh. Lighting is good. There is a crack near the left bolt.'
+    line = builder.summarize(Message('assistant', answer, ''))
+    assert line.startswith('Assistant: The weld looks even.') and 'crack near the left bolt' in line
+    assert 'Lighting' not in line
+
+
+def test_oldest_summary_lines_are_dropped_past_the_summary_budget():
+    builder = ContextBuilder(summary_tokens=100)
+    record = session(*['w' * 200] * 8, 'q')
+    builder._fold(record, 8)
+    assert record.context_summary == '\n'.join(builder.summarize(msg) for msg in record.messages[6:8])
+    assert len(record.context_summary) <= 100 * 4
+
+
+def test_files_are_reattached_only_when_the_question_needs_them():
+    builder = ContextBuilder()
+    assert not builder.needs_file(session('q'), 'anything')
+    assert builder.needs_file(session('q', files=True), 'what is this?')
+    analyzed = session('q', files=True, last_analysis='A cracked weld.')
+    assert not builder.needs_file(analyzed, 'how urgent is the repair?')
+    assert builder.needs_file(analyzed, 'zoom into the top corner of the image')
+    assert ContextBuilder(reattach='always').needs_file(analyzed, 'how urgent is the repair?')
+
+
+def test_token_estimates():
+    assert estimate_tokens('') == 0 and estimate_tokens('abcde') == 2
+    assert part_tokens({'inline_data': {'mime_type': 'image/jpeg', 'data': 'x' * 10 ** 6}}) == IMAGE_TOKENS
+    audio = base64.b64encode(b'\0' * 32000).decode()
+    assert part_tokens({'inline_data': {'mime_type': 'audio/wav', 'data': audio}}) == 32
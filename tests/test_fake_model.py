@@ -0,0 +1,64 @@
+import os
+import sys
+
+import pytest
+
+from fake_model import SENTENCES, FakeGenerativeModel, FakeModelError
+from model_client import ResilientModelClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import load_test  # noqa: E402
+
+
+def test_seeded_models_answer_alike_at_the_requested_length():
+    first = FakeGenerativeModel(latency_ms=0, response_chars=300, seed=7)
+    second = FakeGenerativeModel(latency_ms=0, response_chars=300, seed=7)
+    text = first.generate_content('analyze').text
+    assert text == second.generate_content('analyze').text
+    assert len(text) == 300 and text.split('. ')[0] + '.' in SENTENCES
+
+
+def test_streams_split_the_same_text_into_chunks():
+    text = FakeGenerativeModel(latency_ms=0, seed=3).generate_content('x').text
+    chunks = list(FakeGenerativeModel(latency_ms=0, stream_chunks=4, seed=3).generate_content('x', stream=True))
+    assert len(chunks) == 4 and ''.join(chunk.text for chunk in chunks) == text
+
+
+class CountingModel(FakeGenerativeModel):
+    calls = 0
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        self.calls += 1
+        return super().generate_content(contents, stream, **kwargs)
+
+
+def test_injected_failures_are_retried_by_the_client():
+    model = CountingModel(latency_ms=0, error_rate=1.0)
+    client = ResilientModelClient(lambda: model, retries=1, backoff_base=0)
+    with pytest.raises(FakeModelError) as raised:
+        client.generate_content('x')
+    assert raised.value.status_code == 503 and model.calls == 2
+
+
+def test_settings_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv('FAKE_MODEL_LATENCY_MS', '5')
+    monkeypatch.setenv('FAKE_MODEL_ERROR_RATE', '0.25')
+    monkeypatch.setenv('FAKE_MODEL_SEED', '11')
+    model = FakeGenerativeModel.from_env()
+    assert model.latency_ms == 5.0 and model.error_rate == 0.25 and model.response_chars == 1200
+    assert model.generate_content('x').text == FakeGenerativeModel(latency_ms=5, error_rate=0.25, seed=11) \
+        .generate_content('x').text
+
+
+def test_load_test_summaries_and_regressions():
+    recorder = load_test.Recorder()
+    for ms in range(1, 101):
+        recorder.add('analyze', ms / 1000, ok=ms != 50)
+    summary = recorder.summary()['analyze']
+    assert summary['count'] == 100 and summary['errors'] == 1
+    assert summary['p50_ms'] <= summary['p95_ms'] <= summary['p99_ms'] <= 100
+    report = {'steps': {'analyze': {'p95_ms': 130.0}}, 'rps': 70.0}
+    baseline = {'steps': {'analyze': {'p95_ms': 100.0}}, 'rps': 100.0}
+    assert len(load_test.compare(report, baseline, tolerance=0.2)) == 2
+    assert load_test.compare(report, baseline, tolerance=0.5) == []
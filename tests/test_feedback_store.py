@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+from datetime import date
+
+import pytest
+
+import feedback_store
+from feedback_store import FeedbackStore, normalize_rating, session_feedback_csv
+from session_store import FeedbackEntry
+
+
+@pytest.fixture
+def feedback(tmp_path):
+    return FeedbackStore(str(tmp_path / 'feedback.db'))
+
+
+@pytest.mark.parametrize('rating, expected', [(4, 4), ('5', 5), (0, None), ('great', None), (None, None)])
+def test_ratings_outside_the_scale_are_stored_unrated(rating, expected):
+    assert normalize_rating(rating) == expected
+
+
+def test_aggregates_are_updated_with_every_entry(feedback):
+    feedback.add('s1', rating=5, file_type='image/jpeg', file_name='a.jpg')
+    feedback.add('s1', rating=3, file_type='image/jpeg', file_name='a.jpg')
+    feedback.add('s2', rating='bad', comment='no rating', file_type='application/pdf')
+    feedback.add('s2', comment='no file')
+    summary = feedback.summary(days=3)
+    assert summary['count'] == 4 and summary['rated'] == 2 and summary['average'] == 4.0
+    assert summary['histogram'] == {'1': 0, '2': 0, '3': 1, '4': 0, '5': 1}
+    assert summary['file_types']['image/jpeg'] == {'count': 2, 'rated': 2, 'average': 4.0}
+    assert summary['file_types']['application/pdf']['average'] is None
+    assert summary['file_types']['none']['count'] == 1
+    assert [day['day'] for day in summary['daily']][-1] == date.today().isoformat()
+    assert summary['daily'][-1]['count'] == 4 and summary['rolling_average'] == 4.0
+
+
+def test_summaries_match_across_workers_and_cap_the_window(feedback):
+    feedback.add('s1', rating=2)
+    other = FeedbackStore(feedback.path)
+    assert other.summary()['histogram']['2'] == 1
+    assert len(other.summary(days=10_000)['daily']) == feedback_store.MAX_ROLLING_DAYS
+    assert other.stats()['entries'] == 1
+
+
+def test_exports_stream_in_chunks_oldest_first(feedback, monkeypatch):
+    monkeypatch.setattr(feedback_store, 'EXPORT_CHUNK', 2)
+    for i in range(5):
+        feedback.add(f"s{i % 2}", rating=i + 1, comment=f"comment, {i}", file_name=f"{i}.jpg")
+    lines = list(feedback.export_ndjson())
+    assert [json.loads(line)['comment'] for line in lines] == [f"comment, {i}" for i in range(5)]
+    rows = list(csv.DictReader(io.StringIO(''.join(feedback.export_csv(session_id='s0')))))
+    assert [row['file_name'] for row in rows] == ['0.jpg', '2.jpg', '4.jpg']
+    assert list(rows[0]) == feedback_store.CSV_COLUMNS and rows[0]['comment'] == 'comment, 0'
+    assert feedback.stats()['exported'] == 8
+
+
+def test_time_filters_bound_the_export(feedback):
+    first = feedback.add('s1', rating=1)
+    second = feedback.add('s1', rating=2)
+    since = [entry.rating for entry in feedback.iter_feedback(since=second.created_at)]
+    until = [entry.rating for entry in feedback.iter_feedback(until=second.created_at)]
+    assert since == [2] and until == [1] and first.created_at <= second.created_at
+
+
+def test_session_csv_quotes_comments_and_blanks_missing_ratings():
+    entries = [FeedbackEntry(4, 'Clear, "useful"', '2026-01-01T10:00:00'),
+               FeedbackEntry(None, 'line\nbreak', '2026-01-01T10:05:00')]
+    rows = list(csv.reader(io.StringIO(session_feedback_csv(entries))))
+    assert rows == [['Timestamp', 'Rating', 'Comment'],
+                    ['2026-01-01T10:00:00', '4', 'Clear, "useful"'],
+                    ['2026-01-01T10:05:00', '', 'line\nbreak']]
+
+
+def test_submitted_feedback_reaches_the_session_export(app_client):
+    session = {'session_id': 'feedback-export'}
+    app_client.post('/feedback', json={**session, 'rating': 5, 'comment': 'Spot on'})
+    response = app_client.get('/api/feedback/export', query_string={**session, 'format': 'csv'})
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [(row['rating'], row['comment']) for row in rows] == [('5', 'Spot on')]
+    # Cross-session exports need ADMIN_TOKEN, which is unset here
+    assert app_client.get('/api/feedback/export').status_code == 404
+    download = app_client.post('/export/feedback', json=session).json
+    assert download['csv_data'].splitlines()[1].endswith(',5,Spot on')
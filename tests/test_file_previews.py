@@ -0,0 +1,48 @@
+import hashlib
+import io
+
+from PIL import Image
+
+
+def png_bytes():
+    data = io.BytesIO()
+    Image.new('RGB', (32, 32), 'red').save(data, 'PNG')
+    return data.getvalue()
+
+
+def upload(client, session_id, data, filename='shot.png'):
+    response = client.post('/upload', data={'session_id': session_id, 'files': (io.BytesIO(data), filename)})
+    assert response.status_code == 200
+    return response.json['files'][0]
+
+
+def test_uploads_return_a_preview_url_instead_of_base64(app_client):
+    data = png_bytes()
+    preview = upload(app_client, 'previews-1', data)
+    sha256 = hashlib.sha256(data).hexdigest()
+    assert preview['url'] == f"/files/{sha256}" and 'base64' not in preview
+    response = app_client.get(preview['url'])
+    assert response.status_code == 200 and response.data == data
+    assert response.mimetype == 'image/png'
+    assert response.headers['ETag'] == f'"{sha256}"'
+    assert 'immutable' in response.headers['Cache-Control']
+
+
+def test_previews_answer_conditional_and_range_requests(app_client):
+    data = png_bytes()
+    url = upload(app_client, 'previews-2', data)['url']
+    etag = app_client.get(url).headers['ETag']
+    assert app_client.get(url, headers={'If-None-Match': etag}).status_code == 304
+    response = app_client.get(url, headers={'Range': 'bytes=0-7'})
+    assert response.status_code == 206 and response.data == data[:8]
+    assert response.headers['Content-Range'] == f"bytes 0-7/{len(data)}"
+
+
+def test_previews_are_typed_by_content_not_name(app_client):
+    data = png_bytes()
+    assert app_client.get(upload(app_client, 'previews-3', data, 'renamed.jpg')['url']).mimetype == 'image/png'
+
+
+def test_unknown_or_malformed_ids_are_not_found(app_client):
+    assert app_client.get('/files/' + '0' * 64).status_code == 404
+    assert app_client.get('/files/..%2Fapp.py').status_code == 404
@@ -0,0 +1,56 @@
+import io
+
+from PIL import Image
+
+from image_processing import ImageNormalizer
+
+
+def encode(image, image_format='PNG', **options):
+    out = io.BytesIO()
+    image.save(out, format=image_format, **options)
+    return out.getvalue()
+
+
+def noise(width, height):
+    return Image.frombytes('RGB', (width, height), bytes(i * 37 % 251 for i in range(width * height * 3)))
+
+
+def test_large_images_are_downscaled_and_reencoded():
+    data, mime_type, info = ImageNormalizer(max_edge=256)(encode(noise(1024, 512)), 'image/png')
+    assert mime_type == 'image/jpeg'
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.format == 'JPEG' and image.size == (256, 128)
+    assert info['original_dimensions'] == [1024, 512] and info['model_dimensions'] == [256, 128]
+    assert info['bytes_saved'] == info['original_bytes'] - info['model_bytes'] > 0
+
+
+def test_small_images_that_would_grow_are_kept_as_they_are():
+    original = encode(Image.new('RGB', (16, 16), 'red'))
+    data, mime_type, info = ImageNormalizer()(original, 'image/png')
+    assert data == original and mime_type == 'image/png' and info['bytes_saved'] == 0
+
+
+def test_exif_orientation_is_applied_and_metadata_dropped():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotated 90 degrees clockwise
+    original = encode(noise(40, 20), 'JPEG', exif=exif.tobytes())
+    data, _, info = ImageNormalizer()(original, 'image/jpeg')
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.size == (20, 40)
+        assert image.getexif().get(0x0112) is None
+    assert info['model_dimensions'] == [20, 40]
+
+
+def test_transparency_is_flattened_onto_white_for_jpeg():
+    image = Image.new('RGBA', (2000, 10), (0, 0, 0, 0))
+    data, _, _ = ImageNormalizer(max_edge=100)(encode(image), 'image/png')
+    with Image.open(io.BytesIO(data)) as result:
+        assert result.mode == 'RGB'
+        assert all(channel > 240 for channel in result.getpixel((50, 0)))
+
+
+def test_variant_key_changes_with_the_settings():
+    normalizer = ImageNormalizer(max_edge=1568, image_format='webp', quality=80)
+    assert normalizer.mime_type == 'image/webp'
+    assert normalizer.variant_key != normalizer.scaled(800).variant_key
+    assert normalizer.scaled(800).max_edge == 800 and normalizer.scaled(800).quality == 80
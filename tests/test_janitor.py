@@ -0,0 +1,50 @@
+import io
+import os
+import time
+
+from janitor import Janitor
+from session_store import SessionStore
+from upload_store import UploadStore
+
+
+def make_janitor(tmp_path, store, sessions=None, **kwargs):
+    return Janitor(sessions or SessionStore(idle_ttl=60), store, lock_path=str(tmp_path / 'janitor.lock'),
+                   report_path=str(tmp_path / 'janitor.json'), **kwargs)
+
+
+def test_one_worker_collects_and_every_worker_reads_its_report(tmp_path):
+    store = UploadStore(str(tmp_path / 'uploads'))
+    leader = make_janitor(tmp_path, store)
+    follower = make_janitor(tmp_path, store)
+    assert leader.run_once() is not None
+    # The lock is held for the worker's lifetime
+    assert follower.run_once() is None
+    assert follower.last_report()['pid'] == os.getpid()
+    assert follower.stats()['runs'] == 1 and follower.stats()['last_collection'] == leader.last_report()
+
+
+def test_a_run_sweeps_idle_sessions_and_expired_uploads(tmp_path):
+    store = UploadStore(str(tmp_path / 'uploads'))
+    sessions = SessionStore(idle_ttl=60)
+    sessions.get_or_create('idle').last_interaction = time.time() - 61
+    sha256, _, _ = store.put(io.BytesIO(b'x' * 100), 'a.jpg', 'idle')
+    old = time.time() - 600
+    ref_dir = os.path.join(store.refs_folder, store.blob_name(sha256))
+    for path in [os.path.join(store.folder, sha256)] + [entry.path for entry in os.scandir(ref_dir)]:
+        os.utime(path, (old, old))
+    leftover = os.path.join(store.folder, '.upload-crashed')
+    open(leftover, 'wb').close()
+    os.utime(leftover, (old - 3600, old - 3600))
+    ticks = []
+    janitor = make_janitor(tmp_path, store, sessions, ref_ttl=300, on_tick=lambda: ticks.append(1))
+    report = janitor.run_once()
+    assert ticks == [1]
+    assert report['sessions_swept'] == 1 and sessions.get('idle') is None
+    assert report['refs_expired'] == 1 and report['blobs_deleted'] == 1 and report['temp_files'] == 1
+    assert store.find(sha256) is None and not os.path.exists(leftover)
+
+
+def test_the_thread_is_not_started_when_disabled(tmp_path):
+    janitor = make_janitor(tmp_path, UploadStore(str(tmp_path / 'uploads')), interval=0)
+    janitor.ensure_started()
+    assert not janitor.leader and janitor.stats()['runs'] == 0
@@ -0,0 +1,72 @@
+import pytest
+from flask import Flask, Response
+from prometheus_client import REGISTRY
+
+import metrics
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    metrics.instrument(app)
+
+    @app.route('/batch/<batch_id>')
+    def batch(batch_id):
+        with metrics.stage('test_lookup'):
+            return {'batch_id': batch_id}
+
+    @app.route('/stream')
+    def stream():
+        return Response(iter(['a', 'b']))
+
+    return app.test_client()
+
+
+def test_requests_are_timed_by_route_template(client):
+    labels = {'route': '/batch/<batch_id>', 'method': 'GET', 'status': '200'}
+    before = sample('app_request_duration_seconds_count', **labels)
+    for batch_id in ('one', 'two'):
+        # Observed when the server closes the response
+        client.get(f'/batch/{batch_id}').close()
+    assert sample('app_request_duration_seconds_count', **labels) == before + 2
+    assert sample('app_stage_duration_seconds_count', stage='test_lookup') >= 2
+
+
+def test_unmatched_and_streamed_requests_are_timed(client):
+    unmatched = {'route': 'unmatched', 'method': 'GET', 'status': '404'}
+    before = sample('app_request_duration_seconds_count', **unmatched)
+    client.get('/nowhere').close()
+    assert sample('app_request_duration_seconds_count', **unmatched) == before + 1
+    streamed = {'route': '/stream', 'method': 'GET', 'status': '200'}
+    before = sample('app_request_duration_seconds_count', **streamed)
+    response = client.get('/stream')
+    assert response.data == b'ab'
+    response.close()
+    assert sample('app_request_duration_seconds_count', **streamed) == before + 1
+
+
+def test_prompt_sizes_split_text_from_inline_data():
+    text_before = sample('app_prompt_text_bytes_sum')
+    inline_before = sample('app_prompt_inline_data_bytes_sum')
+    metrics.observe_prompt([{'text': 'grün'}, {'inline_data': {'mime_type': 'image/png', 'data': 'x' * 100}}])
+    assert sample('app_prompt_text_bytes_sum') == text_before + 5
+    assert sample('app_prompt_inline_data_bytes_sum') == inline_before + 100
+
+
+def test_unexpected_ratings_share_one_label():
+    before = sample('app_feedback_submitted_total', rating='other')
+    metrics.count_feedback(None)
+    metrics.count_feedback('99')
+    assert sample('app_feedback_submitted_total', rating='other') == before + 2
+
+
+def test_render_exposes_the_text_format(monkeypatch):
+    monkeypatch.delenv('PROMETHEUS_MULTIPROC_DIR', raising=False)
+    metrics.count_chat_turn('analysis', 'model')
+    body, content_type = metrics.render()
+    assert content_type.startswith('text/plain')
+    assert b'app_chat_turns_total{kind="analysis",source="model"}' in body
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from model_client import CircuitBreaker, ModelBusyError, ResilientModelClient
+
+
+class Transient(Exception):
+    status_code = 503
+
+
+class Permanent(Exception):
+    status_code = 400
+
+
+class ScriptedModel:
+    """Raises or returns the scripted outcomes in order"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        if stream:
+            return iter(outcome)
+        return outcome
+
+
+def open_client(*outcomes):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    client = ResilientModelClient(lambda: ScriptedModel(Transient(), *outcomes), retries=0, breaker=breaker)
+    with pytest.raises(Transient):
+        client.generate_content('x')
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.06)
+    return client, breaker
+
+
+def test_permanent_error_in_half_open_probe_releases_it():
+    client, breaker = open_client(Permanent(), 'ok')
+    with pytest.raises(Permanent):
+        client.generate_content('x')
+    assert breaker.allow()
+    breaker.release()
+    assert client.generate_content('x') == 'ok'
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_abandoned_stream_probe_releases_it():
+    client, breaker = open_client(['a', 'b'], 'ok')
+    stream = client.generate_content('x', stream=True)
+    assert next(stream) == 'a'
+    stream.close()
+    assert client.generate_content('x') == 'ok'
+
+
+def test_stale_probe_is_replaced():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_busy_rejection_in_half_open_probe_releases_it(stream):
+    client, breaker = open_client('ok', ['a'])
+    client.acquire_timeout = 0.01
+    for _ in range(client.max_in_flight):
+        client._acquire()
+    with pytest.raises(ModelBusyError):
+        result = client.generate_content('x', stream=stream)
+        if stream:
+            list(result)
+    for _ in range(client.max_in_flight):
+        client._release()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert client.generate_content('x') == 'ok'
+    assert breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,92 @@
+import io
+import random
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import near_duplicates
+from near_duplicates import MAX_DISTANCE, NearDuplicateIndex, dhash
+
+
+def encode(image, fmt='PNG', **kwargs):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def gradient(size=(320, 240), seed=0):
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    return Image.fromarray(pixels).resize(size, Image.BILINEAR)
+
+
+def flip(phash, *bits):
+    for bit in bits:
+        phash ^= 1 << bit
+    return phash
+
+
+@pytest.fixture
+def index(tmp_path):
+    return NearDuplicateIndex(str(tmp_path / 'near_duplicates.db'), threshold=6)
+
+
+def test_dhash_survives_reencoding_and_resizing():
+    image = gradient()
+    original = dhash(encode(image))
+    assert (original ^ dhash(encode(image, 'JPEG', quality=70))).bit_count() <= 4
+    assert (original ^ dhash(encode(image.resize((160, 120))))).bit_count() <= 4
+    assert (original ^ dhash(encode(gradient(seed=1)))).bit_count() > MAX_DISTANCE
+
+
+def test_find_matches_within_the_threshold_only(index):
+    base = random.Random(1).getrandbits(64)
+    index.add(base, 'a' * 64, 'A cracked weld.', 'weld.jpg')
+    match = index.find(flip(base, 0, 17, 40, 63))
+    assert match.sha256 == 'a' * 64 and match.distance == 4 and match.analysis == 'A cracked weld.'
+    assert match.to_dict()['similarity'] == 93.8
+    assert index.find(flip(base, *range(0, 56, 8))) is None
+    assert index.find(flip(base, *range(0, 56, 8)), threshold=7).distance == 7
+
+
+def test_find_agrees_with_a_linear_scan(index):
+    rng = random.Random(2)
+    stored = {f"{i:064x}": rng.getrandbits(64) for i in range(300)}
+    for sha256, phash in stored.items():
+        index.add(phash, sha256, 'analysis')
+    for phash in list(stored.values())[:50]:
+        query = flip(phash, *rng.sample(range(64), rng.randint(0, 8)))
+        best = min((query ^ value).bit_count() for value in stored.values())
+        match = index.find(query)
+        assert (match.distance if match else None) == (best if best <= 6 else None)
+
+
+def test_ties_go_to_the_newest_and_each_file_keeps_its_first_analysis(index):
+    index.add(0b1, 'a' * 64, 'older')
+    index.add(0b10, 'b' * 64, 'newer')
+    index.add(0b10, 'b' * 64, 'analysed again')
+    assert index.find(0).analysis == 'newer'
+    assert index.stats()['entries'] == 2 and index.stats()['added'] == 2
+
+
+def test_get_checks_the_same_file_against_threshold_and_age(index, monkeypatch):
+    index.add(0, 'a' * 64, 'A cracked weld.')
+    assert index.get('a' * 64, flip(0, 1, 2)).distance == 2
+    assert index.get('a' * 64, flip(0, *range(7))) is None
+    assert index.get('b' * 64, 0) is None
+    now = near_duplicates.time.time()
+    monkeypatch.setattr(near_duplicates.time, 'time', lambda: now + index.max_age + 1)
+    assert index.get('a' * 64, 0) is None and index.find(0) is None
+
+
+def test_other_workers_see_new_entries_after_a_refresh(index):
+    other = NearDuplicateIndex(index.path, refresh_interval=0)
+    assert other.find(0) is None
+    index.add(0, 'a' * 64, 'from another worker')
+    assert other.find(0).analysis == 'from another worker'
+
+
+def test_thresholds_past_the_index_limit_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(str(tmp_path / 'nd.db'), threshold=MAX_DISTANCE + 1)
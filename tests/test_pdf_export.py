@@ -0,0 +1,125 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+from PIL import Image
+
+from pdf_export import PdfExportJobs, build_pdf, thumbnail
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    return PdfExportJobs(str(tmp_path / 'exports'), max_workers=1, stale_after=30)
+
+
+def wait_for(jobs, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = jobs.get(job_id)
+        if status['status'] in ('done', 'error'):
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def write_job(jobs, job_id, **fields):
+    status = {'job_id': job_id, 'status': 'running', 'progress': 0.5, 'filename': 'chat.pdf', 'messages': 300,
+              'created': time.time(), 'host': jobs._host, 'pid': os.getpid()}
+    status.update(fields)
+    jobs._write_status(job_id, status)
+    return status
+
+
+def png_bytes(size):
+    data = io.BytesIO()
+    Image.new('RGBA', size, (255, 0, 0, 128)).save(data, 'PNG')
+    return data.getvalue()
+
+
+def test_pdfs_are_built_in_memory_with_escaped_content(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    messages = [('user', 'Is <this> safe & sound?'), ('assistant', '**Yes**, no <hazards>.')] * 20
+    pdf = build_pdf(messages, png_bytes((2000, 1000)), 'weld<1>.png')
+    assert pdf.startswith(b'%PDF-') and pdf.rstrip().endswith(b'%%EOF')
+    assert os.listdir(tmp_path) == []
+
+
+def test_layout_progress_is_reported():
+    seen = []
+    build_pdf([('user', 'hello'), ('assistant', 'hi ' * 200)] * 30, progress=lambda done, total: seen.append(done / total))
+    assert seen and seen == sorted(seen) and seen[-1] <= 1.0
+
+
+def test_thumbnails_are_small_rgb_jpegs_or_none():
+    data, size = thumbnail(png_bytes((2000, 1000)))
+    assert max(size) == 600
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.format == 'JPEG' and image.mode == 'RGB'
+    assert thumbnail(b'not an image') is None
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_background_export_records_its_owner_and_finishes(jobs):
+    job_id = jobs.submit('chat.pdf', [('user', 'hello'), ('assistant', 'hi')] * 50)
+    status = wait_for(jobs, job_id)
+    assert status['status'] == 'done' and status['bytes'] > 0
+    assert status['host'] == jobs._host and isinstance(status['pid'], int)
+    assert status['heartbeat'] >= status['created']
+    with open(jobs.pdf_path(job_id), 'rb') as f:
+        assert f.read(5) == b'%PDF-'
+
+
+@pytest.mark.parametrize('state', ['queued', 'running'])
+def test_jobs_of_an_exited_worker_are_errors(jobs, state):
+    write_job(jobs, 'a' * 16, status=state, pid=exited_pid())
+    status = jobs.get('a' * 16)
+    assert status['status'] == 'error' and 'interrupted' in status['error']
+    # Recorded, so every worker reports the same
+    assert PdfExportJobs(jobs.folder).get('a' * 16)['status'] == 'error'
+
+
+def test_jobs_owned_by_another_host_are_judged_by_heartbeat(jobs):
+    write_job(jobs, 'b' * 16, host='elsewhere', pid=exited_pid())
+    assert jobs.get('b' * 16)['status'] == 'running'
+
+
+def test_running_jobs_without_a_recent_heartbeat_are_errors(jobs):
+    status = write_job(jobs, 'c' * 16)
+    status['heartbeat'] = time.time() - 31
+    # Written directly: _write_status would refresh the heartbeat
+    with open(jobs._status_path('c' * 16), 'w') as f:
+        json.dump(status, f)
+    status = jobs.get('c' * 16)
+    assert status['status'] == 'error' and 'stopped responding' in status['error']
+
+
+def test_quiet_jobs_keep_their_heartbeat(tmp_path, monkeypatch):
+    jobs = PdfExportJobs(str(tmp_path / 'exports'), max_workers=1, stale_after=1, heartbeat_interval=0.1)
+
+    def slow_build(messages, image, image_name, progress):
+        time.sleep(1.5)
+        return b'%PDF-1.4'
+
+    monkeypatch.setattr('pdf_export.build_pdf', slow_build)
+    job_id = jobs.submit('chat.pdf', [('user', 'hello')])
+    time.sleep(1.2)
+    assert jobs.get(job_id)['status'] == 'running'
+    assert wait_for(jobs, job_id)['status'] == 'done'
+
+
+def test_short_chats_are_streamed_as_an_attachment(app_client):
+    session = {'session_id': 'pdf-export'}
+    app_client.post('/chat', json={**session, 'message': 'Describe the weld quality'})
+    response = app_client.post('/export/pdf', json=session)
+    assert response.status_code == 200 and response.mimetype == 'application/pdf'
+    assert response.headers['Content-Disposition'].startswith('attachment')
+    assert response.data.startswith(b'%PDF-')
@@ -0,0 +1,62 @@
+import pytest
+
+from quick_replies import DEFAULT_REPLIES, AcknowledgmentResponder, offer_answer
+
+
+@pytest.mark.parametrize('message', ['yes', 'Yes!', 'yep', 'sure', 'of course'])
+def test_typed_yes_to_an_offer_reuses(message):
+    assert offer_answer(message) == 'reuse'
+
+
+@pytest.mark.parametrize('message', ['no', 'nope', 'ok', 'thanks', 'yes no', 'what about the corrosion?'])
+def test_any_other_typed_reply_to_an_offer_analyzes_fresh(message):
+    assert offer_answer(message) == 'fresh'
+
+
+
+@pytest.mark.parametrize('message, response_class', [
+    ('Thanks!', 'thanks'),
+    ("ok, got it.", 'thanks'),
+    ('no thanks', 'decline'),
+    ('ok no thanks', 'decline'),
+    ('yes sure', 'affirm'),
+    ('ok what about the left weld', None),
+    ('thanks for nothing, it is still leaking', None),
+])
+def test_only_plain_acknowledgments_are_classified(message, response_class):
+    assert AcknowledgmentResponder().classify(message) == response_class
+
+
+def test_replies_are_counted_and_overridable():
+    responder = AcknowledgmentResponder(replies={'thanks': 'Glad to help.'})
+    assert responder.reply('thank you') == 'Glad to help.'
+    assert responder.reply('nope') == DEFAULT_REPLIES['decline']
+    assert responder.reply('is it safe?') is None
+    stats = responder.stats()
+    assert stats['local'] == 2 and stats['fallback'] == 1 and stats['thanks'] == 1 and stats['decline'] == 1
+
+
+def test_classes_not_answered_locally_fall_back_to_the_model():
+    responder = AcknowledgmentResponder(local_classes=['thanks'])
+    assert responder.reply('yes') is None
+    assert responder.reply('ok') == DEFAULT_REPLIES['thanks']
+
+
+class CountingModel:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        self.calls += 1
+        return type('Response', (), {'text': 'The weld on the left shows a hairline crack.'})()
+
+
+def test_acknowledgments_after_an_analysis_skip_the_model(app_client, app_module, monkeypatch):
+    model = CountingModel()
+    monkeypatch.setattr(app_module.model, 'generate_content', model.generate_content)
+    session = {'session_id': 'ack-fast-path'}
+    app_client.post('/chat', json={**session, 'message': 'Describe the weld quality'})
+    assert model.calls == 1
+    response = app_client.post('/chat', json={**session, 'message': 'Thanks!'})
+    assert response.json['response'] == DEFAULT_REPLIES['thanks']
+    assert model.calls == 1
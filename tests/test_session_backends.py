@@ -0,0 +1,324 @@
+import io
+import socketserver
+import threading
+import time
+
+import pytest
+
+from session_backends import (
+    COMPRESS_THRESHOLD, RedisSessionBackend, RespClient, RespError, SQLiteSessionBackend,
+    _frame, _pack, decode_head, decode_message, encode_head, encode_message
+)
+from session_store import FeedbackEntry, FileRecord, Message, SessionConflictError, SessionRecord
+
+
+class RespStandIn(socketserver.ThreadingTCPServer):
+    """In-process Redis stand-in: the commands the session backend uses, on a clock tests can advance"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), RespHandler)
+        self.data = {}
+        self.expires = {}
+        self.writes = {}
+        self.offset = 0.0
+        self.lock = threading.Lock()
+
+    def now(self):
+        return time.time() + self.offset
+
+    def live(self, key):
+        if key in self.expires and self.expires[key] <= self.now():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+            self.written(key)
+        return key in self.data
+
+    def written(self, key):
+        self.writes[key] = self.writes.get(key, 0) + 1
+
+    def run(self, name, args):
+        if name == 'GET':
+            return self.data[args[0]] if self.live(args[0]) else None
+        if name == 'SET':
+            if b'NX' in args[2:] and self.live(args[0]):
+                return None
+            self.data[args[0]] = args[1]
+            self.expires.pop(args[0], None)
+            self.written(args[0])
+            return 'OK'
+        if name == 'DEL':
+            deleted = 0
+            for key in args:
+                if self.live(key):
+                    del self.data[key]
+                    self.expires.pop(key, None)
+                    self.written(key)
+                    deleted += 1
+            return deleted
+        if name == 'RPUSH':
+            items = self.data[args[0]] if self.live(args[0]) else []
+            items.extend(args[1:])
+            self.data[args[0]] = items
+            self.written(args[0])
+            return len(items)
+        if name == 'LRANGE':
+            items = self.data[args[0]] if self.live(args[0]) else []
+            stop = int(args[2])
+            return items[int(args[1]):None if stop == -1 else stop + 1]
+        if name == 'EXPIRE':
+            if not self.live(args[0]):
+                return 0
+            self.expires[args[0]] = self.now() + int(args[1])
+            return 1
+        if name == 'PERSIST':
+            return 1 if self.expires.pop(args[0], None) is not None else 0
+        if name == 'DBSIZE':
+            return sum(1 for key in list(self.data) if self.live(key))
+        return RespError(f"ERR unknown command '{name}'")
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def reply(self, value):
+        if value is None:
+            return b'$-1\r\n'
+        if isinstance(value, RespError):
+            return b'-%s\r\n' % str(value).encode()
+        if isinstance(value, str):
+            return b'+%s\r\n' % value.encode()
+        if isinstance(value, int):
+            return b':%d\r\n' % value
+        if isinstance(value, list):
+            return b'*%d\r\n' % len(value) + b''.join(self.reply(item) for item in value)
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def handle(self):
+        server = self.server
+        watched = {}
+        queued = None
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            name, args = args[0].decode().upper(), args[1:]
+            with server.lock:
+                if name == 'WATCH':
+                    for key in args:
+                        server.live(key)
+                        watched[key] = server.writes.get(key, 0)
+                    out = self.reply('OK')
+                elif name == 'UNWATCH':
+                    watched = {}
+                    out = self.reply('OK')
+                elif name == 'MULTI':
+                    queued = []
+                    out = self.reply('OK')
+                elif name == 'EXEC':
+                    for key in watched:
+                        server.live(key)
+                    changed = any(server.writes.get(key, 0) != count for key, count in watched.items())
+                    if changed:
+                        out = b'*-1\r\n'
+                    else:
+                        out = self.reply([server.run(queued_name, queued_args) for queued_name, queued_args in queued])
+                    queued = None
+                    watched = {}
+                elif queued is not None:
+                    queued.append((name, args))
+                    out = self.reply('QUEUED')
+                else:
+                    out = self.reply(server.run(name, args))
+            self.wfile.write(out)
+
+
+@pytest.fixture
+def stand_in():
+    server = RespStandIn()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def redis_backend(stand_in):
+    host, port = stand_in.server_address
+    return RedisSessionBackend(f'redis://{host}:{port}/0', idle_ttl=60)
+
+
+@pytest.fixture
+def sqlite_backend(tmp_path):
+    return SQLiteSessionBackend(str(tmp_path / 'sessions.db'), idle_ttl=60)
+
+
+def sample_record():
+    record = SessionRecord(session_id='s1')
+    record.files = [FileRecord('123_a.jpg', 'image/jpeg', 'ab' * 32, 2048, '00ff00ff00ff00ff')]
+    record.feedback = [FeedbackEntry(None, 'grün ✓', '2026-01-01T00:00:00')]
+    record.ticket_counter = 3
+    record.ticket_created = True
+    record.last_analysis = 'Crack on the left weld. ' * 50
+    record.context_summary = 'User: analyze'
+    record.summarized_count = 2
+    return record
+
+
+def reader_for(client, data):
+    client._local.reader = io.BytesIO(data)
+
+
+def test_resp_commands_are_framed_as_bulk_string_arrays():
+    assert RespClient._encode(('SET', 'k', b'\x00\r\n', 5)) == (
+        b'*4\r\n$3\r\nSET\r\n$1\r\nk\r\n$3\r\n\x00\r\n\r\n$1\r\n5\r\n'
+    )
+
+
+def test_resp_replies_are_parsed():
+    client = RespClient('redis://localhost')
+    reader_for(client, b'+OK\r\n:42\r\n$5\r\na\r\nbc\r\n$-1\r\n*2\r\n$1\r\nx\r\n*1\r\n:1\r\n*-1\r\n-ERR boom\r\n')
+    assert client._read_reply() == 'OK'
+    assert client._read_reply() == 42
+    assert client._read_reply() == b'a\r\nbc'
+    assert client._read_reply() is None
+    assert client._read_reply() == [b'x', [1]]
+    assert client._read_reply() is None
+    error = client._read_reply()
+    assert isinstance(error, RespError) and str(error) == 'ERR boom'
+
+
+def test_resp_closed_connection_raises():
+    client = RespClient('redis://localhost')
+    reader_for(client, b'')
+    with pytest.raises(ConnectionError):
+        client._read_reply()
+
+
+def test_head_round_trips_through_the_codec():
+    record = sample_record()
+    blob = encode_head(record)
+    assert blob[1] == 1  # compressed: the last analysis is over the threshold
+    decoded = decode_head('s1', blob)
+    assert decoded.files == record.files
+    assert decoded.feedback == record.feedback
+    for name in ('ticket_counter', 'ticket_created', 'last_analysis', 'context_summary', 'summarized_count',
+                 'last_interaction', 'near_duplicate_offered'):
+        assert getattr(decoded, name) == getattr(record, name)
+
+
+def test_message_round_trips_through_the_codec():
+    msg = Message('user', 'x' * (COMPRESS_THRESHOLD + 1), '2026-01-01T00:00:00')
+    assert decode_message(encode_message(msg)) == msg
+
+
+def test_old_heads_decode_missing_trailing_fields_to_defaults():
+    out = []
+    _pack([[], 7], out)
+    record = decode_head('s1', _frame(b''.join(out)))
+    assert record.ticket_counter == 7
+    assert record.near_duplicate_offered == '' and record.summarized_count == 0
+
+
+def test_sqlite_appends_messages_without_rewriting_the_head(sqlite_backend):
+    record = sqlite_backend.get_or_create('s1')
+    record.files = sample_record().files
+    sqlite_backend.save(record)
+    conn = sqlite_backend._connection()
+    head = conn.execute('SELECT head, version FROM sessions').fetchone()
+    sqlite_backend.append_message(record, 'user', 'hello')
+    sqlite_backend.append_message(record, 'assistant', 'hi')
+    assert conn.execute('SELECT head, version FROM sessions').fetchone() == head
+    assert [seq for (seq,) in conn.execute('SELECT seq FROM session_messages ORDER BY seq')] == [0, 1]
+    loaded = sqlite_backend.get('s1')
+    assert [m.content for m in loaded.messages] == ['hello', 'hi']
+    assert loaded.files == record.files
+
+
+def test_sqlite_idle_sessions_expire(sqlite_backend):
+    record = sqlite_backend.get_or_create('s1')
+    sqlite_backend.append_message(record, 'user', 'hello')
+    record.last_interaction = time.time() - 61
+    sqlite_backend.save(record)
+    assert sqlite_backend.get('s1') is None
+    assert sqlite_backend.stats()['messages'] == 0
+    stale = sqlite_backend.get_or_create('s2')
+    stale.last_interaction = time.time() - 61
+    sqlite_backend.save(stale)
+    assert sqlite_backend.sweep() == 1
+
+
+@pytest.mark.parametrize('backend', ['sqlite_backend', 'redis_backend'])
+def test_stale_copies_do_not_overwrite_a_newer_head(backend, request):
+    store = request.getfixturevalue(backend)
+    store.get_or_create('s1')
+    first, second = store.get('s1'), store.get('s1')
+    first.ticket_counter = 1
+    store.save(first)
+    store.save(first)
+    second.ticket_counter = 2
+    with pytest.raises(SessionConflictError):
+        store.save(second)
+    with pytest.raises(SessionConflictError):
+        store.clear_messages(second)
+    assert store.get('s1').ticket_counter == 1
+    assert store.get('s1').version == first.version == 2
+
+
+@pytest.mark.parametrize('backend', ['sqlite_backend', 'redis_backend'])
+def test_saving_a_deleted_session_recreates_it(backend, request):
+    store = request.getfixturevalue(backend)
+    record = store.get_or_create('s1')
+    store.save(record)
+    store.delete('s1')
+    record.ticket_counter = 5
+    store.save(record)
+    assert store.get('s1').ticket_counter == 5
+
+
+def test_redis_round_trip_and_delta_writes(redis_backend, stand_in):
+    record = redis_backend.get_or_create('s1')
+    record.files = sample_record().files
+    redis_backend.save(record)
+    head = stand_in.data[b'session:s1:head']
+    redis_backend.append_message(record, 'user', 'hello')
+    assert stand_in.data[b'session:s1:head'] is head
+    loaded = redis_backend.get('s1')
+    assert [m.content for m in loaded.messages] == ['hello']
+    assert loaded.files == record.files
+    redis_backend.clear_messages(loaded)
+    assert redis_backend.get('s1').messages == []
+
+
+def test_redis_transaction_aborts_when_the_watched_key_changes(redis_backend):
+    client = redis_backend.client
+    other = RespClient(f'redis://{client.host}:{client.port}/0')
+
+    def build(value):
+        other.execute('SET', 'k', 'theirs')
+        return [('SET', 'k', 'mine')]
+
+    assert client.transaction('k', build) is None
+    assert client.execute('GET', 'k') == b'theirs'
+
+
+def test_redis_idle_sessions_expire_on_the_server(redis_backend, stand_in):
+    record = redis_backend.get_or_create('s1')
+    redis_backend.append_message(record, 'user', 'hello')
+    redis_backend.save(record)
+    stand_in.offset = 59
+    assert redis_backend.get('s1') is not None
+    stand_in.offset = 61
+    assert redis_backend.get('s1') is None
+    assert redis_backend.stats()['keys'] == 0
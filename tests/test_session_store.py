@@ -0,0 +1,57 @@
+import time
+
+from session_store import ITEM_OVERHEAD, SessionStore, estimate_size
+
+
+def test_least_recently_used_session_is_evicted_past_max_sessions():
+    store = SessionStore(max_sessions=2, idle_ttl=0, memory_budget=0)
+    store.get_or_create('s1')
+    store.get_or_create('s2')
+    store.get('s1')
+    store.get_or_create('s3')
+    assert store.get('s2') is None
+    assert store.get('s1') is not None and store.get('s3') is not None
+    assert store.stats()['evicted_lru'] == 1
+
+
+def test_idle_sessions_expire_on_access_and_sweep():
+    store = SessionStore(idle_ttl=60)
+    store.get_or_create('s1').last_interaction = time.time() - 61
+    store.get_or_create('s2').last_interaction = time.time() - 61
+    # Creating a session drops the idle ones at the front of the LRU order
+    store.get_or_create('s3')
+    assert len(store) == 1 and store.stats()['evicted_idle'] == 2
+    store.get('s3').last_interaction = time.time() - 61
+    assert store.sweep() == 1
+    assert store.get('s3') is None
+
+
+def test_memory_is_accounted_as_messages_are_appended():
+    store = SessionStore(idle_ttl=0)
+    record = store.get_or_create('s1')
+    before = store.stats()['bytes']
+    msg = store.append_message(record, 'user', 'x' * 1000)
+    added = ITEM_OVERHEAD + 1000 + len(msg.timestamp)
+    assert store.stats()['bytes'] == before + added == record.nbytes
+    assert record.nbytes == estimate_size(record)
+    store.clear_messages(record)
+    assert store.stats()['bytes'] == before
+
+
+def test_memory_budget_evicts_other_sessions_but_never_the_active_one():
+    store = SessionStore(idle_ttl=0, memory_budget=5000)
+    store.get_or_create('s1')
+    active = store.get_or_create('s2')
+    store.append_message(active, 'user', 'x' * 10000)
+    assert store.get('s1') is None
+    assert store.get('s2') is active
+    assert store.stats()['evicted_memory'] == 1
+
+
+def test_saving_a_deleted_record_does_not_resurrect_it():
+    store = SessionStore()
+    record = store.get_or_create('s1')
+    store.delete('s1')
+    record.last_analysis = 'x' * 100
+    store.save(record)
+    assert store.get('s1') is None and store.stats()['bytes'] == 0
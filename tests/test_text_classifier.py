@@ -0,0 +1,43 @@
+import json
+import os
+
+import pytest
+
+import text_classifier
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           'benchmarks', 'classifier_corpus.json')
+
+with open(CORPUS_PATH) as f:
+    CORPUS = json.load(f)
+
+
+@pytest.mark.parametrize('entry', CORPUS['messages'], ids=lambda entry: entry['text'])
+def test_corpus_acknowledgments(entry):
+    assert text_classifier.is_acknowledgment(entry['text']) == entry['is_acknowledgment']
+
+
+@pytest.mark.parametrize('entry', CORPUS['responses'], ids=lambda entry: entry['text'])
+def test_corpus_hazards(entry):
+    assert text_classifier.hazard_terms(entry['text']) == entry['hazards']
+    assert text_classifier.scan(entry['text']).terms(text_classifier.HAZARD) == entry['hazards']
+
+
+def test_non_ascii_text_is_split_like_ascii_text():
+    text = 'Cracked—“hazardous” panel; faulted breaker, concerned crew'
+    assert text_classifier.hazard_terms(text) == ['cracked', 'hazard', 'concern']
+    assert text_classifier.hazard_terms(text.replace('—', ' ').replace('“', '"').replace('”', '"')) == \
+        ['cracked', 'hazard', 'concern']
+
+
+def test_hazard_report_counts_inflected_forms_under_their_keyword():
+    report = text_classifier.scan('A crack, two cracks and cracking paint.').hazard_report()
+    assert report == {'crack': {'count': 3, 'positions': [2, 13, 24]}}
+
+
+def test_inflected_forms_prefer_the_longest_keyword_and_skip_excluded_words():
+    forms = text_classifier.inflected_forms(['danger', 'dangerous', 'issue'], exclude=['issued'])
+    assert forms['dangerously'] == 'dangerous'
+    assert forms['dangers'] == 'danger'
+    assert forms['issues'] == 'issue'
+    assert 'issued' not in forms and 'danger' not in forms
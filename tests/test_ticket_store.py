@@ -0,0 +1,83 @@
+import csv
+import io
+import json
+
+import pytest
+
+import ticket_store
+from ticket_store import CROCKFORD, TicketStore, new_ticket_id, severity_for, ticket_id_bound
+
+
+@pytest.fixture
+def tickets(tmp_path):
+    return TicketStore(str(tmp_path / 'tickets.db'))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ticket_store's time, a minute past the previous reading each time it is read
+
+    Ids created within one millisecond are ordered by their random bits.
+    """
+    now = [1_700_000_000.0]
+
+    def tick():
+        now[0] += 60
+        return now[0]
+
+    monkeypatch.setattr(ticket_store.time, 'time', tick)
+    return now
+
+
+def test_ticket_ids_are_ulids_that_sort_by_creation_time():
+    ids = [new_ticket_id(1_700_000_000 + i / 1000) for i in range(50)]
+    assert ids == sorted(ids)
+    assert all(len(i) == 26 and set(i) <= set(CROCKFORD) for i in ids)
+    # Same millisecond: random bits keep them apart
+    assert len({new_ticket_id(1_700_000_000) for _ in range(100)}) == 100
+    assert ticket_id_bound(1_700_000_000) <= new_ticket_id(1_700_000_000) < ticket_id_bound(1_700_000_000.001)
+
+
+@pytest.mark.parametrize('terms, severity', [(['unsafe', 'crack'], 'high'), (['crack'], 'medium'), ([], 'low')])
+def test_severity_follows_the_hazard_terms(terms, severity):
+    assert severity_for(terms) == severity
+
+
+def test_tickets_round_trip_and_are_visible_to_other_workers(tickets):
+    created = tickets.create('s1', 'ab' * 32, 'weld.jpg', ['crack', 'rust'], 'A crack and some rust.')
+    other = TicketStore(tickets.path)
+    assert other.get(created.ticket_id) == created
+    assert other.get(created.ticket_id).severity == 'medium'
+    assert other.stats()['tickets'] == 1
+
+
+def test_pages_are_newest_first_and_filtered(tickets, clock):
+    created = [tickets.create(f"s{i % 2}", hazard_terms=['danger'] if i % 3 == 0 else []) for i in range(7)]
+    page, cursor = tickets.query(limit=3)
+    assert [t.ticket_id for t in page] == [t.ticket_id for t in reversed(created)][:3]
+    seen = [t.ticket_id for t in page]
+    while cursor:
+        page, cursor = tickets.query(limit=3, cursor=cursor)
+        seen += [t.ticket_id for t in page]
+    assert seen == [t.ticket_id for t in reversed(created)]
+    high, _ = tickets.query(severity='high')
+    assert {t.ticket_id for t in high} == {created[i].ticket_id for i in (0, 3, 6)}
+    session, _ = tickets.query(session_id='s1')
+    assert len(session) == 3 and all(t.session_id == 's1' for t in session)
+
+
+def test_time_ranges_are_id_ranges(tickets, clock):
+    for step in range(3):
+        tickets.create('s1', analysis=f"ticket {step}")
+    # Created at +60, +120 and +180 seconds
+    page, _ = tickets.query(since=1_700_000_090, until=1_700_000_150)
+    assert [t.analysis for t in page] == ['ticket 1']
+
+
+def test_exports_stream_every_ticket_in_chunks(tickets, clock, monkeypatch):
+    monkeypatch.setattr(ticket_store, 'EXPORT_CHUNK', 2)
+    created = [tickets.create('s1', file_name=f"{i}.jpg", hazard_terms=['crack', 'rust']) for i in range(5)]
+    lines = list(tickets.export_ndjson())
+    assert [json.loads(line)['ticket_id'] for line in lines] == [t.ticket_id for t in created]
+    rows = list(csv.DictReader(io.StringIO(''.join(tickets.export_csv(session_id='s1')))))
+    assert len(rows) == 5 and rows[0]['hazard_terms'] == 'crack rust' and rows[0]['file_name'] == '0.jpg'
@@ -0,0 +1,80 @@
+import base64
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from tiling import NOTHING_FOUND, TiledAnalyzer, plan_tiles
+
+
+def png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def half_blank(width, height, blank_width):
+    """Random noise with a flat grey strip blank_width px wide on the left"""
+    pixels = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    pixels[:, :blank_width] = 128
+    return png(Image.fromarray(pixels))
+
+
+def test_tiles_overlap_and_the_last_ones_end_at_the_edge():
+    tiles = plan_tiles(2500, 1000, 1024, 128)
+    assert [tile.box for tile in tiles] == [(0, 0, 1024, 1000), (896, 0, 1920, 1000), (1476, 0, 2500, 1000)]
+    assert [tile.label for tile in tiles] == ['R1C1', 'R1C2', 'R1C3']
+    assert len(plan_tiles(800, 600, 1024, 128)) == 1
+
+
+def test_the_tile_size_grows_to_stay_within_max_tiles():
+    analyzer = TiledAnalyzer(tile_size=100, overlap=10, max_tiles=4)
+    tiles, tile_size = analyzer._grid(1000, 1000)
+    assert len(tiles) <= 4 and tile_size > 100
+    assert tiles[-1].box[2:] == (1000, 1000)
+    with pytest.raises(ValueError):
+        TiledAnalyzer(tile_size=100, overlap=100)
+
+
+def test_only_large_images_are_tiled():
+    analyzer = TiledAnalyzer(tile_size=1024)
+    assert analyzer.wants((4000, 3000), 2048)
+    assert not analyzer.wants((2000, 1500), 2048)
+    assert not analyzer.wants((1000, 800), 512)
+
+
+def test_uniform_tiles_are_skipped_and_findings_are_merged_by_location():
+    calls = []
+
+    def analyze_tile(part, tile, grid):
+        calls.append(tile.label)
+        crop = Image.open(io.BytesIO(base64.b64decode(part['inline_data']['data'])))
+        assert crop.size == (tile.box[2] - tile.box[0], tile.box[3] - tile.box[1])
+        return 'A crack runs across the plate.' if tile.col == 1 else NOTHING_FOUND
+
+    analyzer = TiledAnalyzer(tile_size=256, overlap=0, workers=2)
+    report = analyzer.analyze(half_blank(768, 512, 256), analyze_tile)
+    assert sorted(calls) == ['R1C2', 'R1C3', 'R2C2', 'R2C3']
+    assert 'Analysed 4 tiles, skipped 2 uniform tiles.' in report
+    # The two neighbouring tiles reporting a crack become one region
+    assert '- crack: x 256-512, y 0-512 (tiles R1C2, R2C2)' in report
+    assert 'Nothing found: R1C3, R2C3' in report and 'Uniform, not analysed: R1C1, R2C1' in report
+    assert analyzer.stats() == {'images': 1, 'tiles': 6, 'analysed': 4, 'uniform': 2, 'failed': 0}
+
+
+def test_failed_tiles_are_reported_unless_every_tile_failed():
+    def flaky(part, tile, grid):
+        if tile.col == 2:
+            raise RuntimeError('model unavailable')
+        return NOTHING_FOUND
+
+    analyzer = TiledAnalyzer(tile_size=256, overlap=0)
+    report = analyzer.analyze(half_blank(768, 256, 0), flaky)
+    assert '1 tiles could not be analysed (R1C3)' in report and '- Nothing was found in any tile.' in report
+
+    def broken(part, tile, grid):
+        raise RuntimeError('model unavailable')
+
+    with pytest.raises(RuntimeError, match='model unavailable'):
+        analyzer.analyze(half_blank(768, 256, 0), broken)
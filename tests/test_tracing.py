@@ -0,0 +1,145 @@
+import io
+import json
+import pstats
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from flask import Flask
+from PIL import Image
+
+import tracing
+from session_store import FileRecord
+from profiling import RequestProfiler
+from upload_store import UploadStore
+
+
+@pytest.fixture
+def trace():
+    trace = tracing.Trace('POST /chat')
+    token = tracing._current.set(trace)
+    yield trace
+    tracing._current.reset(token)
+
+
+def by_name(trace):
+    return {span.name: span for span in trace.spans}
+
+
+def test_pool_task_spans_join_the_request_trace(trace):
+    barrier = threading.Barrier(2)
+
+    def task(name):
+        with tracing.span(name):
+            # Both tasks hold their span open at once
+            barrier.wait(timeout=5)
+            with tracing.span(f"{name}_step"):
+                pass
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        with tracing.span('attach_files'):
+            futures = [tracing.submit(pool, task, name) for name in ('first', 'second')]
+            for future in futures:
+                future.result()
+
+    spans = by_name(trace)
+    assert spans['attach_files'].parent_id == trace.root.span_id
+    for name in ('first', 'second'):
+        assert spans[name].parent_id == spans['attach_files'].span_id
+        assert spans[f"{name}_step"].parent_id == spans[name].span_id
+        assert spans[name].end_ns is not None
+
+
+def test_plain_pool_tasks_see_no_trace(trace):
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        assert pool.submit(tracing.current_trace).result() is None
+        assert tracing.submit(pool, tracing.current_trace).result() is trace
+
+
+def test_model_parts_record_their_reads_in_the_trace(trace, tmp_path):
+    store = UploadStore(str(tmp_path / 'uploads'))
+    records = []
+    for color in ('red', 'blue'):
+        data = io.BytesIO()
+        Image.new('RGB', (8, 8), color).save(data, 'PNG')
+        data.seek(0)
+        sha256, size, _ = store.put(data, f"{color}.png", 's1')
+        records.append(FileRecord(f"1_{color}.png", 'image/png', sha256, size))
+    with tracing.span('attach_files'):
+        store.model_parts(records)
+    spans = by_name(trace)
+    for stage in ('file_read', 'base64_encode'):
+        recorded = [span for span in trace.spans if span.name == stage]
+        assert len(recorded) == 2
+        assert all(span.parent_id == spans['attach_files'].span_id for span in recorded)
+
+
+def traced_app(exporter=None, profiler=None):
+    app = Flask(__name__)
+    tracing.instrument(app, exporter, profiler)
+
+    @app.route('/chat/<session_id>')
+    def chat(session_id):
+        with tracing.span('model_call', session=session_id):
+            with tracing.span('parse'):
+                pass
+        return 'ok'
+
+    return app.test_client()
+
+
+def test_requests_carry_their_id_and_stage_timings():
+    client = traced_app()
+    response = client.get('/chat/s1', headers={'X-Request-ID': 'req-42'})
+    assert response.headers['X-Request-ID'] == 'req-42'
+    timing = response.headers['Server-Timing']
+    assert 'model_call;dur=' in timing and 'parse;dur=' in timing and timing.split(', ')[-1].startswith('total;dur=')
+    # Ids that are not header-safe tokens are replaced
+    assert client.get('/chat/s1', headers={'X-Request-ID': 'a b'}).headers['X-Request-ID'] != 'a b'
+
+
+def test_finished_traces_are_exported_as_otlp_lines(tmp_path):
+    exporter = tracing.TraceExporter(str(tmp_path / 'traces.jsonl'))
+    client = traced_app(exporter)
+    for _ in range(2):
+        client.get('/chat/s1').close()
+    lines = (tmp_path / 'traces.jsonl').read_text().splitlines()
+    assert len(lines) == 2 and exporter.stats()['exported'] == 2
+    spans = {span['name']: span for span in json.loads(lines[0])['resourceSpans'][0]['scopeSpans'][0]['spans']}
+    assert spans['parse']['parentSpanId'] == spans['model_call']['spanId']
+    assert spans['model_call']['parentSpanId'] == spans['GET /chat/<session_id>']['spanId']
+    assert {'key': 'session', 'value': {'stringValue': 's1'}} in spans['model_call']['attributes']
+
+
+def test_unsampled_traces_are_not_exported(tmp_path):
+    exporter = tracing.TraceExporter(str(tmp_path / 'traces.jsonl'), sample_rate=0.0)
+    traced_app(exporter).get('/chat/s1').close()
+    assert not (tmp_path / 'traces.jsonl').exists()
+
+
+def test_armed_profiler_profiles_the_next_matching_requests(tmp_path):
+    profiler = RequestProfiler(str(tmp_path / 'profiles'))
+    client = traced_app(profiler=profiler)
+    profiler.arm(2, path_prefix='/chat')
+    client.get('/elsewhere').close()
+    for _ in range(3):
+        client.get('/chat/s1').close()
+    status = profiler.status()
+    assert status['armed'] is None and len(status['profiles']) == 2
+    stats = pstats.Stats(str(tmp_path / 'profiles' / status['profiles'][0]))
+    assert any(name == 'chat' for _, _, name in stats.stats)
+
+
+def test_sampling_profiles_are_folded_stacks(tmp_path):
+    profiler = RequestProfiler(str(tmp_path / 'profiles'), sample_interval=0.001)
+    profiler.arm(1, mode='sample')
+    handle = profiler.start('/chat/s1', 'req-1')
+    time.sleep(0.05)
+    profiler.finish(handle)
+    (name,) = profiler.status()['profiles']
+    lines = (tmp_path / 'profiles' / name).read_text().splitlines()
+    assert name.endswith('-req-1.folded') and lines
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+    with pytest.raises(ValueError):
+        profiler.arm(1, mode='perf')
@@ -0,0 +1,105 @@
+import hashlib
+import io
+import os
+
+import pytest
+from flask import Flask, jsonify, request
+
+import upload_ingest
+from upload_ingest import MB
+from upload_store import UploadStore, sniff_mime_type
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(str(tmp_path / 'uploads'))
+
+
+@pytest.fixture
+def client(store):
+    app = Flask(__name__)
+    # Configured like app.py: /upload takes up to 4 files of up to the per-type limit each
+    upload_ingest.configure(
+        app, store.folder, image_limit=MB, audio_limit=2 * MB, other_limit=MB,
+        body_limits=[('/upload', 4 * MB + MB)]
+    )
+
+    @app.route('/upload', methods=['POST'])
+    def upload():
+        files = request.files.getlist('files')
+        return jsonify({'sizes': [f.stream.size for f in files]})
+
+    @app.route('/store', methods=['POST'])
+    def store_upload():
+        file = request.files['file']
+        sha256, size, mime_type = upload_ingest.save_upload(store, file, file.filename, 's1')
+        return jsonify({'sha256': sha256, 'size': size, 'mime_type': mime_type})
+
+    @app.errorhandler(413)
+    def too_large(error):
+        return jsonify({'error': error.description}), 413
+
+    return app.test_client()
+
+
+def png(size):
+    return b'\x89PNG\r\n\x1a\n' + b'\0' * (size - 8)
+
+
+def test_several_files_over_one_file_limit(client):
+    size = int(0.9 * MB)
+    data = {'files': [(io.BytesIO(png(size)), f'{i}.png') for i in range(4)]}
+    response = client.post('/upload', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert response.json['sizes'] == [size] * 4
+
+
+def test_each_file_still_held_to_its_limit(client):
+    data = {'files': [(io.BytesIO(png(MB // 2)), 'a.png'), (io.BytesIO(png(MB + 1)), 'b.png')]}
+    response = client.post('/upload', data=data, content_type='multipart/form-data')
+    assert response.status_code == 413
+    assert 'b.png' in response.json['error']
+
+
+def wav(size):
+    return b'RIFF' + (size - 8).to_bytes(4, 'little') + b'WAVE' + b'\0' * (size - 12)
+
+
+def leftovers(store):
+    return [name for name in os.listdir(store.folder) if name.startswith('.ingest-')]
+
+
+def test_uploads_are_hashed_while_streaming_and_moved_into_the_store(client, store):
+    data = png(MB // 2)
+    response = client.post('/store', data={'file': (io.BytesIO(data), 'a.png')}, content_type='multipart/form-data')
+    assert response.json == {'sha256': hashlib.sha256(data).hexdigest(), 'size': len(data), 'mime_type': 'image/png'}
+    with open(store.find(response.json['sha256']), 'rb') as f:
+        assert f.read() == data
+    assert store.stats()['stored'] == 1 and leftovers(store) == []
+
+
+def test_the_sniffed_format_picks_the_limit_not_the_name(client):
+    # 1.5 MB is over the image limit but within the audio one
+    data = {'files': [(io.BytesIO(wav(3 * MB // 2)), 'clip.png')]}
+    assert client.post('/upload', data=data, content_type='multipart/form-data').status_code == 200
+    data = {'files': [(io.BytesIO(png(3 * MB // 2)), 'photo.wav')]}
+    assert client.post('/upload', data=data, content_type='multipart/form-data').status_code == 413
+
+
+def test_rejected_uploads_leave_no_temp_files(client, store):
+    data = {'files': [(io.BytesIO(png(MB // 2)), 'a.png'), (io.BytesIO(png(MB + 1)), 'b.png')]}
+    client.post('/upload', data=data, content_type='multipart/form-data')
+    assert leftovers(store) == []
+
+
+@pytest.mark.parametrize('head, mime_type', [
+    (b'\xff\xd8\xff\xe0', 'image/jpeg'),
+    (b'GIF89a', 'image/gif'),
+    (b'RIFF\0\0\0\0WEBPVP8 ', 'image/webp'),
+    (b'fLaC', 'audio/flac'),
+    (b'ID3\x04', 'audio/mp3'),
+    (b'PK\x03\x04', 'application/zip'),
+    (b'%PDF-1.4', None),
+])
+def test_formats_are_sniffed_from_magic_bytes(head, mime_type):
+    assert sniff_mime_type(head) == mime_type
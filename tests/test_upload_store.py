@@ -0,0 +1,162 @@
+import io
+import os
+import time
+
+import pytest
+
+from session_backends import SQLiteSessionBackend
+from session_store import FileRecord, SessionStore
+from upload_store import UploadStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(str(tmp_path / 'uploads'))
+
+
+def put(store, data, session_id, filename='a.jpg'):
+    sha256, size, _ = store.put(io.BytesIO(data), filename, session_id)
+    return FileRecord(f"1_{filename}", 'image/jpeg', sha256, size)
+
+
+def age(store, file_record, session_id, seconds):
+    """Pretend the session last touched its ref (and the blob was written) seconds ago"""
+    then = time.time() - seconds
+    os.utime(store.path(file_record), (then, then))
+    ref = os.path.join(store._ref_dir(file_record), store._ref_name(session_id))
+    os.utime(ref, (then, then))
+
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 32
+
+
+def test_identical_bytes_share_one_blob_whatever_their_names(store):
+    first = put(store, PNG, 's1', 'a.png')
+    second = put(store, PNG, 's2', 'b.jpg')
+    assert store.path(first) == store.path(second) == os.path.join(store.folder, first.sha256)
+    assert store.stats()['stored'] == 1 and store.stats()['deduplicated'] == 1
+    store.release(first, 's1')
+    assert os.path.exists(store.path(second))
+
+
+def test_put_and_serving_use_the_sniffed_mime_type(store):
+    sha256, _, mime_type = store.put(io.BytesIO(PNG), 'photo.jpg', 's1')
+    assert mime_type == 'image/png'
+    assert store.sniffed_mime_type(store.find(sha256)) == 'image/png'
+    sha256, _, mime_type = store.put(io.BytesIO(b'plain text'), 'notes.png', 's1')
+    assert mime_type is None
+    assert store.sniffed_mime_type(store.find(sha256)) == 'application/octet-stream'
+
+
+def test_blobs_named_with_an_extension_are_renamed_with_their_refs(tmp_path, store):
+    record = put(store, PNG, 's1')
+    blob, ref_dir = store.path(record), store._ref_dir(record)
+    os.rename(blob, blob + '.png')
+    os.rename(ref_dir, ref_dir + '.png')
+    # A second copy under another extension is dropped
+    with open(blob + '.jpg', 'wb') as f:
+        f.write(PNG)
+    reopened = UploadStore(store.folder)
+    assert reopened.find(record.sha256) == blob
+    assert sorted(os.listdir(store.folder)) == sorted(['refs', 'variants', record.sha256])
+    assert os.listdir(ref_dir) == [store._ref_name('s1')]
+    reopened.release(record, 's1')
+    assert not os.path.exists(blob)
+
+
+def test_quota_never_evicts_blobs_in_use(store):
+    expired = put(store, b'x' * 4000, 's1')
+    fresh = put(store, b'y' * 4000, 's2')
+    age(store, expired, 's1', 600)
+    age(store, fresh, 's2', 60)
+    # A blob that lost its refs (e.g. a worker died between adopt and save)
+    with open(os.path.join(store.folder, 'f' * 64), 'wb') as f:
+        f.write(b'z' * 4000)
+    report = store.collect(ref_ttl=300, quota_bytes=1000)
+    assert report['blobs_deleted'] == 1 and report['quota_evicted'] == 1 and report['quota_in_use'] == 1
+    assert sorted(os.listdir(store.folder)) == sorted(['refs', 'variants', os.path.basename(store.path(fresh))])
+
+
+def test_quota_keeps_every_referenced_blob_when_refs_never_expire(store):
+    kept = put(store, b'x' * 4000, 's1')
+    age(store, kept, 's1', 10 ** 6)
+    report = store.collect(ref_ttl=0, quota_bytes=1000)
+    assert report['quota_evicted'] == 0 and report['quota_in_use'] == 1
+    assert os.path.exists(store.path(kept))
+
+
+def test_release_keeps_refs_used_since(store):
+    shared = put(store, b'x' * 10, 's1')
+    store.release(shared, 's1', unless_used_after=time.time() - 60)
+    assert os.path.exists(store.path(shared))
+    store.release(shared, 's1', unless_used_after=time.time() + 60)
+    assert not os.path.exists(store.path(shared))
+
+
+def test_release_deletes_the_blob_after_its_last_session(store):
+    shared = put(store, b'x' * 10, 's1')
+    put(store, b'x' * 10, 's2')
+    store.release(shared, 's1')
+    assert os.path.exists(store.path(shared))
+    store.release(shared, 's2')
+    assert not os.path.exists(store.path(shared))
+
+
+@pytest.mark.parametrize('make_sessions', [
+    lambda tmp_path: SessionStore(idle_ttl=60),
+    lambda tmp_path: SQLiteSessionBackend(str(tmp_path / 'sessions.db'), idle_ttl=60),
+], ids=['memory', 'sqlite'])
+def test_swept_sessions_release_their_uploads(tmp_path, store, make_sessions):
+    sessions = make_sessions(tmp_path)
+    sessions.on_evict = lambda record: [store.release(f, record.session_id, unless_used_after=record.last_interaction)
+                                        for f in record.files]
+    record = sessions.get_or_create('s1')
+    record.files = [put(store, b'x' * 10, 's1')]
+    age(store, record.files[0], 's1', 120)
+    record.last_interaction = time.time() - 61
+    sessions.save(record)
+    assert sessions.sweep() == 1
+    assert not os.path.exists(store.path(record.files[0]))
+
+
+def test_memory_store_evictions_reach_the_hook_outside_the_lock():
+    sessions = SessionStore(max_sessions=1, idle_ttl=0)
+    evicted = []
+
+    def on_evict(record):
+        # Another thread could take the lock here; this one must not hold it
+        assert sessions._lock.acquire(blocking=False)
+        sessions._lock.release()
+        evicted.append(record.session_id)
+
+    sessions.on_evict = on_evict
+    sessions.get_or_create('s1')
+    sessions.get_or_create('s2')
+    assert evicted == ['s1']
+
+
+def test_model_parts_are_encoded_once_and_then_served_from_the_cache(store):
+    record = put(store, PNG, 's1', 'a.png')
+    record.mime_type = 'image/png'
+    first = store.model_part(record)
+    os.remove(store.path(record))
+    # No disk read on later turns
+    assert store.model_part(record) is first
+    assert first['inline_data']['mime_type'] == 'image/png'
+    assert store.stats()['cache_hits'] == 1 and store.stats()['cache_misses'] == 1
+
+
+def test_model_part_cache_stays_within_its_byte_budget(tmp_path):
+    store = UploadStore(str(tmp_path / 'uploads'), cache_bytes=200)
+    records = [put(store, PNG + bytes([i]) * 60, 's1', f"{i}.png") for i in range(3)]
+    for record in records:
+        store.model_part(record)
+    stats = store.stats()
+    assert stats['cache_entries'] == 1 and stats['cache_bytes'] <= 200
+    store.release(records[-1], 's1')
+    assert store.stats()['cache_entries'] == 0
+
+
+def test_files_the_model_cannot_take_have_no_part(store):
+    record = put(store, b'plain text', 's1', 'notes.txt')
+    assert store.model_part(record) is None
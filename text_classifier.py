@@ -0,0 +1,240 @@
+import re
+from dataclasses import dataclass, field
+from typing import List
+
+from quick_replies import ACKNOWLEDGMENT_CLASSES
+
+ACKNOWLEDGMENT = 'acknowledgment'
+QUESTION = 'question'
+HAZARD = 'hazard'
+
+ACKNOWLEDGMENTS = [phrase for phrases in ACKNOWLEDGMENT_CLASSES.values() for phrase in phrases]
+
+# Words that make a short message a question or request rather than an acknowledgment
+QUESTION_WORDS = [
+    'what', 'why', 'how', 'when', 'where', 'who', 'which', 'can', 'could', 'would', 'should',
+    'is', 'are', 'does', 'do', 'analyze', 'explain', 'tell', 'show', 'describe'
+]
+
+# Words in a response that suggest something worth a ticket (inflected forms match too)
+HAZARD_KEYWORDS = [
+    'hazard', 'risk', 'danger', 'dangerous',
+    'broken', 'damaged', 'crack', 'cracked', 'defect', 'defective',
+    'unsafe', 'malfunction', 'failure', 'fault', 'faulty',
+    'concern', 'issue', 'problem', 'warning', 'alert'
+]
+
+# Regular endings a keyword (or its stem) takes: plurals, -ed, -ing and a few derivations
+INFLECTION_SUFFIXES = ['s', 'es', 'e', 'ed', 'ing', 'y', 'ly', 'ier', 'iest', 'ous', 'ously', 'atic']
+# Endings stripped from a keyword to find its stem ("damaged" -> "damag-ing", "failure" -> "fail-ed")
+STEM_SUFFIXES = ['ed', 'ure', 'ous', 'ive', 'y']
+
+# Words a hazard keyword derives from other than by an ending; their inflections match too
+HAZARD_DERIVATIONS = {'danger': ['endanger']}
+# Forms that look inflected but are harmless ("the permit was issued", "faulted breakers were reset")
+HAZARD_NON_TERMS = ['issued', 'issuing', 'faulted', 'defected', 'defecting']
+
+_WORD = re.compile(r"[\w']+")
+# The same split for ASCII text, done in C by str.translate() and str.split()
+_ASCII_SEPARATORS = str.maketrans({c: ' ' for c in map(chr, range(128)) if not (c.isalnum() or c in "_'")})
+
+# Acknowledgments longer than this are treated as requests ("ok now check the wiring")
+MAX_ACKNOWLEDGMENT_WORDS = 3
+
+
+@dataclass(slots=True)
+class TermMatch:
+    term: str
+    category: str
+    start: int
+    end: int
+
+
+@dataclass(slots=True)
+class ScanResult:
+    """All keyword hits in one text, in order of appearance"""
+    text: str
+    matches: List[TermMatch] = field(default_factory=list)
+
+    def of(self, category):
+        return [m for m in self.matches if m.category == category]
+
+    def terms(self, category):
+        """Distinct terms of a category, in order of first appearance"""
+        return list(dict.fromkeys(m.term for m in self.of(category)))
+
+    def counts(self, category):
+        counts = {}
+        for m in self.of(category):
+            counts[m.term] = counts.get(m.term, 0) + 1
+        return counts
+
+    def positions(self, category):
+        positions = {}
+        for m in self.of(category):
+            positions.setdefault(m.term, []).append(m.start)
+        return positions
+
+    @property
+    def is_acknowledgment(self):
+        """Short message with an acknowledgment phrase and no question word"""
+        return (
+            0 < len(self.text.split()) <= MAX_ACKNOWLEDGMENT_WORDS and
+            any(m.category == ACKNOWLEDGMENT for m in self.matches) and
+            not any(m.category == QUESTION for m in self.matches)
+        )
+
+    def hazard_report(self):
+        """Hazard terms with their counts and character offsets"""
+        counts = self.counts(HAZARD)
+        return {
+            term: {'count': counts[term], 'positions': positions}
+            for term, positions in self.positions(HAZARD).items()
+        }
+
+
+def _words(lowered):
+    if lowered.isascii():
+        return lowered.translate(_ASCII_SEPARATORS).split()
+    return _WORD.findall(lowered)
+
+
+def _positions(words, word):
+    """Indexes of word in the list, found by list.index()"""
+    i = words.index(word)
+    while True:
+        yield i
+        try:
+            i = words.index(word, i + 1)
+        except ValueError:
+            return
+
+
+def inflected_forms(keywords, derivations=None, exclude=()):
+    """{form: keyword} for the inflected forms of single-word keywords
+
+    Each keyword, its derivations and its stem (the keyword without an
+    ending from STEM_SUFFIXES) take every ending in INFLECTION_SUFFIXES,
+    dropping a final 'e' before a vowel. Forms of a keyword itself win over
+    forms of another keyword's stem, and longer keywords win over shorter
+    ones ("dangerously" is "dangerous", not "danger"). Keywords and excluded
+    words are never forms.
+    """
+    keywords = [keyword.lower() for keyword in keywords if ' ' not in keyword]
+    bases = [(keyword, keyword) for keyword in sorted(keywords, key=len, reverse=True)]
+    for keyword in keywords:
+        bases.extend((derived, keyword) for derived in (derivations or {}).get(keyword, ()))
+    for keyword in keywords:
+        for suffix in STEM_SUFFIXES:
+            if keyword.endswith(suffix) and len(keyword) - len(suffix) >= 3:
+                bases.append((keyword[:-len(suffix)], keyword))
+                break
+    skip = set(keywords) | set(exclude)
+    forms = {}
+    for base, keyword in bases:
+        for suffix in [''] + INFLECTION_SUFFIXES:
+            if suffix and base.endswith('e') and suffix[0] in 'aeiouy':
+                form = base[:-1] + suffix
+            else:
+                form = base + suffix
+            if form not in skip:
+                forms.setdefault(form, keyword)
+    return forms
+
+
+class KeywordClassifier:
+    """Finds whole-word keyword hits for several categories in one pass
+
+    Phrases are compiled into a trie keyed by word, so the text is
+    tokenized once and each token costs one dict lookup however many
+    keywords there are. Matching is on whole words only, which keeps "is"
+    from firing inside "this", and the longest phrase wins ("no thanks"
+    over "no"). Inflected forms are compiled into the same trie, so they
+    cost nothing extra at scan time.
+    """
+
+    def __init__(self, categories, forms=None):
+        # forms maps a category to {word: phrase}: other words reported as that phrase
+        self._trie = {}
+        for category, phrases in categories.items():
+            for phrase in phrases:
+                self._add(phrase.lower().split(), phrase.lower(), category)
+        for category, category_forms in (forms or {}).items():
+            for form, phrase in category_forms.items():
+                self._add([form], phrase.lower(), category)
+
+    def _add(self, words, term, category):
+        node = self._trie
+        for word in words:
+            node = node.setdefault(word, {})
+        # The first category to claim a phrase keeps it
+        node.setdefault(None, (term, category))
+
+    def _matches(self, words):
+        """(term, category, first word, last word) of each hit, in order"""
+        trie = self._trie
+        # Almost every word misses the trie; those are skipped in C
+        hits = trie.keys() & set(words)
+        if not hits:
+            return
+        candidates = sorted(i for word in hits for i in _positions(words, word))
+        resume = 0
+        for i in candidates:
+            if i < resume:
+                continue
+            node = trie[words[i]]
+            best = None
+            j = i
+            while node is not None:
+                if None in node:
+                    best = (node[None], j)
+                j += 1
+                node = node.get(words[j]) if j < len(words) else None
+            if best is not None:
+                (term, category), last = best
+                yield term, category, i, last
+                resume = last + 1
+
+    def scan(self, text):
+        text = text or ''
+        lowered = text.lower()
+        words = _words(lowered)
+        matches = []
+        spans = None
+        for term, category, first, last in self._matches(words):
+            if spans is None:
+                spans = [m.span() for m in _WORD.finditer(lowered)]
+            matches.append(TermMatch(term, category, spans[first][0], spans[last][1]))
+        return ScanResult(text, matches)
+
+    def terms(self, text, category):
+        """Distinct terms of a category, in order of first appearance
+
+        Same as scan(text).terms(category), without the character offsets.
+        """
+        words = _words((text or '').lower())
+        return list(dict.fromkeys(term for term, found, _, _ in self._matches(words) if found == category))
+
+
+# Compiled once at import and shared by every request
+HAZARD_FORMS = inflected_forms(HAZARD_KEYWORDS, HAZARD_DERIVATIONS, HAZARD_NON_TERMS)
+CLASSIFIER = KeywordClassifier(
+    {ACKNOWLEDGMENT: ACKNOWLEDGMENTS, QUESTION: QUESTION_WORDS, HAZARD: HAZARD_KEYWORDS},
+    forms={HAZARD: HAZARD_FORMS}
+)
+# hazard_terms() runs on every model response; without the short everyday words of the
+# other categories in the trie, most responses have no candidate words at all
+HAZARDS = KeywordClassifier({HAZARD: HAZARD_KEYWORDS}, forms={HAZARD: HAZARD_FORMS})
+
+
+def scan(text):
+    return CLASSIFIER.scan(text)
+
+
+def is_acknowledgment(message):
+    return scan(message).is_acknowledgment
+
+
+def hazard_terms(text):
+    """Distinct hazard keywords in a response, in order of first appearance"""
+    return HAZARDS.terms(text, HAZARD)
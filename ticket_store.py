@@ -0,0 +1,250 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import List, Optional
+
+# Crockford base32, as used by ULIDs
+CROCKFORD = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+SEVERITIES = ('high', 'medium', 'low')
+
+# Hazard terms that make a ticket high severity; any other hazard term is medium
+HIGH_SEVERITY_TERMS = {'hazard', 'danger', 'dangerous', 'unsafe', 'broken', 'failure', 'malfunction'}
+
+EXPORT_CHUNK = 1000
+MAX_PAGE_SIZE = 500
+
+CSV_COLUMNS = ['ticket_id', 'created', 'session_id', 'type', 'severity', 'file_sha256', 'file_name',
+               'hazard_terms', 'analysis']
+
+
+def new_ticket_id(now=None):
+    """ULID-style id: 48-bit millisecond time + 80 random bits, 26 base32 chars
+
+    Ids sort by creation time and need no coordination between workers or
+    hosts.
+    """
+    ms = int((time.time() if now is None else now) * 1000)
+    return _encode((ms << 80) | int.from_bytes(os.urandom(10), 'big'))
+
+
+def ticket_id_bound(timestamp):
+    """Smallest id that can be created at timestamp (for time range queries)"""
+    return _encode(int(timestamp * 1000) << 80)
+
+
+def _encode(value):
+    return ''.join(CROCKFORD[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+
+def severity_for(hazard_terms):
+    if any(term in HIGH_SEVERITY_TERMS for term in hazard_terms):
+        return 'high'
+    return 'medium' if hazard_terms else 'low'
+
+
+@dataclass(slots=True)
+class Ticket:
+    ticket_id: str
+    created_at: float
+    session_id: str
+    type: str = 'quality_inspection'
+    severity: str = 'low'
+    file_sha256: Optional[str] = None
+    file_name: Optional[str] = None
+    hazard_terms: List[str] = field(default_factory=list)
+    analysis: Optional[str] = None
+
+    def to_dict(self):
+        data = asdict(self)
+        data['created'] = datetime.fromtimestamp(self.created_at).isoformat()
+        return data
+
+
+class TicketStore:
+    """Tickets in a SQLite (WAL) database shared by all workers on a host
+
+    Ticket ids are time-ordered, so inserts append to the end of the id
+    index and the id doubles as the time index: time ranges become id
+    ranges. Pages are keyset-paginated on the id (newest first) and
+    exports read in id-ordered chunks, so neither slows down with depth
+    nor holds a read transaction open for the whole export.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = {'created': 0, 'queries': 0, 'exported': 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+
+    def _connection(self):
+        # Connections are per thread and re-opened after fork (preload_app)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=10000')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        self._connection().executescript("""
+            CREATE TABLE IF NOT EXISTS tickets (
+                ticket_id TEXT NOT NULL UNIQUE,
+                created_at REAL NOT NULL,
+                session_id TEXT NOT NULL,
+                type TEXT NOT NULL,
+                severity TEXT NOT NULL,
+                file_sha256 TEXT,
+                file_name TEXT,
+                hazard_terms TEXT NOT NULL,
+                analysis TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_tickets_session ON tickets (session_id, ticket_id);
+            CREATE INDEX IF NOT EXISTS idx_tickets_severity ON tickets (severity, ticket_id);
+            CREATE INDEX IF NOT EXISTS idx_tickets_file ON tickets (file_sha256);
+        """)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def create(self, session_id, file_sha256=None, file_name=None, hazard_terms=(), analysis=None,
+               ticket_type='quality_inspection'):
+        now = time.time()
+        ticket = Ticket(
+            ticket_id=new_ticket_id(now),
+            created_at=now,
+            session_id=session_id,
+            type=ticket_type,
+            severity=severity_for(hazard_terms),
+            file_sha256=file_sha256,
+            file_name=file_name,
+            hazard_terms=list(hazard_terms),
+            analysis=analysis
+        )
+        self._connection().execute(
+            'INSERT INTO tickets (ticket_id, created_at, session_id, type, severity, file_sha256, file_name, '
+            'hazard_terms, analysis) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (ticket.ticket_id, ticket.created_at, ticket.session_id, ticket.type, ticket.severity,
+             ticket.file_sha256, ticket.file_name, ','.join(ticket.hazard_terms), ticket.analysis)
+        )
+        self._count('created')
+        return ticket
+
+    def get(self, ticket_id):
+        row = self._connection().execute(
+            'SELECT ticket_id, created_at, session_id, type, severity, file_sha256, file_name, hazard_terms, analysis '
+            'FROM tickets WHERE ticket_id = ?', (ticket_id,)
+        ).fetchone()
+        return _ticket(row) if row else None
+
+    def _where(self, session_id, severity, since, until, file_sha256):
+        clauses, params = [], []
+        if session_id:
+            clauses.append('session_id = ?')
+            params.append(session_id)
+        if severity:
+            clauses.append('severity = ?')
+            params.append(severity)
+        if file_sha256:
+            clauses.append('file_sha256 = ?')
+            params.append(file_sha256)
+        if since is not None:
+            clauses.append('ticket_id >= ?')
+            params.append(ticket_id_bound(since))
+        if until is not None:
+            clauses.append('ticket_id < ?')
+            params.append(ticket_id_bound(until))
+        return clauses, params
+
+    def query(self, session_id=None, severity=None, since=None, until=None, file_sha256=None,
+              cursor=None, limit=50):
+        """One page of tickets, newest first; returns (tickets, next_cursor)
+
+        cursor is the next_cursor of the previous page (None for the first).
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        clauses, params = self._where(session_id, severity, since, until, file_sha256)
+        if cursor:
+            clauses.append('ticket_id < ?')
+            params.append(cursor)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._connection().execute(
+            'SELECT ticket_id, created_at, session_id, type, severity, file_sha256, file_name, hazard_terms, analysis '
+            f'FROM tickets {where} ORDER BY ticket_id DESC LIMIT ?', (*params, limit + 1)
+        ).fetchall()
+        self._count('queries')
+        tickets = [_ticket(row) for row in rows[:limit]]
+        next_cursor = tickets[-1].ticket_id if len(rows) > limit else None
+        return tickets, next_cursor
+
+    def iter_tickets(self, session_id=None, severity=None, since=None, until=None, file_sha256=None):
+        """Every matching ticket, oldest first, read EXPORT_CHUNK rows at a time"""
+        clauses, params = self._where(session_id, severity, since, until, file_sha256)
+        last = ''
+        while True:
+            where = ' AND '.join(clauses + ['ticket_id > ?'])
+            rows = self._connection().execute(
+                'SELECT ticket_id, created_at, session_id, type, severity, file_sha256, file_name, hazard_terms, '
+                f'analysis FROM tickets WHERE {where} ORDER BY ticket_id LIMIT ?', (*params, last, EXPORT_CHUNK)
+            ).fetchall()
+            for row in rows:
+                yield _ticket(row)
+            self._count('exported', len(rows))
+            if len(rows) < EXPORT_CHUNK:
+                return
+            last = rows[-1][0]
+
+    def export_ndjson(self, **filters):
+        for ticket in self.iter_tickets(**filters):
+            yield json.dumps(ticket.to_dict()) + '\n'
+
+    def export_csv(self, **filters):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+        yield buffer.getvalue()
+        for ticket in self.iter_tickets(**filters):
+            buffer.seek(0)
+            buffer.truncate()
+            data = ticket.to_dict()
+            data['hazard_terms'] = ' '.join(ticket.hazard_terms)
+            writer.writerow([data[column] for column in CSV_COLUMNS])
+            yield buffer.getvalue()
+
+    def stats(self):
+        conn = self._connection()
+        with self._lock:
+            stats = dict(self._counters)
+        # Tickets are never deleted, so the largest rowid is the count without a table scan
+        stats['tickets'] = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM tickets').fetchone()[0]
+        stats['bytes'] = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return stats
+
+
+def _ticket(row):
+    ticket_id, created_at, session_id, ticket_type, severity, file_sha256, file_name, hazard_terms, analysis = row
+    return Ticket(
+        ticket_id=ticket_id,
+        created_at=created_at,
+        session_id=session_id,
+        type=ticket_type,
+        severity=severity,
+        file_sha256=file_sha256,
+        file_name=file_name,
+        hazard_terms=hazard_terms.split(',') if hazard_terms else [],
+        analysis=analysis
+    )
@@ -0,0 +1,238 @@
+import base64
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import List, Optional
+
+from PIL import Image, ImageOps, ImageStat
+
+import text_classifier
+import tracing
+
+# Grey-level statistics are taken on a copy of the image reduced to this edge
+STATS_EDGE = 1024
+
+# What the tile prompt asks the model to answer for a tile without findings. It has no
+# hazard keywords, so clean tiles neither show up as findings nor trigger the ticket button.
+NOTHING_FOUND = 'Nothing to report.'
+
+
+@dataclass(slots=True)
+class Tile:
+    row: int
+    col: int
+    box: tuple
+    status: str = 'pending'  # 'analysed', 'uniform' or 'failed'
+    stddev: float = 0.0
+    text: Optional[str] = None
+    hazard_terms: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def label(self):
+        return f"R{self.row + 1}C{self.col + 1}"
+
+    @property
+    def clean(self):
+        return (self.text or '').lower().startswith(NOTHING_FOUND.lower().rstrip('.'))
+
+    @property
+    def coordinates(self):
+        left, top, right, bottom = self.box
+        return f"x {left}-{right}, y {top}-{bottom}"
+
+
+def _starts(length, tile, overlap):
+    """Tile offsets along one axis; the last tile is aligned to the edge instead of overhanging it"""
+    if length <= tile:
+        return [0]
+    step = tile - overlap
+    starts = list(range(0, length - tile, step))
+    starts.append(length - tile)
+    return starts
+
+
+def plan_tiles(width, height, tile_size, overlap):
+    return [
+        Tile(row, col, (left, top, min(left + tile_size, width), min(top + tile_size, height)))
+        for row, top in enumerate(_starts(height, tile_size, overlap))
+        for col, left in enumerate(_starts(width, tile_size, overlap))
+    ]
+
+
+class TiledAnalyzer:
+    """Analyzes a high-resolution image as overlapping full-resolution tiles
+
+    Tiles whose grey levels barely vary (sky, blank walls, out of focus
+    background) are skipped without a model call. The rest are cropped,
+    JPEG-encoded and analyzed on a pool of worker threads; the model
+    client's in-flight limit still applies on top. Per-tile findings are
+    merged into one report that locates each hazard by pixel coordinates,
+    joining neighbouring tiles that report the same hazard into one region.
+
+    analyze_tile(part, tile, grid) passed to analyze() returns the model's
+    text for one tile.
+    """
+
+    def __init__(self, tile_size=1024, overlap=128, max_tiles=48, uniform_stddev=6.0,
+                 workers=4, quality=90):
+        if overlap >= tile_size:
+            raise ValueError('overlap must be smaller than tile_size')
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.max_tiles = max_tiles
+        self.uniform_stddev = uniform_stddev
+        self.workers = workers
+        self.quality = quality
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._counters = {'images': 0, 'tiles': 0, 'analysed': 0, 'uniform': 0, 'failed': 0}
+
+    def _pool(self):
+        # Created lazily so each forked worker gets its own threads
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tile')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def wants(self, size, min_edge):
+        """Whether an image of size (width, height) is worth tiling"""
+        return max(size) > max(min_edge, self.tile_size)
+
+    def _grid(self, width, height):
+        """Tiles for the image, with the tile size grown until there are at most max_tiles"""
+        tile_size = self.tile_size
+        while True:
+            tiles = plan_tiles(width, height, tile_size, self.overlap)
+            if len(tiles) <= self.max_tiles:
+                return tiles, tile_size
+            tile_size = int(tile_size * 1.25)
+
+    def analyze(self, data, analyze_tile):
+        """Merged report (text) for an image given as bytes
+
+        Raises the first tile's error when every analysed tile failed.
+        """
+        with Image.open(BytesIO(data)) as original:
+            image = ImageOps.exif_transpose(original) or original
+            image.load()
+        width, height = image.size
+        tiles, tile_size = self._grid(width, height)
+        grid = {
+            'width': width, 'height': height, 'tile_size': tile_size, 'overlap': self.overlap,
+            'rows': tiles[-1].row + 1, 'cols': tiles[-1].col + 1,
+        }
+
+        # Uniformity on a reduced grey copy: a few ms however large the original is
+        scale = min(1.0, STATS_EDGE / max(width, height))
+        grey = image.convert('L').resize((max(1, round(width * scale)), max(1, round(height * scale))))
+        for tile in tiles:
+            left, top, right, bottom = (round(v * scale) for v in tile.box)
+            region = grey.crop((left, top, max(right, left + 1), max(bottom, top + 1)))
+            tile.stddev = ImageStat.Stat(region).stddev[0]
+            if tile.stddev < self.uniform_stddev:
+                tile.status = 'uniform'
+
+        pending = [tile for tile in tiles if tile.status == 'pending']
+        pool = self._pool()
+        futures = [tracing.submit(pool, self._analyze, analyze_tile, image, tile, grid) for tile in pending]
+        errors = [error for error in (future.result() for future in futures) if error is not None]
+
+        with self._lock:
+            self._counters['images'] += 1
+            self._counters['tiles'] += len(tiles)
+            for tile in tiles:
+                self._counters[tile.status] += 1
+        if pending and len(errors) == len(pending):
+            raise errors[0]
+        return merge_report(tiles, grid)
+
+    def _analyze(self, analyze_tile, image, tile, grid):
+        """Analyze one tile in place; returns the error if it failed"""
+        try:
+            with tracing.span('tile', tile=tile.label):
+                crop = image.crop(tile.box)
+                if crop.mode != 'RGB':
+                    crop = crop.convert('RGB')
+                out = BytesIO()
+                crop.save(out, format='JPEG', quality=self.quality)
+                part = {'inline_data': {'mime_type': 'image/jpeg', 'data': base64.b64encode(out.getvalue()).decode('utf-8')}}
+                tile.text = (analyze_tile(part, tile, grid) or '').strip()
+            tile.hazard_terms = text_classifier.hazard_terms(tile.text)
+            tile.status = 'analysed'
+        except Exception as e:
+            print(f"Tile {tile.label} failed: {e}")
+            tile.status = 'failed'
+            tile.error = str(e)
+            return e
+        return None
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+def _regions(tiles):
+    """Group tiles into regions of grid neighbours (including diagonals); returns bounding boxes with their tiles"""
+    remaining = {(tile.row, tile.col): tile for tile in tiles}
+    regions = []
+    while remaining:
+        _, seed = remaining.popitem()
+        group, stack = [seed], [seed]
+        while stack:
+            current = stack.pop()
+            for dr in (-1, 0, 1):
+                for dc in (-1, 0, 1):
+                    neighbour = remaining.pop((current.row + dr, current.col + dc), None)
+                    if neighbour is not None:
+                        group.append(neighbour)
+                        stack.append(neighbour)
+        group.sort(key=lambda t: (t.row, t.col))
+        box = (min(t.box[0] for t in group), min(t.box[1] for t in group),
+               max(t.box[2] for t in group), max(t.box[3] for t in group))
+        regions.append((box, group))
+    regions.sort(key=lambda region: (region[0][1], region[0][0]))
+    return regions
+
+
+def merge_report(tiles, grid):
+    """One structured report from the per-tile findings"""
+    analysed = [tile for tile in tiles if tile.status == 'analysed']
+    findings = [tile for tile in analysed if not tile.clean]
+    uniform = [tile for tile in tiles if tile.status == 'uniform']
+    failed = [tile for tile in tiles if tile.status == 'failed']
+
+    lines = [
+        f"**Tiled inspection report** ({grid['width']}x{grid['height']} px, {grid['cols']}x{grid['rows']} tiles "
+        f"of up to {grid['tile_size']} px with {grid['overlap']} px overlap)",
+        f"Analysed {len(analysed)} tiles, skipped {len(uniform)} uniform tiles"
+        + (f", {len(failed)} tiles could not be analysed ({', '.join(t.label for t in failed)})" if failed else '') + '.',
+        '',
+        '**Findings by location**',
+    ]
+    by_term = {}
+    for tile in findings:
+        for term in tile.hazard_terms:
+            by_term.setdefault(term, []).append(tile)
+    if by_term:
+        for term in sorted(by_term):
+            for (left, top, right, bottom), group in _regions(by_term[term]):
+                lines.append(f"- {term}: x {left}-{right}, y {top}-{bottom} "
+                             f"(tiles {', '.join(tile.label for tile in group)})")
+    else:
+        lines.append('- Nothing was found in any tile.')
+
+    if findings:
+        lines += ['', '**Findings by tile**']
+        for tile in findings:
+            lines.append(f"**{tile.label}** ({tile.coordinates}): {tile.text}")
+    clean = [tile for tile in analysed if tile.clean]
+    if clean:
+        lines.append(f"Nothing found: {', '.join(tile.label for tile in clean)}")
+    if uniform:
+        lines.append(f"Uniform, not analysed: {', '.join(tile.label for tile in uniform)}")
+    return '\n'.join(lines)
@@ -0,0 +1,222 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+from flask import request
+
+# Trace of the request being handled on this thread (None outside requests)
+_current = ContextVar('trace', default=None)
+# Innermost open span in this context: the parent of the next one (the root when None)
+_parent = ContextVar('span', default=None)
+
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# OTLP span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+
+
+class Span:
+    __slots__ = ('name', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes')
+
+    def __init__(self, name, parent_id=None, attributes=None):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class Trace:
+    """Spans recorded while handling one request; the first span is the request itself
+
+    Spans may be recorded from several threads at once (see submit()); each
+    names its parent, so there is no shared stack to keep in order.
+    """
+
+    def __init__(self, name, request_id=None, attributes=None):
+        self.trace_id = os.urandom(16).hex()
+        self.request_id = request_id or self.trace_id
+        self.root = Span(name, attributes=attributes)
+        self.spans = [self.root]
+        self._lock = threading.Lock()
+        # Profiler handle while this request is being profiled
+        self.profile = None
+
+    def start(self, name, attributes=None, parent=None):
+        span = Span(name, (parent or self.root).span_id, attributes)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def end(self, span):
+        span.end_ns = time.time_ns()
+
+    def server_timing(self):
+        """Server-Timing header value: finished stages, then the total so far"""
+        entries = []
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans[1:]:
+            if span.end_ns is not None:
+                entries.append(f"{_metric_name(span.name)};dur={span.duration_ms:.1f}")
+        entries.append(f"total;dur={self.root.duration_ms:.1f}")
+        return ', '.join(entries)
+
+    def to_otlp(self, service_name):
+        """The trace as an OTLP/JSON ExportTraceServiceRequest"""
+        spans = []
+        with self._lock:
+            recorded = list(self.spans)
+        for span in recorded:
+            item = {
+                'traceId': self.trace_id,
+                'spanId': span.span_id,
+                'name': span.name,
+                'kind': SPAN_KIND_SERVER if span is self.root else SPAN_KIND_INTERNAL,
+                'startTimeUnixNano': str(span.start_ns),
+                'endTimeUnixNano': str(span.end_ns or span.start_ns),
+                'attributes': [_attribute(k, v) for k, v in span.attributes.items()],
+            }
+            if span.parent_id:
+                item['parentSpanId'] = span.parent_id
+            spans.append(item)
+        return {'resourceSpans': [{
+            'resource': {'attributes': [_attribute('service.name', service_name)]},
+            'scopeSpans': [{'scope': {'name': 'tracing'}, 'spans': spans}],
+        }]}
+
+
+def _metric_name(name):
+    # Server-Timing names are tokens: no spaces, commas or semicolons
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """Record a stage of the current request (no-op outside a traced request)"""
+    trace = _current.get()
+    if trace is None:
+        yield None
+        return
+    parent = _parent.get()
+    s = trace.start(name, attributes, parent)
+    _parent.set(s)
+    try:
+        yield s
+    finally:
+        _parent.set(parent)
+        trace.end(s)
+
+
+def submit(pool, func, *args, **kwargs):
+    """pool.submit() that runs func in a copy of this thread's context
+
+    Spans func records join the current request's trace under the current
+    span; a plain submit() would run it with no trace at all.
+    """
+    return pool.submit(copy_context().run, func, *args, **kwargs)
+
+
+class TraceExporter:
+    """Appends finished traces as OTLP/JSON lines to a local file
+
+    Each trace is written with a single O_APPEND write, so workers can
+    share one file. sample_rate is the fraction of requests exported.
+    """
+
+    def __init__(self, path, service_name='image-assistant', sample_rate=1.0):
+        self.path = path
+        self.service_name = service_name
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        self._counters = {'exported': 0, 'export_errors': 0}
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def export(self, trace):
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        line = (json.dumps(trace.to_otlp(self.service_name), separators=(',', ':')) + '\n').encode('utf-8')
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            print(f"Trace export error: {e}")
+            with self._lock:
+                self._counters['export_errors'] += 1
+            return
+        with self._lock:
+            self._counters['exported'] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, 'path': self.path, 'sample_rate': self.sample_rate}
+
+
+def instrument(app, exporter=None, profiler=None):
+    """Trace every request: X-Request-ID and Server-Timing headers, export
+    and (when armed) profiling once the response body has been sent"""
+
+    @app.before_request
+    def _start_trace():
+        incoming = request.headers.get('X-Request-ID', '')
+        trace = Trace(
+            f"{request.method} {request.url_rule.rule if request.url_rule else 'unmatched'}",
+            incoming if REQUEST_ID_PATTERN.match(incoming) else None,
+            {'http.method': request.method, 'http.target': request.path}
+        )
+        trace.root.attributes['request.id'] = trace.request_id
+        _current.set(trace)
+        if profiler:
+            trace.profile = profiler.start(request.path, trace.request_id)
+
+    @app.after_request
+    def _finish_trace(response):
+        trace = _current.get()
+        if trace is None:
+            return response
+        response.headers['X-Request-ID'] = trace.request_id
+        # Streamed responses only carry the stages finished before the first byte
+        response.headers['Server-Timing'] = trace.server_timing()
+
+        def close():
+            trace.root.end_ns = time.time_ns()
+            trace.root.attributes['http.status_code'] = response.status_code
+            if trace.profile:
+                profiler.finish(trace.profile)
+            if exporter:
+                exporter.export(trace)
+            if _current.get() is trace:
+                _current.set(None)
+
+        response.call_on_close(close)
+        return response
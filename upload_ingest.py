@@ -0,0 +1,166 @@
+import hashlib
+import os
+import tempfile
+
+from flask import Request, request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from upload_store import SNIFF_BYTES, file_type_for, sniff_mime_type
+
+MB = 1024 * 1024
+
+
+def _file_type_for_mime(mime_type):
+    if mime_type and mime_type.startswith('image/'):
+        return 'image'
+    if mime_type and mime_type.startswith('audio/'):
+        return 'audio'
+    if mime_type == 'application/zip':
+        return 'archive'
+    return None
+
+
+def _file_type_for_name(filename):
+    if filename.lower().endswith('.zip'):
+        return 'archive'
+    return file_type_for(filename)
+
+
+class IngestStream:
+    """Write target for one multipart file part
+
+    Each chunk the form parser hands over is hashed and written straight to
+    a temp file in the upload folder, so memory use is bounded by the
+    parser's chunk size. The first bytes are sniffed for the real format
+    and the per-type size limit is enforced as data arrives.
+    """
+
+    def __init__(self, folder, filename, limits):
+        self.filename = filename or ''
+        self.limits = limits
+        self.sha256 = None
+        self.size = 0
+        self.sniffed_mime_type = None
+        self.adopted = False
+        self._digest = hashlib.sha256()
+        self._head = b''
+        self._limit = self._limit_for(_file_type_for_name(self.filename))
+        fd, self.name = tempfile.mkstemp(dir=folder, prefix='.ingest-')
+        self._file = os.fdopen(fd, 'w+b')
+
+    def _limit_for(self, file_type):
+        return self.limits.get(file_type, self.limits.get(None))
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if len(self._head) < SNIFF_BYTES:
+            self._head += chunk[:SNIFF_BYTES - len(self._head)]
+            self.sniffed_mime_type = sniff_mime_type(self._head)
+            if self.sniffed_mime_type:
+                # The content decides which limit applies, not the file name
+                self._limit = self._limit_for(_file_type_for_mime(self.sniffed_mime_type))
+        if self._limit is not None and self.size > self._limit:
+            self.discard()
+            raise RequestEntityTooLarge(
+                f"{self.filename or 'Upload'} exceeds the {self._limit // MB} MB limit for this file type"
+            )
+        self._digest.update(chunk)
+        return self._file.write(chunk)
+
+    def seek(self, *args):
+        result = self._file.seek(*args)
+        if self.sha256 is None:
+            # The parser seeks to 0 once the part is complete
+            self.sha256 = self._digest.hexdigest()
+            self._file.flush()
+        return result
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def tell(self):
+        return self._file.tell()
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def discard(self):
+        """Close and delete the temp file unless it was moved into the store"""
+        self.close()
+        if not self.adopted and os.path.exists(self.name):
+            os.remove(self.name)
+
+
+class IngestRequest(Request):
+    """Flask request whose multipart files stream through IngestStream"""
+
+    upload_folder = 'uploads'
+    size_limits = {None: 25 * MB}
+    # Whole-body limits by path prefix; the first match wins
+    body_limits = []
+
+    @property
+    def max_content_length(self):
+        for prefix, limit in self.body_limits:
+            if self.path.startswith(prefix):
+                return limit
+        return super().max_content_length
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = IngestStream(self.upload_folder, filename, self.size_limits)
+        self.ingest_streams.append(stream)
+        return stream
+
+    @property
+    def ingest_streams(self):
+        streams = self.environ.get('upload_ingest.streams')
+        if streams is None:
+            streams = self.environ['upload_ingest.streams'] = []
+        return streams
+
+    def cleanup_ingest(self):
+        for stream in self.environ.get('upload_ingest.streams', []):
+            stream.discard()
+
+
+def configure(app, upload_folder, image_limit, audio_limit, other_limit, archive_limit=None, body_limits=None):
+    """Install the streaming request class and reject oversized bodies up front"""
+    IngestRequest.upload_folder = upload_folder
+    IngestRequest.size_limits = {
+        'image': image_limit,
+        'audio': audio_limit,
+        'archive': archive_limit or other_limit,
+        None: other_limit
+    }
+    IngestRequest.body_limits = list(body_limits or [])
+    app.request_class = IngestRequest
+    # Bodies announced larger than any per-type limit get a 413 before any read;
+    # body_limits raise that for routes taking several files (multi-file /upload, /batch)
+    app.config['MAX_CONTENT_LENGTH'] = max(image_limit, audio_limit, other_limit) + MB
+
+    @app.teardown_request
+    def _cleanup_ingest(exc=None):
+        if isinstance(request, IngestRequest):
+            request.cleanup_ingest()
+
+
+def save_upload(store, file_storage, filename, session_id):
+    """Move an ingested upload into the store without re-reading it
+
+    Returns (sha256, size, sniffed_mime_type).
+    """
+    stream = file_storage.stream
+    if isinstance(stream, IngestStream) and stream.sha256:
+        stream.close()
+        store.adopt(stream.name, stream.sha256, session_id)
+        stream.adopted = True
+        return stream.sha256, stream.size, stream.sniffed_mime_type
+    # Fallback for streams that did not go through IngestRequest
+    return store.put(stream, filename, session_id)
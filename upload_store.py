@@ -0,0 +1,619 @@
+import base64
+import fcntl
+import glob
+import hashlib
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import tracing
+
+MIME_TYPES = {
+    # Images
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.bmp': 'image/bmp',
+    '.webp': 'image/webp',
+    # Audio
+    '.wav': 'audio/wav',
+    '.mp3': 'audio/mp3',
+    '.aiff': 'audio/aiff',
+    '.aac': 'audio/aac',
+    '.ogg': 'audio/ogg',
+    '.flac': 'audio/flac',
+}
+
+MIME_EXTENSIONS = {mime: ext for ext, mime in reversed(list(MIME_TYPES.items()))}
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.aiff', '.aac', '.ogg', '.flac')
+
+CHUNK_SIZE = 64 * 1024
+
+# Prefixes of in-progress temp files; leftovers from crashed workers are collected
+TEMP_PREFIXES = ('.upload-', '.ingest-', '.variant-')
+
+# Downscaling attempts, and the smallest edge tried, when an image is over its budget
+FIT_ATTEMPTS = 3
+MIN_FIT_EDGE = 256
+
+# Number of leading bytes needed to recognise every format below
+SNIFF_BYTES = 16
+
+
+def file_extension(filename):
+    return os.path.splitext(filename)[1].lower()
+
+
+def mime_type_for(filename):
+    return MIME_TYPES.get(file_extension(filename), 'application/octet-stream')
+
+
+def file_type_for(filename):
+    """'image', 'audio' or None based on the file extension"""
+    ext = file_extension(filename)
+    if ext in IMAGE_EXTENSIONS:
+        return 'image'
+    if ext in AUDIO_EXTENSIONS:
+        return 'audio'
+    return None
+
+
+def sniff_mime_type(head):
+    """MIME type from magic bytes, or None if the format is not recognised"""
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return 'image/gif'
+    if head.startswith(b'BM'):
+        return 'image/bmp'
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head.startswith(b'RIFF') and head[8:12] == b'WAVE':
+        return 'audio/wav'
+    if head.startswith(b'FORM') and head[8:12] in (b'AIFF', b'AIFC'):
+        return 'audio/aiff'
+    if head.startswith(b'fLaC'):
+        return 'audio/flac'
+    if head.startswith(b'OggS'):
+        return 'audio/ogg'
+    if head.startswith(b'ID3') or head[:2] in (b'\xff\xfb', b'\xff\xf3', b'\xff\xf2'):
+        return 'audio/mp3'
+    if head[:2] in (b'\xff\xf1', b'\xff\xf9'):
+        return 'audio/aac'
+    if head.startswith(b'PK\x03\x04'):
+        return 'application/zip'
+    return None
+
+
+class UploadStore:
+    """Content-addressed store for uploaded files
+
+    Files are saved once under their SHA-256 alone (identical uploads from
+    any session share one blob, whatever they were named); the format is
+    sniffed from the bytes, not taken from the name. Sessions hold a reference marker on disk so a
+    blob is only deleted when its last session lets go of it, whichever
+    worker that happens on. The base64 model payload of each blob is kept
+    in a size-bounded LRU cache so follow-up turns need no disk I/O.
+
+    transforms maps a file type ('image', 'audio') to a preprocessor that
+    turns the original into the variant the model receives. Variants are
+    written next to the blobs so every worker reuses them; the original is
+    kept for previews and exports.
+
+    Several files are prepared and encoded on a pool of worker threads
+    (prepare_many, model_parts); Pillow releases the GIL while decoding,
+    resizing and encoding, so a multi-file upload takes about as long as
+    its largest file.
+    """
+
+    def __init__(self, folder, cache_bytes=128 * 1024 * 1024, transforms=None, workers=4):
+        self.folder = folder
+        self.refs_folder = os.path.join(folder, 'refs')
+        self.variants_folder = os.path.join(folder, 'variants')
+        self.cache_bytes = cache_bytes
+        self.transforms = transforms or {}
+        self._cache = OrderedDict()
+        self._cache_size = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            'stored': 0, 'deduplicated': 0, 'deleted': 0, 'cache_hits': 0, 'cache_misses': 0,
+            'transformed': 0, 'transform_errors': 0, 'transform_bytes_in': 0, 'transform_bytes_out': 0,
+            'budget_fitted': 0, 'budget_omitted': 0,
+        }
+        self._by_type = {}
+        self.workers = workers
+        self._executor = None
+        self._executor_pid = None
+        os.makedirs(self.refs_folder, exist_ok=True)
+        os.makedirs(self.variants_folder, exist_ok=True)
+        self._rename_legacy_blobs()
+
+    def _pool(self):
+        # Created lazily so each forked worker gets its own threads
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='prepare')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def blob_name(self, sha256):
+        return sha256
+
+    def path(self, file_record):
+        return os.path.join(self.folder, self.blob_name(file_record.sha256))
+
+    @contextmanager
+    def _refs_lock(self):
+        # Serializes reference changes with blob creation/deletion across workers
+        with open(os.path.join(self.refs_folder, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _rename_legacy_blobs(self):
+        """Move blobs (and their refs) stored as <sha256>.<ext> to <sha256>"""
+        legacy = [entry.name for entry in os.scandir(self.folder)
+                  if entry.is_file() and not entry.name.startswith('.') and '.' in entry.name]
+        if not legacy:
+            return
+        with self._refs_lock():
+            for name in legacy:
+                sha256 = name.split('.', 1)[0]
+                old_refs = os.path.join(self.refs_folder, name)
+                if os.path.isdir(old_refs):
+                    new_refs = os.path.join(self.refs_folder, sha256)
+                    os.makedirs(new_refs, exist_ok=True)
+                    for ref in os.scandir(old_refs):
+                        # Keeps the ref's mtime, i.e. when its session last used the blob
+                        os.replace(ref.path, os.path.join(new_refs, ref.name))
+                    os.rmdir(old_refs)
+                try:
+                    if os.path.exists(os.path.join(self.folder, sha256)):
+                        os.remove(os.path.join(self.folder, name))
+                    else:
+                        os.replace(os.path.join(self.folder, name), os.path.join(self.folder, sha256))
+                except FileNotFoundError:
+                    # Renamed by another worker starting up
+                    pass
+
+    def put(self, stream, filename, session_id, max_size=None):
+        """Store a file-like object for a session; returns (sha256, size, sniffed_mime_type)
+
+        Raises ValueError, storing nothing, once more than max_size bytes
+        have been read.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        head = b''
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise ValueError(f"{filename} exceeds the {max_size // (1024 * 1024)} MB limit")
+                    if len(head) < SNIFF_BYTES:
+                        head += chunk[:SNIFF_BYTES - len(head)]
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            sha256 = digest.hexdigest()
+            self.adopt(tmp_path, sha256, session_id)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return sha256, size, sniff_mime_type(head)
+
+    def adopt(self, tmp_path, sha256, session_id):
+        """Move an already-hashed temp file into place (unless the blob exists)
+        and reference it from the session"""
+        name = self.blob_name(sha256)
+        target = os.path.join(self.folder, name)
+        with self._refs_lock():
+            self._add_ref(name, session_id)
+            if os.path.exists(target):
+                self._counters['deduplicated'] += 1
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, target)
+                self._counters['stored'] += 1
+        return target
+
+    def _ref_dir(self, file_record):
+        return os.path.join(self.refs_folder, self.blob_name(file_record.sha256))
+
+    def _add_ref(self, name, session_id):
+        ref_dir = os.path.join(self.refs_folder, name)
+        os.makedirs(ref_dir, exist_ok=True)
+        ref_path = os.path.join(ref_dir, self._ref_name(session_id))
+        open(ref_path, 'a').close()
+        # The ref's mtime records when the session last used the blob
+        os.utime(ref_path)
+
+    @staticmethod
+    def _ref_name(session_id):
+        return hashlib.sha1(str(session_id).encode('utf-8')).hexdigest()
+
+    def release(self, file_record, session_id, unless_used_after=None):
+        """Drop a session's reference and delete the blob once unreferenced
+
+        With unless_used_after, a reference touched since then (e.g. by
+        another worker's copy of the session) is kept for collect() to expire.
+        """
+        ref_dir = self._ref_dir(file_record)
+        ref_path = os.path.join(ref_dir, self._ref_name(session_id))
+        with self._refs_lock():
+            try:
+                if unless_used_after is not None and os.path.getmtime(ref_path) > unless_used_after:
+                    return
+                os.remove(ref_path)
+            except FileNotFoundError:
+                pass
+            try:
+                os.rmdir(ref_dir)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # Still referenced by another session
+                return
+            self._delete_blob(self.blob_name(file_record.sha256))
+
+    def _delete_blob(self, name):
+        """Remove a blob and its variants (refs lock held); returns bytes freed"""
+        sha256 = name
+        freed = 0
+        blob_path = os.path.join(self.folder, name)
+        for path in [blob_path] + glob.glob(os.path.join(self.variants_folder, sha256 + '.*')):
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            freed += size
+            if path == blob_path:
+                self._counters['deleted'] += 1
+        self._evict(sha256)
+        return freed
+
+    def touch(self, file_record, session_id):
+        """Mark a session's reference as in use so collect() keeps it"""
+        ref_path = os.path.join(self._ref_dir(file_record), self._ref_name(session_id))
+        try:
+            os.utime(ref_path)
+        except FileNotFoundError:
+            # Expired while the session was still around; restore it if the blob survived
+            with self._refs_lock():
+                if os.path.exists(self.path(file_record)):
+                    self._add_ref(self.blob_name(file_record.sha256), session_id)
+
+    def collect(self, ref_ttl, quota_bytes=0, temp_ttl=3600):
+        """Garbage-collect the store; returns what was reclaimed
+
+        Drops references not touched for ref_ttl seconds (and blobs left
+        without any), blobs that were never referenced, stale temp files,
+        and then evicts least recently used blobs until the store fits
+        quota_bytes. Blobs with a reference touched within ref_ttl (any
+        reference when ref_ttl is 0) are in use and never evicted for the
+        quota. Either limit is off when 0.
+        """
+        now = time.time()
+        report = {'temp_files': 0, 'refs_expired': 0, 'blobs_deleted': 0, 'quota_evicted': 0, 'quota_in_use': 0,
+                  'bytes_reclaimed': 0}
+
+        for folder in (self.folder, self.variants_folder):
+            for entry in os.scandir(folder):
+                if not entry.name.startswith(TEMP_PREFIXES):
+                    continue
+                try:
+                    stat = entry.stat()
+                    if stat.st_mtime < now - temp_ttl:
+                        os.remove(entry.path)
+                        report['bytes_reclaimed'] += stat.st_size
+                        report['temp_files'] += 1
+                except FileNotFoundError:
+                    # Finished (renamed into place) meanwhile
+                    pass
+
+        if ref_ttl > 0:
+            for entry in os.scandir(self.refs_folder):
+                if not entry.is_dir() or not self._has_stale_ref(entry.path, now - ref_ttl):
+                    continue
+                with self._refs_lock():
+                    try:
+                        for ref in os.scandir(entry.path):
+                            if ref.stat().st_mtime < now - ref_ttl:
+                                os.remove(ref.path)
+                                report['refs_expired'] += 1
+                        os.rmdir(entry.path)
+                    except OSError:
+                        # Released meanwhile, or still referenced
+                        continue
+                    report['bytes_reclaimed'] += self._delete_blob(entry.name)
+                    report['blobs_deleted'] += 1
+
+            # Blobs whose refs were lost (e.g. a worker died between adopt and save)
+            for entry in os.scandir(self.folder):
+                if not entry.is_file() or entry.name.startswith('.') or not self._unreferenced(entry.name, now - ref_ttl):
+                    continue
+                with self._refs_lock():
+                    # Checked again now that no worker can add a ref
+                    if self._unreferenced(entry.name, now - ref_ttl):
+                        report['bytes_reclaimed'] += self._delete_blob(entry.name)
+                        report['blobs_deleted'] += 1
+
+        if quota_bytes > 0:
+            usage = self._disk_bytes()
+            if usage > quota_bytes:
+                in_use_after = now - ref_ttl if ref_ttl > 0 else float('-inf')
+                for last_used, name in sorted(self._blob_usage()):
+                    if usage <= quota_bytes:
+                        break
+                    ref_dir = os.path.join(self.refs_folder, name)
+                    with self._refs_lock():
+                        # Checked under the lock: a session may have touched it since the scan
+                        newest_ref = self._newest_ref(ref_dir)
+                        if newest_ref is not None and newest_ref >= in_use_after:
+                            report['quota_in_use'] += 1
+                            continue
+                        shutil.rmtree(ref_dir, ignore_errors=True)
+                        freed = self._delete_blob(name)
+                    usage -= freed
+                    report['bytes_reclaimed'] += freed
+                    report['quota_evicted'] += 1
+
+        report['disk_bytes'] = self._disk_bytes()
+        return report
+
+    @staticmethod
+    def _has_stale_ref(ref_dir, cutoff):
+        try:
+            return any(ref.stat().st_mtime < cutoff for ref in os.scandir(ref_dir))
+        except FileNotFoundError:
+            return False
+
+    def _unreferenced(self, name, cutoff):
+        """Whether a blob older than cutoff has no ref dir"""
+        try:
+            return os.path.getmtime(os.path.join(self.folder, name)) < cutoff and \
+                not os.path.isdir(os.path.join(self.refs_folder, name))
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def _newest_ref(ref_dir):
+        """When a session last touched the blob, or None without refs"""
+        newest = None
+        try:
+            for ref in os.scandir(ref_dir):
+                try:
+                    mtime = ref.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                newest = mtime if newest is None else max(newest, mtime)
+        except FileNotFoundError:
+            pass
+        return newest
+
+    def _blob_usage(self):
+        """(last used, blob name) for every blob; last use is the newest ref touch"""
+        usage = []
+        for entry in os.scandir(self.folder):
+            if not entry.is_file() or entry.name.startswith('.'):
+                continue
+            newest_ref = self._newest_ref(os.path.join(self.refs_folder, entry.name))
+            usage.append((max(entry.stat().st_mtime, newest_ref or 0), entry.name))
+        return usage
+
+    def find(self, sha256):
+        """Path of the original blob with this content hash, or None"""
+        candidate = os.path.join(self.folder, self.blob_name(sha256))
+        return candidate if os.path.isfile(candidate) else None
+
+    @staticmethod
+    def sniffed_mime_type(path):
+        """MIME type of a stored blob from its magic bytes"""
+        with open(path, 'rb') as f:
+            return sniff_mime_type(f.read(SNIFF_BYTES)) or 'application/octet-stream'
+
+    def read(self, file_record):
+        with open(self.path(file_record), 'rb') as f:
+            return f.read()
+
+    def prepare(self, file_record, transform=None):
+        """Model variant of a file; returns (data, mime_type, info)
+
+        info reports original vs. model bytes so preprocessing can be tuned.
+        transform overrides the configured one for the file type.
+        """
+        file_type = file_type_for(file_record.filename)
+        transform = transform or self.transforms.get(file_type)
+        supports = getattr(transform, 'supports', None)
+        if supports is not None and not supports(file_record.mime_type):
+            transform = None
+        if transform is None:
+            data = self.read(file_record)
+            return data, file_record.mime_type, {'original_bytes': len(data), 'model_bytes': len(data), 'bytes_saved': 0}
+
+        prefix = os.path.join(self.variants_folder, f"{file_record.sha256}.{transform.variant_key}")
+        existing = glob.glob(prefix + '.*')
+        if existing:
+            with open(existing[0], 'rb') as f:
+                data = f.read()
+            mime_type = MIME_TYPES.get(file_extension(existing[0]), file_record.mime_type)
+            return data, mime_type, {
+                'original_bytes': file_record.size,
+                'model_bytes': len(data),
+                'bytes_saved': file_record.size - len(data),
+            }
+
+        original = self.read(file_record)
+        try:
+            data, mime_type, info = transform(original, file_record.mime_type)
+        except Exception as e:
+            print(f"Preprocessing error for {file_record.filename}: {e}")
+            with self._lock:
+                self._counters['transform_errors'] += 1
+            return original, file_record.mime_type, {
+                'original_bytes': len(original), 'model_bytes': len(original), 'bytes_saved': 0
+            }
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.variants_folder, prefix='.variant-')
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, prefix + MIME_EXTENSIONS.get(mime_type, '.bin'))
+
+        with self._lock:
+            self._counters['transformed'] += 1
+            self._counters['transform_bytes_in'] += info['original_bytes']
+            self._counters['transform_bytes_out'] += info['model_bytes']
+            by_type = self._by_type.setdefault(file_type, {'files': 0, 'bytes_in': 0, 'bytes_out': 0, 'bytes_saved': 0})
+            by_type['files'] += 1
+            by_type['bytes_in'] += info['original_bytes']
+            by_type['bytes_out'] += info['model_bytes']
+            by_type['bytes_saved'] += info['bytes_saved']
+        print(f"Preprocessed {file_record.filename}: {info['original_bytes']} -> {info['model_bytes']} bytes "
+              f"({info['bytes_saved']} saved)")
+        return data, mime_type, info
+
+    def model_part(self, file_record, budget=0):
+        """inline_data part for the model, prepared and encoded once, then cached
+
+        With a budget (encoded bytes), images over it are downscaled until
+        they fit; None is returned for files that cannot be made to fit.
+        """
+        if file_type_for(file_record.filename) is None:
+            return None
+        part = self._cached(file_record.sha256)
+        if part is None:
+            try:
+                with tracing.span('file_read', bytes=file_record.size):
+                    data, mime_type, _ = self.prepare(file_record)
+            except FileNotFoundError:
+                return None
+            part = self._encode(file_record.sha256, data, mime_type)
+        if budget and len(part["inline_data"]["data"]) > budget:
+            part = self._fit(file_record, len(part["inline_data"]["data"]), budget)
+            with self._lock:
+                self._counters['budget_fitted' if part else 'budget_omitted'] += 1
+        return part
+
+    def model_parts(self, file_records, budget=0):
+        """model_part for each file (None where a file has no part), encoded concurrently"""
+        if len(file_records) <= 1:
+            return [self.model_part(record, budget) for record in file_records]
+        pool = self._pool()
+        futures = [tracing.submit(pool, self.model_part, record, budget) for record in file_records]
+        return [future.result() for future in futures]
+
+    def prepare_many(self, file_records):
+        """Prepare and encode newly uploaded files concurrently; returns each file's prepare info"""
+        if len(file_records) <= 1:
+            return [self._warm(record) for record in file_records]
+        pool = self._pool()
+        futures = [tracing.submit(pool, self._warm, record) for record in file_records]
+        return [future.result() for future in futures]
+
+    def _warm(self, file_record):
+        data, mime_type, info = self.prepare(file_record)
+        if file_type_for(file_record.filename) is not None and self._cached(file_record.sha256) is None:
+            self._encode(file_record.sha256, data, mime_type)
+        return info
+
+    def _fit(self, file_record, size, budget):
+        """Part for a smaller variant of an image that fits the budget, or None"""
+        transform = self.transforms.get(file_type_for(file_record.filename))
+        if getattr(transform, 'scaled', None) is None:
+            return None
+        edge = transform.max_edge
+        for _ in range(FIT_ATTEMPTS):
+            # Encoded size grows roughly with the pixel count
+            edge = int(edge * math.sqrt(budget / size) * 0.9)
+            if edge < MIN_FIT_EDGE:
+                return None
+            fitted = transform.scaled(edge)
+            key = f"{file_record.sha256}.{fitted.variant_key}"
+            part = self._cached(key)
+            if part is None:
+                try:
+                    data, mime_type, _ = self.prepare(file_record, fitted)
+                except FileNotFoundError:
+                    return None
+                part = self._encode(key, data, mime_type)
+            size = len(part["inline_data"]["data"])
+            if size <= budget:
+                return part
+        return None
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                self._counters['cache_hits'] += 1
+                return entry[0]
+            self._counters['cache_misses'] += 1
+            return None
+
+    def _encode(self, key, data, mime_type):
+        with tracing.span('base64_encode', bytes=len(data)):
+            part = {
+                "inline_data": {
+                    "mime_type": mime_type,
+                    "data": base64.b64encode(data).decode('utf-8')
+                }
+            }
+        self._remember(key, part, len(part["inline_data"]["data"]))
+        return part
+
+    def _remember(self, key, part, size):
+        if size > self.cache_bytes:
+            return
+        with self._lock:
+            if key in self._cache:
+                return
+            self._cache[key] = (part, size)
+            self._cache_size += size
+            while self._cache_size > self.cache_bytes:
+                _, (_, old_size) = self._cache.popitem(last=False)
+                self._cache_size -= old_size
+
+    def _evict(self, sha256):
+        # The blob's own part and any downscaled (budget-fitted) parts
+        with self._lock:
+            for key in [k for k in self._cache if k == sha256 or k.startswith(sha256 + '.')]:
+                self._cache_size -= self._cache.pop(key)[1]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update({
+                'cache_entries': len(self._cache),
+                'cache_bytes': self._cache_size,
+                'cache_budget': self.cache_bytes,
+                'disk_bytes': self._disk_bytes(),
+                'transform_by_type': {t: dict(c) for t, c in self._by_type.items()},
+            })
+            return stats
+
+    def _disk_bytes(self):
+        total = 0
+        for folder in (self.folder, self.variants_folder):
+            for entry in os.scandir(folder):
+                if entry.is_file():
+                    total += entry.stat().st_size
+        return total